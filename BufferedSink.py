@@ -0,0 +1,103 @@
+import abc
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedSink(object, metaclass=abc.ABCMeta):
+    """
+    Base for sinks which process items in a background thread.
+
+    Items are handed to :meth:`_write` in the writer thread and committed
+    with :meth:`_flush` after *flush_count* items or *flush_interval*
+    seconds, whichever comes first, and when the sink is closed (which
+    happens at interpreter shutdown at the latest). :meth:`_close` runs in
+    the writer thread after the final flush.
+
+    *flush_lines*, the name of *flush_count* when this lived in
+    :mod:`foomodules.Log`, is still accepted.
+    """
+
+    _SENTINEL_FLUSH = object()
+    _SENTINEL_CLOSE = object()
+
+    def __init__(self, name, flush_count=64, flush_interval=5.0,
+                 flush_lines=None):
+        super().__init__()
+        if flush_lines is not None:
+            flush_count = flush_lines
+        self.flush_count = int(flush_count)
+        self.flush_interval = float(flush_interval)
+
+        self._queue = queue.Queue()
+        self._closed = False
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="{}({})".format(type(self).__name__, name))
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _submit(self, item):
+        if self._closed:
+            raise ValueError("write to closed {}".format(type(self).__name__))
+        self._queue.put(item)
+
+    def flush(self):
+        self._queue.put(self._SENTINEL_FLUSH)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._SENTINEL_CLOSE)
+        self._thread.join()
+
+    @abc.abstractmethod
+    def _write(self, item):
+        pass
+
+    @abc.abstractmethod
+    def _flush(self):
+        pass
+
+    @abc.abstractmethod
+    def _close(self):
+        pass
+
+    def _run(self):
+        pending = 0
+        deadline = None
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = self._SENTINEL_FLUSH
+
+            try:
+                if item is self._SENTINEL_CLOSE:
+                    self._flush()
+                    self._close()
+                    return
+                elif item is not self._SENTINEL_FLUSH:
+                    self._write(item)
+                    pending += 1
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    if pending < self.flush_count:
+                        continue
+
+                if pending:
+                    self._flush()
+            except Exception as err:
+                logger.exception(err)
+            pending = 0
+            deadline = None
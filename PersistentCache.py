@@ -0,0 +1,96 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentCache(object):
+    """
+    Key/value store in an SQLite database at *path*, so that cached data
+    survives restarts. Entries live in namespaces and expire individually
+    after the TTL they were stored with.
+
+    Keys and values must be JSON serialisable; tuples come back as lists.
+    Expired entries are never returned and are purged when the cache is
+    opened.
+
+    All operations are synchronous, but they only touch a small local
+    database. One instance may be shared by several users, as long as they
+    use distinct namespaces. :class:`aiofoomodules.gitlab_lookup.GitLabLookup`
+    uses it to keep its caches across restarts.
+    """
+
+    def __init__(self, path, clock=time.time):
+        super().__init__()
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))")
+        self.expire()
+
+    @staticmethod
+    def _encode_key(key):
+        return json.dumps(key, sort_keys=True)
+
+    def get(self, namespace, key):
+        """
+        Return ``(value, age)`` of the entry *key* in *namespace*, *age*
+        being the number of seconds since it was stored. Raise
+        :class:`KeyError` if there is no such entry or it has expired.
+        """
+        now = self._clock()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, stored_at FROM cache"
+                " WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, self._encode_key(key), now)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value, stored_at = row
+        return json.loads(value), max(0.0, now - stored_at)
+
+    def put(self, namespace, key, value, ttl):
+        now = self._clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache"
+                " (namespace, key, value, stored_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (namespace, self._encode_key(key), json.dumps(value),
+                 now, now + ttl))
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, self._encode_key(key)))
+
+    def expire(self):
+        """
+        Delete all expired entries.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM cache WHERE expires_at <= ?",
+                (self._clock(),))
+        if cursor.rowcount:
+            logger.debug("purged %d expired entries from %s",
+                         cursor.rowcount, self.path)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,85 @@
+import collections
+import time
+
+
+class TokenBucketLimiter(object):
+    """
+    Per-key token bucket rate limiter.
+
+    Each key owns a bucket holding up to *burst* tokens, refilled with *rate*
+    tokens per second. Buckets are refilled lazily from the timestamp of the
+    last access, so no periodic timer is needed.
+
+    At most *max_keys* buckets are kept; the least recently used one is
+    dropped when more keys show up. Buckets which have been idle long enough
+    to be full again are dropped as well, as they are indistinguishable from
+    a fresh bucket.
+
+    Keys may be any hashable; :class:`foomodules.Timers.RateLimitService`
+    and :class:`aiofoomodules.handlers.CommandDispatcher` use the sender JID
+    together with the message type.
+    """
+
+    def __init__(self, rate, burst, max_keys=1024, clock=time.monotonic):
+        super().__init__()
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = int(max_keys)
+        self._clock = clock
+        # key -> (tokens, timestamp), least recently used first
+        self._buckets = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _expire(self, now):
+        refill_time = self.burst / self.rate
+        while self._buckets:
+            key, (_, timestamp) = next(iter(self._buckets.items()))
+            if now - timestamp < refill_time:
+                break
+            del self._buckets[key]
+
+    def tokens(self, key):
+        """
+        Return the number of tokens currently available for *key*.
+        """
+        now = self._clock()
+        try:
+            tokens, timestamp = self._buckets[key]
+        except KeyError:
+            return self.burst
+        return min(self.burst, tokens + (now - timestamp) * self.rate)
+
+    def consume(self, key, cost=1):
+        """
+        Take *cost* tokens from the bucket of *key*. Return :data:`True` if
+        enough tokens were available, :data:`False` otherwise (in which case
+        no tokens are taken).
+        """
+        now = self._clock()
+        self._expire(now)
+
+        try:
+            tokens, timestamp = self._buckets.pop(key)
+        except KeyError:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, tokens + (now - timestamp) * self.rate)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return allowed
+
+    def clear(self):
+        self._buckets.clear()
@@ -2,21 +2,42 @@ from __future__ import unicode_literals
 import socket
 import struct
 
+# protocol version 1: one request at a time, answered in order
 CALC_HEADER = struct.Struct(b"!LL")
 RESULT_HEADER = struct.Struct(b"!?L")
 
-def force_recv(sock, length):
-    buf = sock.recv(length)
-    while len(buf) < length:
-        buf += sock.recv(length - len(buf))
+# protocol version 2: requests carry an id which is echoed in the result, so
+# that several requests can be in flight on one socket
+CALC_HEADER_V2 = struct.Struct(b"!LLL")
+RESULT_HEADER_V2 = struct.Struct(b"!L?L")
+
+# sent once by a worker after it has finished importing sympy
+READY_MARKER = b"R"
+
+def recv_exactly(sock, length):
+    """
+    Receive exactly *length* bytes into one :class:`bytearray` of that size,
+    allocated up front and filled with ``recv_into``, instead of
+    concatenating partial reads.
+    """
+    buf = bytearray(length)
+    view = memoryview(buf)
+    pos = 0
+    while pos < length:
+        nread = sock.recv_into(view[pos:], length - pos)
+        if not nread:
+            raise socket.error("connection closed by peer")
+        pos += nread
     return buf
 
+def force_recv(sock, length):
+    return bytes(recv_exactly(sock, length))
+
 def force_send(sock, data):
-    if sock.send(data) < len(data):
-        raise ValueError("Failed to send all data")
+    sock.sendall(data)
 
 def recv_calc(sock):
-    header = force_recv(sock, CALC_HEADER.size)
+    header = recv_exactly(sock, CALC_HEADER.size)
     unitlen, exprlen = CALC_HEADER.unpack(header)
     unit = force_recv(sock, unitlen)
     expr = force_recv(sock, exprlen)
@@ -24,24 +45,48 @@ def recv_calc(sock):
     return unit, expr
 
 def recv_result(sock):
-    header = force_recv(sock, RESULT_HEADER.size)
+    header = recv_exactly(sock, RESULT_HEADER.size)
     state, textlen = RESULT_HEADER.unpack(header)
     text = force_recv(sock, textlen)
     return state, text
 
 def send_result(sock, result):
     header = RESULT_HEADER.pack(True, len(result))
-    force_send(sock, header)
-    force_send(sock, result)
+    force_send(sock, header + result)
 
 def send_error(sock, error_message):
     header = RESULT_HEADER.pack(False, len(error_message))
-    force_send(sock, header)
-    force_send(sock, error_message)
+    force_send(sock, header + error_message)
+
+def send_ready(sock):
+    force_send(sock, READY_MARKER)
+
+def recv_ready(sock):
+    if force_recv(sock, len(READY_MARKER)) != READY_MARKER:
+        raise ValueError("unexpected data from worker")
 
 def send_calc(sock, unit, expr):
     header = CALC_HEADER.pack(len(unit), len(expr))
-    force_send(sock, header)
-    force_send(sock, unit)
-    force_send(sock, expr)
+    force_send(sock, b"".join([header, unit, expr]))
+
+def send_calc_v2(sock, request_id, unit, expr):
+    header = CALC_HEADER_V2.pack(request_id, len(unit), len(expr))
+    force_send(sock, b"".join([header, unit, expr]))
+
+def recv_calc_v2(sock):
+    header = recv_exactly(sock, CALC_HEADER_V2.size)
+    request_id, unitlen, exprlen = CALC_HEADER_V2.unpack(header)
+    payload = recv_exactly(sock, unitlen + exprlen)
+    unit = bytes(payload[:unitlen])
+    expr = bytes(payload[unitlen:])
+    return request_id, unit, expr
 
+def send_result_v2(sock, request_id, state, text):
+    header = RESULT_HEADER_V2.pack(request_id, state, len(text))
+    force_send(sock, header + text)
+
+def recv_result_v2(sock):
+    header = recv_exactly(sock, RESULT_HEADER_V2.size)
+    request_id, state, textlen = RESULT_HEADER_V2.unpack(header)
+    text = force_recv(sock, textlen)
+    return request_id, state, text
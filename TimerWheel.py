@@ -0,0 +1,330 @@
+import logging
+import math
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SKIP = "skip"
+CATCH_UP = "catch_up"
+
+
+class JobStats(object):
+    """
+    Runtime statistics of a :class:`Job`. Times are in seconds; *lateness*
+    is how long after its due time the job started.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = None
+        self.max_lateness = 0.0
+
+    @property
+    def mean_time(self):
+        if not self.runs:
+            return None
+        return self.total_time / self.runs
+
+    def record(self, runtime, lateness, failed):
+        self.runs += 1
+        if failed:
+            self.failures += 1
+        self.total_time += runtime
+        self.max_time = max(self.max_time, runtime)
+        self.last_time = runtime
+        self.max_lateness = max(self.max_lateness, lateness)
+
+    def __repr__(self):
+        return ("<JobStats runs={} failures={} skipped={} mean={} max={:.4f} "
+                "max_lateness={:.4f}>").format(
+                    self.runs, self.failures, self.skipped,
+                    None if self.mean_time is None
+                    else "{:.4f}".format(self.mean_time),
+                    self.max_time, self.max_lateness)
+
+
+class Job(object):
+    """
+    A timer registered with a :class:`TimerWheel`, see
+    :meth:`TimerWheel.add`.
+    """
+
+    def __init__(self, name, callback, args, kwargs, interval, jitter,
+                 policy, max_catch_up):
+        super().__init__()
+        self.name = name
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.interval = interval
+        self.jitter = jitter
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.stats = JobStats()
+        self.cancelled = False
+        # the nominal due time, without jitter; intervals are added to this
+        # so that neither jitter nor runtime accumulate as drift
+        self.base_due = None
+        self.due = None
+
+    def _set_base_due(self, base_due):
+        self.base_due = base_due
+        self.due = base_due
+        if self.jitter:
+            self.due += random.uniform(0, self.jitter)
+
+    def __repr__(self):
+        return "<Job {!r} interval={} due={}>".format(
+            self.name, self.interval, self.due)
+
+
+class TimerWheel(object):
+    """
+    Hierarchical timing wheel running periodic and one-shot jobs from a
+    single thread.
+
+    Time advances in ticks of *resolution* seconds. The wheel has *levels*
+    levels of *slots* slots each; level ``n`` slots span ``slots**n`` ticks,
+    and their jobs are moved down a level when the lower wheel wraps.
+    Adding, removing and expiring a job is O(1), independent of the number
+    of jobs, and the thread only wakes up once per tick.
+
+    Jobs run one after another in the wheel thread, so a slow job delays
+    the others; :meth:`stats` shows which one.
+    """
+
+    def __init__(self, resolution=0.25, slots=64, levels=4,
+                 clock=time.monotonic):
+        super().__init__()
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._clock = clock
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._jobs = {}
+        self._lock = threading.RLock()
+        self._origin = clock()
+        self._tick = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _tick_of(self, t):
+        return math.ceil((t - self._origin) / self.resolution)
+
+    def _place(self, job, earliest=None):
+        if earliest is None:
+            earliest = self._tick + 1
+        tick = max(self._tick_of(job.due), earliest)
+        delta = tick - self._tick
+        for level in range(self.levels):
+            if delta < (1 << (self._bits * (level + 1))):
+                break
+        else:
+            # beyond the top level; park it in the farthest slot, it will be
+            # placed again when that slot is cascaded
+            level = self.levels - 1
+            tick = self._tick + (1 << (self._bits * self.levels)) - 1
+        slot = (tick >> (self._bits * level)) & (self.slots - 1)
+        self._wheels[level][slot].append(job)
+
+    def add(self, name, interval, callback, args=(), kwargs=None,
+            first=None, jitter=0, policy=SKIP, max_catch_up=10):
+        """
+        Run *callback* every *interval* seconds under *name*, replacing any
+        job of that name. The first run is after *first* seconds (defaults
+        to *interval*); each run is delayed by up to *jitter* seconds, at
+        random.
+
+        Runs are scheduled relative to the nominal start, so they do not
+        drift. If the wheel falls behind by more than one interval, the
+        *policy* decides: :data:`SKIP` drops the missed runs (counted in
+        :attr:`JobStats.skipped`), :data:`CATCH_UP` runs them back to back,
+        up to *max_catch_up* at a time.
+
+        With *interval* :data:`None`, the job runs only once.
+        """
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError("unknown missed-tick policy: {!r}".format(policy))
+        if interval is None and first is None:
+            raise ValueError("one-shot jobs need a delay")
+        job = Job(name, callback, tuple(args), dict(kwargs or {}),
+                  interval, jitter, policy, max_catch_up)
+        with self._lock:
+            self.remove(name)
+            job._set_base_due(
+                self._clock() + (first if first is not None else interval))
+            self._jobs[name] = job
+            self._place(job)
+        self._ensure_running()
+        return job
+
+    def add_once(self, name, delay, callback, args=(), kwargs=None):
+        return self.add(name, None, callback, args=args, kwargs=kwargs,
+                        first=delay)
+
+    def remove(self, name):
+        """
+        Remove the job *name*, if it exists. Its slot entry is dropped
+        lazily.
+        """
+        with self._lock:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                job.cancelled = True
+
+    def __contains__(self, name):
+        return name in self._jobs
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def stats(self):
+        """
+        Return ``{name: JobStats}`` for all current jobs.
+        """
+        with self._lock:
+            return {name: job.stats for name, job in self._jobs.items()}
+
+    def _cascade(self, level):
+        slot = (self._tick >> (self._bits * level)) & (self.slots - 1)
+        jobs = self._wheels[level][slot]
+        self._wheels[level][slot] = []
+        for job in jobs:
+            if not job.cancelled:
+                # the current tick's slot is processed right after
+                self._place(job, earliest=self._tick)
+
+    def _advance(self):
+        """
+        Advance the wheel by one tick and return the jobs due.
+        """
+        with self._lock:
+            self._tick += 1
+            for level in range(1, self.levels):
+                if (self._tick & ((1 << (self._bits * level)) - 1)) != 0:
+                    break
+                self._cascade(level)
+            slot = self._tick & (self.slots - 1)
+            jobs = self._wheels[0][slot]
+            self._wheels[0][slot] = []
+            return [job for job in jobs if not job.cancelled]
+
+    def _run_job(self, job, now):
+        lateness = max(0.0, now - job.due)
+        start = self._clock()
+        failed = False
+        try:
+            job.callback(*job.args, **job.kwargs)
+        except Exception:
+            failed = True
+            logger.exception("timer job %r failed", job.name)
+        runtime = self._clock() - start
+        job.stats.record(runtime, lateness, failed)
+        if job.interval is not None and runtime > job.interval:
+            logger.warning("timer job %r took %.3fs, longer than its "
+                           "interval of %.3fs", job.name, runtime,
+                           job.interval)
+
+    def _reschedule(self, job):
+        """
+        Compute the next due time of *job* after it ran; return the number
+        of runs to do right away (catch up) or :data:`None` if the job is
+        finished.
+        """
+        now = self._clock()
+        with self._lock:
+            if job.cancelled or self._jobs.get(job.name) is not job:
+                return None
+            if job.interval is None:
+                del self._jobs[job.name]
+                return None
+
+            base_due = job.base_due + job.interval
+            immediate = 0
+            if base_due <= now:
+                missed = int((now - base_due) // job.interval) + 1
+                if job.policy == CATCH_UP:
+                    immediate = min(missed, job.max_catch_up)
+                    job.stats.skipped += missed - immediate
+                else:
+                    job.stats.skipped += missed
+                base_due += missed * job.interval
+            job._set_base_due(base_due)
+            self._place(job)
+            return immediate
+
+    def run_pending(self):
+        """
+        Process all ticks up to now. Return the time to wait until the next
+        tick.
+        """
+        while True:
+            now = self._clock()
+            next_tick_at = self._origin + (self._tick + 1) * self.resolution
+            if next_tick_at > now:
+                return next_tick_at - now
+            for job in self._advance():
+                self._run_job(job, now)
+                immediate = self._reschedule(job)
+                while immediate:
+                    self._run_job(job, self._clock())
+                    immediate -= 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.run_pending())
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="TimerWheel",
+                daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+
+def format_stats(stats):
+    """
+    Format ``{name: JobStats}`` as returned by :meth:`TimerWheel.stats`, one
+    line per job, slowest first.
+    """
+    return [
+        "{}: {} runs, {} failed, {} skipped, mean {:.3f}s, max {:.3f}s, "
+        "max late {:.3f}s".format(
+            name, stat.runs, stat.failures, stat.skipped,
+            stat.mean_time or 0, stat.max_time, stat.max_lateness)
+        for name, stat in sorted(stats.items(),
+                                 key=lambda item: item[1].max_time,
+                                 reverse=True)
+    ]
+
+
+_default_wheel = None
+_default_wheel_lock = threading.Lock()
+
+def get_default_wheel():
+    global _default_wheel
+    with _default_wheel_lock:
+        if _default_wheel is None:
+            _default_wheel = TimerWheel()
+        return _default_wheel
@@ -157,4 +157,6 @@ class MUC:
     async def teardown(self):
         self._worker.cancel()
         await self._room.leave()
+        for bind in self._bind:
+            await bind.teardown()
         self._client = None
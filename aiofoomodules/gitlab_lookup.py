@@ -1,4 +1,5 @@
 import asyncio
+import collections
 import dataclasses
 import enum
 import logging
@@ -32,7 +33,183 @@ class LookupRequest:
     iid: int
 
 
+def _cache_key(key):
+    # convert in-memory cache keys to something JSON can represent
+    if isinstance(key, LookupRequest):
+        key = dataclasses.astuple(key)
+    if isinstance(key, tuple):
+        return [_cache_key(item) for item in key]
+    if isinstance(key, enum.Enum):
+        return key.value
+    return key
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over *words*: :meth:`finditer` finds all
+    occurrences of all words in a single pass over the text, independent of
+    the number of words.
+    """
+
+    def __init__(self, words: typing.Iterable[str]):
+        super().__init__()
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for word in words:
+            if not word:
+                raise ValueError("empty words cannot be matched")
+            state = 0
+            for ch in word:
+                try:
+                    state = self._goto[state][ch]
+                except KeyError:
+                    self._goto[state][ch] = len(self._goto)
+                    state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+            self._out[state] = (word,)
+
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail
+                # the fail state is shallower, so this keeps the longest
+                # word first
+                self._out[next_state] += self._out[fail]
+
+    def finditer(self, text: str) -> typing.Iterator[typing.Tuple[int, str]]:
+        """
+        Yield ``(end, word)`` for each occurrence of a word in *text*, in the
+        order of *end*; for the same *end*, longer words come first.
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for word in out[state]:
+                yield i + 1, word
+
+
+class ReferenceFinder:
+    """
+    Finder for :class:`GitLabLookup` which recognises GitLab style
+    references: ``alias!123`` for merge requests and ``alias#123`` for
+    issues.
+
+    *projects* maps the aliases to look for to project paths or ids. All
+    aliases are matched in one pass with an :class:`AhoCorasick` automaton;
+    bodies without any ``!`` or ``#`` are rejected before that. If
+    *default_project* is given, bare ``!123`` and ``#123`` refer to it.
+    """
+
+    MARKERS = {
+        "!": LookupKind.MERGE_REQUEST,
+        "#": LookupKind.ISSUE,
+    }
+
+    # characters which glue a reference to the preceding text (project
+    # paths, URLs, HTML entities), so it must not be directly preceded by them
+    JOINING_CHARS = frozenset("/._-&")
+
+    def __init__(
+            self,
+            projects: typing.Mapping[str, typing.Union[str, int]],
+            *,
+            default_project: typing.Optional[typing.Union[str, int]] = None):
+        super().__init__()
+        self.projects = dict(projects)
+        self.default_project = default_project
+        self._automaton = AhoCorasick(self.projects)
+
+    def _is_boundary(self, body: str, pos: int) -> bool:
+        if pos == 0:
+            return True
+        ch = body[pos-1]
+        return not ch.isalnum() and ch not in self.JOINING_CHARS
+
+    def _parse_ref(
+            self,
+            body: str,
+            pos: int) -> typing.Optional[typing.Tuple[LookupKind, int]]:
+        try:
+            kind = self.MARKERS[body[pos]]
+        except (KeyError, IndexError):
+            return None
+        end = pos + 1
+        while end < len(body) and body[end] in "0123456789":
+            end += 1
+        if end == pos + 1 or (end < len(body) and body[end].isalnum()):
+            return None
+        return kind, int(body[pos+1:end])
+
+    def __call__(self, body: str) -> typing.Iterator[LookupRequest]:
+        if "!" not in body and "#" not in body:
+            return
+
+        found = []
+        consumed = set()
+        last_end = None
+        for end, alias in self._automaton.finditer(body):
+            if end == last_end:
+                # a longer alias ending here already matched
+                continue
+            if not self._is_boundary(body, end - len(alias)):
+                continue
+            ref = self._parse_ref(body, end)
+            if ref is None:
+                continue
+            last_end = end
+            consumed.add(end)
+            kind, iid = ref
+            found.append((end, LookupRequest(self.projects[alias], kind,
+                                             iid)))
+
+        if self.default_project is not None:
+            for marker in self.MARKERS:
+                pos = body.find(marker)
+                while pos >= 0:
+                    if pos not in consumed and self._is_boundary(body, pos):
+                        ref = self._parse_ref(body, pos)
+                        if ref is not None:
+                            kind, iid = ref
+                            found.append((pos, LookupRequest(
+                                self.default_project, kind, iid,
+                            )))
+                    pos = body.find(marker, pos + 1)
+
+        found.sort(key=lambda item: item[0])
+        for _, req in found:
+            yield req
+
+
 class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
+    """
+    Reply with a summary of the GitLab issues and merge requests which
+    *finder* yields as :class:`LookupRequest` objects for a message body;
+    see :class:`ReferenceFinder` for the built-in one.
+
+    If a :class:`PersistentCache.PersistentCache` is passed as
+    *persistent_cache*, the in-memory caches are backed by it, so that a
+    restart does not need to resolve all projects again. Project ids and
+    names are kept there for *project_cache_ttl* seconds, missing projects
+    for *negative_cache_ttl* seconds and the recent lookups for
+    *recent_timeout* seconds. Fetched objects are kept for
+    *object_cache_ttl* seconds together with the ``ETag`` of the response
+    they came in; see :meth:`lookup_objects` for when that helps.
+    """
+
     def __init__(
             self,
             finder,
@@ -43,7 +220,11 @@ class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
             recent_timeout=120,
             lookup_timeout=10,
             negative_cache_ttl=3600,
-            max_lookups_per_message=5):
+            max_lookups_per_message=5,
+            persistent_cache=None,
+            project_cache_ttl=7*86400,
+            object_cache_size=100,
+            object_cache_ttl=86400):
         super().__init__()
         self.finder = finder
         self.web_base = web_base
@@ -52,6 +233,9 @@ class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
         self.max_lookups_per_message = max_lookups_per_message
         self.recent_timeout = recent_timeout
         self.negative_cache_ttl = negative_cache_ttl
+        self.project_cache_ttl = project_cache_ttl
+        self.object_cache_ttl = object_cache_ttl
+        self.persistent_cache = persistent_cache
         self._recent = aioxmpp.cache.LRUDict()
         self._recent.maxsize = recent_lookups
         self._nonexistent_project_cache = aioxmpp.cache.LRUDict()
@@ -60,42 +244,98 @@ class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
         self._project_id_cache.maxsize = 1000
         self._project_reverse_cache = aioxmpp.cache.LRUDict()
         self._project_reverse_cache.maxsize = 1000
+        self._object_cache = aioxmpp.cache.LRUDict()
+        self._object_cache.maxsize = object_cache_size
+        self._session = None
 
     def _api_url(self, path: str) -> str:
         result = f"{self.api_base}/{path}"
         logger.debug("generated API url: %r", result)
         return result
 
+    def _cache_get(self, cache, namespace: str, key):
+        try:
+            return cache[key]
+        except KeyError:
+            if self.persistent_cache is None:
+                raise
+        value, _ = self.persistent_cache.get(
+            f"{self.api_base} {namespace}", _cache_key(key),
+        )
+        cache[key] = value
+        return value
+
+    def _cache_put(self, cache, namespace: str, key, value, ttl):
+        cache[key] = value
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(
+                f"{self.api_base} {namespace}", _cache_key(key), value, ttl,
+            )
+
+    def _timestamp_get(self, cache, namespace: str, key) -> float:
+        """
+        Like :meth:`_cache_get`, for caches of :func:`time.monotonic`
+        timestamps. Those do not survive a restart, so the persistent cache
+        only records the age of the entry.
+        """
+        try:
+            return cache[key]
+        except KeyError:
+            if self.persistent_cache is None:
+                raise
+        _, age = self.persistent_cache.get(
+            f"{self.api_base} {namespace}", _cache_key(key),
+        )
+        timestamp = cache[key] = time.monotonic() - age
+        return timestamp
+
+    def _timestamp_put(self, cache, namespace: str, key, timestamp, ttl):
+        cache[key] = timestamp
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(
+                f"{self.api_base} {namespace}", _cache_key(key), None, ttl,
+            )
+
+    def _is_known_nonexistent(self, project_ref, now) -> bool:
+        try:
+            last_nxproject_timestamp = self._timestamp_get(
+                self._nonexistent_project_cache,
+                "nonexistent",
+                project_ref,
+            )
+        except KeyError:
+            return False
+        if now - last_nxproject_timestamp < self.negative_cache_ttl:
+            logger.debug("skipping recheck of project %r because there"
+                         " is a negative cache entry from %d "
+                         "(and now is %d)",
+                         project_ref,
+                         last_nxproject_timestamp,
+                         now)
+            return True
+        del self._nonexistent_project_cache[project_ref]
+        return False
+
     async def _resolve_project(
             self,
             session: aiohttp.ClientSession,
             project_ref: typing.Union[str, int]) -> typing.Tuple[int, str]:
         now = time.monotonic()
-        try:
-            last_nxproject_timestamp = self._nonexistent_project_cache[
-                project_ref
-            ]
-        except KeyError:
-            pass
-        else:
-            if now - last_nxproject_timestamp < self.negative_cache_ttl:
-                logger.debug("skipping recheck of project %r because there"
-                             " is a negative cache entry from %d "
-                             "(and now is %d)",
-                             project_ref,
-                             last_nxproject_timestamp,
-                             now)
-                raise LookupError("project does not exist")
-            del self._nonexistent_project_cache[project_ref]
+        if self._is_known_nonexistent(project_ref, now):
+            raise LookupError("project does not exist")
 
         def existence_check(resp):
             if resp.status == 404:
-                self._nonexistent_project_cache[project_ref] = now
+                self._timestamp_put(self._nonexistent_project_cache,
+                                    "nonexistent", project_ref, now,
+                                    self.negative_cache_ttl)
                 raise LookupError("project does not exist")
 
         if isinstance(project_ref, int):
             try:
-                return (project_ref, self._project_reverse_cache[project_ref])
+                return (project_ref, self._cache_get(
+                    self._project_reverse_cache, "project_name", project_ref,
+                ))
             except KeyError:
                 pass
 
@@ -109,12 +349,18 @@ class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
                              result)
                 project_name = result["path_with_namespace"]
 
-            self._project_id_cache[project_name] = project_ref
-            self._project_reverse_cache[project_ref] = project_name
+            self._cache_put(self._project_id_cache, "project_id",
+                            project_name, project_ref,
+                            self.project_cache_ttl)
+            self._cache_put(self._project_reverse_cache, "project_name",
+                            project_ref, project_name,
+                            self.project_cache_ttl)
             return project_ref, project_name
 
         try:
-            return (self._project_id_cache[project_ref], project_ref)
+            return (self._cache_get(
+                self._project_id_cache, "project_id", project_ref,
+            ), project_ref)
         except KeyError:
             pass
 
@@ -129,24 +375,121 @@ class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
                          result)
             project_id = result["id"]
 
-        self._project_id_cache[project_ref] = project_id
-        self._project_reverse_cache[project_id] = project_ref
+        self._cache_put(self._project_id_cache, "project_id",
+                        project_ref, project_id,
+                        self.project_cache_ttl)
+        self._cache_put(self._project_reverse_cache, "project_name",
+                        project_id, project_ref,
+                        self.project_cache_ttl)
         return (project_id, project_ref)
 
-    async def lookup_object(
+    def _require_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.lookup_timeout),
+            )
+        return self._session
+
+    async def setup(self, client):
+        await super().setup(client)
+        self._require_session()
+
+    async def teardown(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        await super().teardown()
+
+    def _project_path(self, project_ref: typing.Union[str, int]) -> str:
+        if isinstance(project_ref, int):
+            return str(project_ref)
+        return urllib.parse.quote(project_ref, safe="")
+
+    async def _project_name(
+            self,
+            session: aiohttp.ClientSession,
+            project_ref: typing.Union[str, int]) -> str:
+        if not isinstance(project_ref, int):
+            return project_ref
+        _, project_name = await self._resolve_project(session, project_ref)
+        return project_name
+
+    async def lookup_objects(
             self,
             session: aiohttp.ClientSession,
-            project_id: int,
+            project_ref: typing.Union[str, int],
             kind: LookupKind,
-            iid: int) -> typing.Mapping:
+            iids: typing.Collection[int],
+            ) -> typing.Mapping[int, typing.Mapping]:
+        """
+        Fetch the objects *iids* of *kind* in one request, using the
+        ``iids[]`` filter of the list endpoint. The project may be given by
+        id or by path, so no resolution is needed first.
+
+        Return a mapping from iid to object; iids which do not exist are
+        missing from it.
+
+        If the same objects have been fetched before, the request is
+        conditional on their ``ETag`` and the cached objects are used if
+        they did not change.
+
+        The list endpoint returns a single ``ETag`` for the whole response,
+        so the cache is keyed by the exact set of *iids* (in any order).
+        Looking up a different combination of the same objects is a full
+        request again; caching per object would need one request per iid
+        to revalidate, which is what the bulk lookup avoids.
+        """
+        iids = sorted(iids)
         url = self._api_url(
-            f"projects/{project_id}/{kind.value}/{iid}",
+            f"projects/{self._project_path(project_ref)}/{kind.value}",
+        )
+        params = [("iids[]", str(iid)) for iid in iids]
+        params.append(("per_page", str(len(iids))))
+
+        cache_key = (project_ref, kind, tuple(iids))
+        try:
+            etag, cached = self._cache_get(self._object_cache, "objects",
+                                           cache_key)
+        except KeyError:
+            headers = {}
+        else:
+            headers = {"If-None-Match": etag}
+
+        async with session.get(url, params=params, headers=headers) as resp:
+            if resp.status == 404:
+                self._timestamp_put(self._nonexistent_project_cache,
+                                    "nonexistent", project_ref,
+                                    time.monotonic(),
+                                    self.negative_cache_ttl)
+                raise LookupError("project does not exist")
+            if resp.status == 304:
+                logger.debug("%s %r of %r not modified", kind.value, iids,
+                             project_ref)
+                result = cached
+            else:
+                resp.raise_for_status()
+                result = await resp.json()
+                logger.debug("retrieved %s %r of %r as %r", kind.value,
+                             iids, project_ref, result)
+                etag = resp.headers.get("ETag")
+                if etag is not None:
+                    self._cache_put(self._object_cache, "objects",
+                                    cache_key, (etag, result),
+                                    self.object_cache_ttl)
+            return {object_["iid"]: object_ for object_ in result}
+
+    async def _lookup_group(
+            self,
+            session: aiohttp.ClientSession,
+            project_ref: typing.Union[str, int],
+            kind: LookupKind,
+            iids: typing.Collection[int]):
+        # the name is only needed for formatting, so resolve it (if it is not
+        # known anyway) while the objects are being fetched
+        return await asyncio.gather(
+            self._project_name(session, project_ref),
+            self.lookup_objects(session, project_ref, kind, iids),
         )
-        async with session.get(url) as resp:
-            resp.raise_for_status()
-            result = await resp.json()
-            logger.debug("retrieved %s/%d as %r", kind.value, iid, result)
-            return result
 
     def _format(self, req, project_name, object_):
         friendly_name = {
@@ -156,66 +499,77 @@ class GitLabLookup(aiofoomodules.handlers.AbstractHandler):
         return f"{project_name}: {object_['state']} {friendly_name} {object_['iid']}: {object_['title']} ({self.web_base}/{project_name}/-/{req.kind.value}/{object_['iid']})"
 
     async def process_requests(self, ctx, message, reqs):
-        async with aiohttp.ClientSession() as session:
-            lookups = []
-            names = []
-            final_reqs = []
-            now = time.monotonic()
-            for req in reqs:
-                try:
-                    recent_timestamp = self._recent[req]
-                except KeyError:
-                    pass
-                else:
-                    if now - recent_timestamp < self.recent_timeout:
-                        logger.debug("skipping lookup %r because I did "
-                                     "that recently (%d, now is %d)",
-                                     req,
-                                     recent_timestamp,
-                                     now)
-                        continue
-                    del self._recent[req]
-
-                try:
-                    project_id, project_name = \
-                        await self._resolve_project(session, req.project_ref)
-                except LookupError:
-                    logger.warning("skipping lookup %r because the project "
-                                   "was not resolvable", req)
+        session = self._require_session()
+        now = time.monotonic()
+        final_reqs = []
+        groups = {}
+        for req in reqs:
+            try:
+                recent_timestamp = self._timestamp_get(self._recent, "recent",
+                                                       req)
+            except KeyError:
+                pass
+            else:
+                if now - recent_timestamp < self.recent_timeout:
+                    logger.debug("skipping lookup %r because I did "
+                                 "that recently (%d, now is %d)",
+                                 req,
+                                 recent_timestamp,
+                                 now)
                     continue
+                del self._recent[req]
 
-                names.append(project_name)
-                lookups.append(asyncio.create_task(self.lookup_object(
-                    session,
-                    project_id,
-                    req.kind,
-                    req.iid,
-                )))
-                final_reqs.append(req)
-
-            if not lookups:
-                return
-
-            done, pending = await asyncio.wait(
-                lookups,
-                return_when=asyncio.ALL_COMPLETED,
-                timeout=self.lookup_timeout,
+            if self._is_known_nonexistent(req.project_ref, now):
+                logger.warning("skipping lookup %r because the project "
+                               "was not resolvable", req)
+                continue
+
+            groups.setdefault((req.project_ref, req.kind), []).append(
+                req.iid
             )
-            for fut in pending:
-                fut.cancel()
+            final_reqs.append(req)
 
-            for fut, name, req in zip(lookups, names, final_reqs):
-                if fut.cancelled():
-                    continue
-                if fut.exception():
-                    logger.error(
-                        "failed to resolve %r: %s",
-                        req, fut.exception(),
-                    )
-                    continue
-                ctx.reply(self._format(req, name, fut.result()),
-                          use_nick=False)
-                self._recent[req] = now
+        if not groups:
+            return
+
+        lookups = {}
+        for (project_ref, kind), iids in groups.items():
+            lookups[project_ref, kind] = asyncio.create_task(
+                self._lookup_group(session, project_ref, kind, iids)
+            )
+
+        done, pending = await asyncio.wait(
+            lookups.values(),
+            return_when=asyncio.ALL_COMPLETED,
+            timeout=self.lookup_timeout,
+        )
+        for fut in pending:
+            fut.cancel()
+
+        for req in final_reqs:
+            fut = lookups[req.project_ref, req.kind]
+            if fut not in done:
+                continue
+            if isinstance(fut.exception(), LookupError):
+                logger.warning("skipping lookup %r because the project "
+                               "was not resolvable", req)
+                continue
+            if fut.exception():
+                logger.error(
+                    "failed to resolve %r: %s",
+                    req, fut.exception(),
+                )
+                continue
+            name, objects = fut.result()
+            try:
+                object_ = objects[req.iid]
+            except KeyError:
+                logger.debug("%r does not exist", req)
+                continue
+            ctx.reply(self._format(req, name, object_),
+                      use_nick=False)
+            self._timestamp_put(self._recent, "recent", req, now,
+                                self.recent_timeout)
 
     def analyse_message(self, ctx, message):
         body = get_simple_body(message)
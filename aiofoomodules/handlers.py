@@ -1,5 +1,6 @@
 import abc
 import argparse
+import logging
 import re
 import shlex
 import types
@@ -10,6 +11,8 @@ import aioxmpp
 from .utils import get_simple_body
 
 
+logger = logging.getLogger(__name__)
+
 class MessageHandled(Exception):
     pass
 
@@ -25,6 +28,9 @@ class AbstractHandler(metaclass=abc.ABCMeta):
     async def setup(self, client: aioxmpp.Client):
         pass
 
+    async def teardown(self):
+        pass
+
 
 class AbstractCommandHandler(metaclass=abc.ABCMeta):
     def __init__(self, **kwargs):
@@ -41,6 +47,9 @@ class AbstractCommandHandler(metaclass=abc.ABCMeta):
     async def setup(self, client: aioxmpp.Client):
         pass
 
+    async def teardown(self):
+        pass
+
 
 class _ArgparseError(Exception):
     pass
@@ -77,10 +86,15 @@ class ArgparseCommandHandler(AbstractCommandHandler):
 
 
 class CommandDispatcher(AbstractHandler):
-    def __init__(self):
+    def __init__(self, rate_limiter=None):
+        """
+        :param rate_limiter: Optional :class:`RateLimit.TokenBucketLimiter`;
+            commands from senders exceeding the limit are dropped.
+        """
         super().__init__()
         self._commands = {}
         self._command_match = re.compile(r"^$")
+        self._rate_limiter = rate_limiter
 
     def _rebuild_re(self):
         self._command_match = re.compile("^({})$".format(
@@ -91,6 +105,10 @@ class CommandDispatcher(AbstractHandler):
         for cmd_handler in self._commands.values():
             await cmd_handler.setup(client)
 
+    async def teardown(self):
+        for cmd_handler in self._commands.values():
+            await cmd_handler.teardown()
+
     def analyse_message(
             self, ctx,
             message: aioxmpp.Message) -> typing.Iterable[typing.Coroutine]:
@@ -103,6 +121,13 @@ class CommandDispatcher(AbstractHandler):
         if not cmd_match:
             return
 
+        if self._rate_limiter is not None:
+            key = str(message.from_), message.type_
+            if not self._rate_limiter.consume(key):
+                logger.debug("dropped command %r from %s: rate limited",
+                             cmd, message.from_)
+                return
+
         cmd_handler = self._commands[cmd]
         args = body[len(cmd)+1:]
         yield cmd_handler.parse_message(ctx, cmd, args)
@@ -0,0 +1,104 @@
+import random
+import unittest
+
+from .gitlab_lookup import AhoCorasick, LookupKind, LookupRequest, \
+    ReferenceFinder
+
+MR = LookupKind.MERGE_REQUEST
+ISSUE = LookupKind.ISSUE
+
+
+class TestAhoCorasick(unittest.TestCase):
+    def test_overlapping(self):
+        ac = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(list(ac.finditer("ushers")),
+                         [(4, "she"), (4, "he"), (6, "hers")])
+
+    def test_longest_first(self):
+        ac = AhoCorasick(["b", "ab", "cab"])
+        self.assertEqual(list(ac.finditer("xcab")),
+                         [(4, "cab"), (4, "ab"), (4, "b")])
+
+    def test_no_match(self):
+        ac = AhoCorasick(["foo", "bar"])
+        self.assertEqual(list(ac.finditer("fobaz")), [])
+        self.assertEqual(list(ac.finditer("")), [])
+
+    def test_empty_word(self):
+        with self.assertRaises(ValueError):
+            AhoCorasick(["foo", ""])
+
+    def test_against_naive(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            words = {
+                "".join(rng.choice("ab") for _ in range(rng.randint(1, 4)))
+                for _ in range(rng.randint(1, 10))
+            }
+            ac = AhoCorasick(words)
+            text = "".join(rng.choice("abc") for _ in range(40))
+            expected = sorted(
+                (i + len(word), word)
+                for word in words
+                for i in range(len(text))
+                if text.startswith(word, i)
+            )
+            self.assertEqual(sorted(ac.finditer(text)), expected)
+
+
+class TestReferenceFinder(unittest.TestCase):
+    def setUp(self):
+        self.finder = ReferenceFinder({
+            "project": "group/project",
+            "my project": "other/my-project",
+            "foo": 42,
+        })
+
+    def _find(self, body, finder=None):
+        return list((finder or self.finder)(body))
+
+    def test_references(self):
+        self.assertEqual(
+            self._find("see project!12 and foo#3, and project#4."),
+            [LookupRequest("group/project", MR, 12),
+             LookupRequest(42, ISSUE, 3),
+             LookupRequest("group/project", ISSUE, 4)])
+
+    def test_start_and_end(self):
+        self.assertEqual(self._find("foo!1"), [LookupRequest(42, MR, 1)])
+        self.assertEqual(self._find("(foo!1)"), [LookupRequest(42, MR, 1)])
+
+    def test_no_markers(self):
+        self.assertEqual(self._find("project 12 and foo 3"), [])
+
+    def test_longest_alias_wins(self):
+        # "project" ends at the same position and is preceded by a space,
+        # but it is part of the longer alias
+        self.assertEqual(self._find("my project!7"),
+                         [LookupRequest("other/my-project", MR, 7)])
+
+    def test_joining_chars(self):
+        for body in ("x/foo!1", "x.foo!1", "x_foo!1", "x-foo!1", "x&foo!1",
+                     "xfoo!1", "x1foo!1"):
+            self.assertEqual(self._find(body), [], body)
+
+    def test_invalid_refs(self):
+        for body in ("foo!12abc", "foo!", "foo!#1", "foo! 1", "foo#x1"):
+            self.assertEqual(self._find(body), [], body)
+
+    def test_bare_refs_need_default_project(self):
+        self.assertEqual(self._find("see #7 and !8"), [])
+
+    def test_default_project(self):
+        finder = ReferenceFinder({"foo": 42}, default_project="d/default")
+        self.assertEqual(
+            self._find("#7, foo!1 and !8.", finder),
+            [LookupRequest("d/default", ISSUE, 7),
+             LookupRequest(42, MR, 1),
+             LookupRequest("d/default", MR, 8)])
+
+    def test_default_project_boundaries(self):
+        finder = ReferenceFinder({}, default_project="d/default")
+        for body in ("&#123;", "http://example.com/#9", "x#1", "#10a",
+                     "foo!12abc"):
+            self.assertEqual(self._find(body, finder), [], body)
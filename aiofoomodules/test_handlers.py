@@ -0,0 +1,70 @@
+import unittest
+
+from RateLimit import TokenBucketLimiter
+
+from .handlers import AbstractCommandHandler, CommandDispatcher
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class FakeBody:
+    def __init__(self, text):
+        self.text = text
+
+    def lookup(self, ranges):
+        return self.text
+
+
+class FakeMessage:
+    def __init__(self, from_, body, type_="groupchat"):
+        self.from_ = from_
+        self.type_ = type_
+        self.body = FakeBody(body)
+
+
+class EchoCommand(AbstractCommandHandler):
+    def parse_message(self, ctx, arg0, args):
+        return (arg0, args)
+
+
+class TestCommandDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = TokenBucketLimiter(1, 2, clock=self.clock)
+        self.dispatcher = CommandDispatcher(rate_limiter=self.limiter)
+        self.dispatcher.register_command("echo", EchoCommand())
+
+    def _dispatch(self, from_, body, dispatcher=None):
+        dispatcher = dispatcher or self.dispatcher
+        return list(dispatcher.analyse_message(None,
+                                               FakeMessage(from_, body)))
+
+    def test_without_limiter(self):
+        dispatcher = CommandDispatcher()
+        dispatcher.register_command("echo", EchoCommand())
+        for _ in range(5):
+            self.assertEqual(self._dispatch("a", "echo hi", dispatcher),
+                             [("echo", "hi")])
+
+    def test_rate_limited(self):
+        self.assertEqual(self._dispatch("a", "echo 1"), [("echo", "1")])
+        self.assertEqual(self._dispatch("a", "echo 2"), [("echo", "2")])
+        self.assertEqual(self._dispatch("a", "echo 3"), [])
+        # other senders have their own bucket
+        self.assertEqual(self._dispatch("b", "echo 4"), [("echo", "4")])
+
+        self.clock.t = 1
+        self.assertEqual(self._dispatch("a", "echo 5"), [("echo", "5")])
+        self.assertEqual(self._dispatch("a", "echo 6"), [])
+
+    def test_other_messages_are_free(self):
+        for _ in range(5):
+            self.assertEqual(self._dispatch("a", "just chatting"), [])
+        self.assertEqual(len(self.limiter), 0)
+        self.assertEqual(self._dispatch("a", "echo 1"), [("echo", "1")])
@@ -1,6 +1,8 @@
 import shlex
 import argparse
+import concurrent.futures
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -72,6 +74,91 @@ class PrefixListener(MessageHandler):
             return
         return self._prefix_matched(msg, contents[len(self.prefix):], errorSink=errorSink)
 
+class PrefixTrie(object):
+    """
+    Map string prefixes to values. :meth:`match` returns the values of all
+    keys which are a prefix of the given string, walking the string only
+    once.
+    """
+
+    _VALUES = object()
+
+    def __init__(self):
+        super().__init__()
+        self._root = {}
+
+    def add(self, prefix, value):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(self._VALUES, []).append(value)
+
+    def match(self, s):
+        node = self._root
+        result = list(node.get(self._VALUES, []))
+        for char in s:
+            try:
+                node = node[char]
+            except KeyError:
+                break
+            result.extend(node.get(self._VALUES, []))
+        return result
+
+
+class PrefixListenerGroup(object):
+    """
+    Dispatch to a sequence of :class:`PrefixListener` instances with a single
+    prefix lookup. Listeners whose prefix matches are invoked in their
+    original order, and the chain stops at the first one returning a true
+    value, just like calling each listener in turn would.
+    """
+
+    def __init__(self, listeners):
+        super().__init__()
+        self.listeners = list(listeners)
+        self._trie = PrefixTrie()
+        for i, listener in enumerate(self.listeners):
+            self._trie.add(listener.prefix, i)
+
+    @staticmethod
+    def can_group(handler):
+        # subclasses which override __call__ may do more than prefix
+        # matching and must be called as-is
+        return (isinstance(handler, PrefixListener) and
+                type(handler).__call__ is PrefixListener.__call__)
+
+    def __call__(self, msg, errorSink=None):
+        contents = msg["body"]
+        for i in sorted(self._trie.match(contents)):
+            listener = self.listeners[i]
+            abort = listener._prefix_matched(
+                msg,
+                contents[len(listener.prefix):],
+                errorSink=errorSink)
+            if abort:
+                return abort
+
+
+def compile_handler_chain(handlers):
+    """
+    Return a list of callables equivalent to calling *handlers* in order,
+    with runs of plain :class:`PrefixListener` instances folded into
+    :class:`PrefixListenerGroup` objects.
+    """
+    chain = []
+    group = []
+    for handler in handlers:
+        if PrefixListenerGroup.can_group(handler):
+            group.append(handler)
+            continue
+        if group:
+            chain.append(PrefixListenerGroup(group))
+            group = []
+        chain.append(handler)
+    if group:
+        chain.append(PrefixListenerGroup(group))
+    return chain
+
 class ArgumentParser(argparse.ArgumentParser):
     def parse_args(self, reply_method, args):
         self.reply = reply_method
@@ -88,11 +175,71 @@ class ArgumentParser(argparse.ArgumentParser):
     def exit(self):
         pass
 
+class CommandExecutor(object):
+    """
+    Run blocking commands on a pool of *max_workers* threads, so that they
+    do not stall the XMPP event processing.
+
+    At most *max_per_user* jobs per key (usually the sender JID) may be
+    queued or running at the same time.
+    """
+
+    def __init__(self, max_workers=4, max_per_user=1):
+        super().__init__()
+        self.max_per_user = max_per_user
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._active = {}
+
+    def _done(self, key, future):
+        with self._lock:
+            count = self._active[key] - 1
+            if count:
+                self._active[key] = count
+            else:
+                del self._active[key]
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Schedule ``func(*args, **kwargs)`` and return the future, or
+        :data:`None` if *key* already has too many jobs.
+        """
+        with self._lock:
+            count = self._active.get(key, 0)
+            if count >= self.max_per_user:
+                return None
+            self._active[key] = count + 1
+        future = self._pool.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+def get_default_executor():
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = CommandExecutor()
+        return _default_executor
+
+
 class ArgparseCommand(MessageHandler):
-    def __init__(self, command_name, **kwargs):
+    # commands which may take a while (network, subprocesses) set this to run
+    # on a CommandExecutor instead of the XMPP event thread
+    blocking = False
+    busy_message = "Please wait until your previous command has finished."
+
+    def __init__(self, command_name, executor=None, **kwargs):
         super().__init__()
         self.subparsers = []
         self.command_name = command_name
+        self.executor = executor
         self.argparse = ArgumentParser(prog=command_name, **kwargs)
 
     def _error(self, msg, err_str):
@@ -109,4 +256,24 @@ class ArgparseCommand(MessageHandler):
         except ValueError as err:
             self._error(msg, str(err))
             return
+        if self.blocking:
+            self._call_in_executor(msg, args, errorSink)
+            return True
         return self._call(msg, args, errorSink=None)
+
+    def _run_blocking(self, msg, args, errorSink):
+        try:
+            self._call(msg, args, errorSink=None)
+        except Exception as err:
+            logger.exception("blocking command %s failed", self.command_name)
+            if errorSink is not None:
+                errorSink.submit(self.xmpp, err, msg)
+
+    def _call_in_executor(self, msg, args, errorSink):
+        executor = self.executor or get_default_executor()
+        future = executor.submit(
+            str(msg["from"]),
+            self._run_blocking,
+            msg, args, errorSink)
+        if future is None:
+            self.reply(msg, self.busy_message)
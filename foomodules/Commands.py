@@ -6,6 +6,7 @@ import sys
 import os
 import re
 import socket
+import time
 import argparse
 from datetime import datetime, timedelta, date
 import ipaddress
@@ -33,6 +34,8 @@ except ImportError:
     babel.dates = None
 
 import foomodules.Base as Base
+import foomodules.dnsresolver as dnsresolver
+import foomodules.pinger as pinger
 import foomodules.utils as utils
 import foomodules.polylib as polylib
 
@@ -112,14 +115,57 @@ class Excuse(Base.MessageHandler):
 
 
 class Host(Base.ArgparseCommand):
-    def __init__(self, command_name="!host", **kwargs):
+    blocking = True
+
+    HOST_FORMATS = {
+        "CNAME": "{name} is an alias for {text}",
+        "A": "{name} has address {text}",
+        "AAAA": "{name} has IPv6 address {text}",
+        "MX": "{name} mail is handled by {text}",
+        "PTR": "{name} domain name pointer {text}",
+    }
+
+    def __init__(self, command_name="!host", resolver=None, **kwargs):
         super().__init__(command_name, **kwargs)
+        self.resolver = resolver
         self.argparse.add_argument(
             "hostname",
             metavar="HOST",
             help="Hostname to look up")
 
+    def _lookup(self, hostname):
+        resolver = self.resolver or dnsresolver.get_default_resolver()
+        try:
+            ipaddress.ip_address(hostname)
+        except ValueError:
+            qname, rdtypes = hostname, ["A", "AAAA", "MX"]
+        else:
+            qname, rdtypes = resolver.reverse_name(hostname), ["PTR"]
+
+        lines = []
+        for result in resolver.query_many(qname, rdtypes):
+            if isinstance(result, dnsresolver.NXDomain):
+                return "Host {} not found: 3(NXDOMAIN)".format(hostname)
+            if isinstance(result, dnsresolver.DNSError):
+                return ";; {}".format(result)
+            for record in result:
+                try:
+                    fmt = self.HOST_FORMATS[record.rdtype]
+                except KeyError:
+                    continue
+                line = fmt.format(name=record.name, text=record.text)
+                if line not in lines:
+                    lines.append(line)
+        return "\n".join(lines)
+
     def _call(self, msg, args, errorSink=None):
+        if dnsresolver.AVAILABLE:
+            output = self._lookup(args.hostname)
+            if not output:
+                output = "{} has no matching records".format(args.hostname)
+            self.reply(msg, output)
+            return
+
         proc = subprocess.Popen(
             ["host", "--", args.hostname],
             stdout=subprocess.PIPE
@@ -134,6 +180,8 @@ class Host(Base.ArgparseCommand):
             self.reply(msg, output)
 
 class LDNSRRSig(Base.ArgparseCommand):
+    blocking = True
+
     def __init__(self, command_name="!rrsig", **kwargs):
         super().__init__(command_name, **kwargs)
         self.argparse.add_argument(
@@ -214,6 +262,8 @@ class Respawn(Base.MessageHandler):
 
 
 class Peek(Base.ArgparseCommand):
+    blocking = True
+
     def __init__(self, timeout=3, command_name="peek", maxlen=256, **kwargs):
         super().__init__(command_name, **kwargs)
         self.timeout = timeout
@@ -307,17 +357,25 @@ class Peek(Base.ArgparseCommand):
 
 
 class Ping(Base.ArgparseCommand):
-    packetline = re.compile("([0-9]+) packets transmitted, ([0-9]+) received(.*), ([0-9]+)% packet loss, time ([0-9]+)ms")
-    rttline = re.compile("rtt min/avg/max/mdev = (([0-9.]+/){3}([0-9.]+)) ms")
+    blocking = True
 
-    def __init__(self, count=4, interval=0.5, command_name="ping", **kwargs):
+    def __init__(self, count=5, interval=0.5, command_name="ping",
+                 alot_count=20, timeout=2, spacing=0.005, tcp_port=80,
+                 **kwargs):
+        # interval is accepted for compatibility with older configs; probes
+        # are sent back-to-back, *spacing* seconds apart
         super().__init__(command_name, **kwargs)
+        self.count = count
+        self.alot_count = alot_count
+        self.timeout = timeout
+        self.spacing = spacing
+        self.tcp_port = tcp_port
         self.argparse.add_argument(
             "-6", "--ipv6",
             action="store_true",
             dest="ipv6",
             default=False,
-            help="Use ping6 instead of ping"
+            help="Ping via IPv6"
         )
         self.argparse.add_argument(
             "--alot",
@@ -329,60 +387,58 @@ class Ping(Base.ArgparseCommand):
             "host",
             help="Host which is to be pinged"
         )
-        self.pingargs = [
-            "-q",
-            "-i{0:f}".format(interval)
-        ]
+
+    def _format_rtt(self, rtt):
+        return "{:.3f}".format(rtt * 1000)
 
     def _call(self, msg, args, errorSink=None):
-        pingcmd = ["ping6" if args.ipv6 else "ping"]
-        if args.alot:
-            count = 20
-        else:
-            count = 5
-        pingcmd.append("-c{0:d}".format(count))
-        proc = subprocess.Popen(
-            pingcmd + self.pingargs + ["--", args.host],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE
+        count = self.alot_count if args.alot else self.count
+        family = socket.AF_INET6 if args.ipv6 else socket.AF_INET
+        try:
+            family, address = pinger.resolve(args.host, family)
+        except socket.gaierror as err:
+            self.reply(msg, "error: {}: {}".format(args.host, err.strerror))
+            return
+
+        start = time.monotonic()
+        try:
+            method, results = pinger.probe(
+                family, address,
+                count=count,
+                timeout=self.timeout,
+                spacing=self.spacing,
+                tcp_port=self.tcp_port)
+            stats = pinger.PingStats.from_results(count, list(results))
+        except OSError as err:
+            self.reply(msg, "error: {0}".format(err))
+            return
+        elapsed = time.monotonic() - start
+
+        if not stats.received:
+            self.reply(msg, "{host}: 0/{sent} pckts., timeout/blocked?".format(
+                host=args.host,
+                sent=stats.sent))
+            return
+
+        method_str = ""
+        if method == "tcp":
+            method_str = " (tcp/{})".format(self.tcp_port)
+
+        self.reply(
+            msg,
+            "{host}: {recv}/{sent} pckts., {loss}% loss, rtt ↓/-/↑/↕ = {rttmin}/{rttavg}/{rttmax}/{rttmdev}, time {time}ms{method}".format(
+                host=args.host,
+                sent=stats.sent,
+                recv=stats.received,
+                loss=stats.loss,
+                rttmin=self._format_rtt(stats.min),
+                rttavg=self._format_rtt(stats.avg),
+                rttmax=self._format_rtt(stats.max),
+                rttmdev=self._format_rtt(stats.mdev),
+                time=int(elapsed * 1000),
+                method=method_str
+            )
         )
-        out, err = proc.communicate()
-        if proc.wait() != 0:
-            message = err.decode().strip()
-            if not message:
-                self.reply(msg, "unknown error, timeout/blocked?")
-            else:
-                self.reply(msg, "error: {0}".format(message))
-        else:
-            lines = out.decode().strip().split("\n")
-            packetinfo = self.packetline.match(lines[3])
-            rttinfo = self.rttline.match(lines[4])
-            if not packetinfo or not rttinfo:
-                self.reply(msg, "unknown error, unable to parse ping output, dumping to stdout")
-                print(out.decode())
-            else:
-                packetinfo = packetinfo.groups()
-                rttinfo = rttinfo.group(1).split("/")
-                try:
-                    message = "{host}: {recv}/{sent} pckts., {loss}% loss, rtt ↓/-/↑/↕ = {rttmin}/{rttavg}/{rttmax}/{rttmdev}, time {time}ms".format(
-                        host=args.host,
-                        sent=int(packetinfo[0]),
-                        recv=int(packetinfo[1]),
-                        loss=int(packetinfo[3]),
-                        rttmin=rttinfo[0],
-                        rttavg=rttinfo[1],
-                        rttmax=rttinfo[2],
-                        rttmdev=rttinfo[3],
-                        time=int(packetinfo[4])
-                    )
-                except ValueError:
-                    self.reply(msg, "malformatted ping output, dumping to stdout")
-                    print(out.decode())
-                    return
-                self.reply(
-                    msg,
-                    message
-                )
 
 class Roll(Base.MessageHandler):
     rollex_base = "([0-9]*)[dW]([0-9]+)"
@@ -436,8 +492,11 @@ class Roll(Base.MessageHandler):
         ))
 
 class Dig(Base.ArgparseCommand):
-    def __init__(self, command_name="dig", **kwargs):
+    blocking = True
+
+    def __init__(self, command_name="dig", resolver=None, **kwargs):
         super().__init__(command_name, **kwargs)
+        self.resolver = resolver
         self.argparse.add_argument(
             "-s", "--server", "--at",
             default=None,
@@ -476,6 +535,20 @@ class Dig(Base.ArgparseCommand):
             self.reply(msg, "nice try")
             return
 
+        if dnsresolver.AVAILABLE:
+            resolver = self.resolver or dnsresolver.get_default_resolver()
+            try:
+                records = resolver.query(args.name, args.kind or "A",
+                                         server=args.at)
+            except dnsresolver.NXDomain:
+                records = []
+            except dnsresolver.DNSError as err:
+                self.reply(msg, str(err))
+                return
+            results = [record.text for record in records]
+            self._reply_results(msg, args, atstr, kindstr, results)
+            return
+
         call = ["dig", "+time=2", "+short"] + userargs
 
         proc = subprocess.Popen(
@@ -488,7 +561,9 @@ class Dig(Base.ArgparseCommand):
             return
 
         results = list(filter(bool, stdout.decode().strip().split("\n")))
+        self._reply_results(msg, args, atstr, kindstr, results)
 
+    def _reply_results(self, msg, args, atstr, kindstr, results):
         if results:
             resultstr = ", ".join(results)
         else:
@@ -733,9 +808,12 @@ class Poly(Base.MessageHandler):
     divex = re.compile(r"^\s*(.*?)\s+mod\s+(.*?)\s+in\s+GF\(([0-9]+)\)\[(\w)\]\s*$", re.I)
     supunmap = {v: k for k, v in polylib.supmap.items()}
 
-    def __init__(self, degree_limit=1024, **kwargs):
+    def __init__(self, degree_limit=1024, work_limit=65536, **kwargs):
         super().__init__(**kwargs)
+        # the division runs on the XMPP thread, so bound the degree and the
+        # degree times the bit length of the modulus
         self.degree_limit = degree_limit
+        self.work_limit = work_limit
 
     def _parse_coeff(self, cstr, var):
         coefficient, _, exponent = cstr.partition(var)
@@ -768,8 +846,7 @@ class Poly(Base.MessageHandler):
 
         coefficients = list(map(lambda x: self._parse_coeff(x, var), summands))
 
-        cs = [0]*(max(degree for _, degree in coefficients)+1)
-        for value, degree in coefficients:
+        for _, degree in coefficients:
             if degree < 0:
                 raise ValueError("Negative exponents are invalid for "
                                  "polynomials.")
@@ -777,6 +854,9 @@ class Poly(Base.MessageHandler):
                 raise ValueError("Polynomial out of supported range. "
                                  "Maximum degree is {}".format(
                                     self.degree_limit))
+
+        cs = [0]*(max(degree for _, degree in coefficients)+1)
+        for value, degree in coefficients:
             cs[degree] = value
         return cs
 
@@ -792,6 +872,12 @@ class Poly(Base.MessageHandler):
 
         cs1 = self._parse_poly(poly1, var)
         cs2 = self._parse_poly(poly2, var)
+        if self.work_limit is not None:
+            degree = max(len(cs1), len(cs2)) - 1
+            if degree * p.bit_length() > self.work_limit:
+                raise ValueError("Polynomial out of supported range. "
+                                 "Maximum degree for GF({}) is {}".format(
+                                    p, self.work_limit // p.bit_length()))
 
         field = polylib.IntField(p)
         p1 = polylib.FieldPoly(field, cs1)
@@ -826,6 +912,8 @@ class Poly(Base.MessageHandler):
 
 
 class Porn(Base.ArgparseCommand):
+    blocking = True
+
     ORIENTATIONS = {
         "straight": "s",
         "gay": "g",
@@ -931,6 +1019,8 @@ class Porn(Base.ArgparseCommand):
 
 
 class DWDWarnings(Base.ArgparseCommand):
+    blocking = True
+
     if pytz:
         TZ = pytz.timezone("Europe/Berlin")
         UTC = pytz.UTC
@@ -1,5 +1,9 @@
+import bisect
+import logging
+import os
 import pickle
 import sys
+import tempfile
 
 from datetime import datetime, timedelta
 
@@ -12,6 +16,8 @@ import pytz
 import foomodules.Base as Base
 import foomodules.urllookup as urllookup
 
+logger = logging.getLogger(__name__)
+
 def pytz_timezones(tzname, tzoffset):
     if tzname is None:
         if tzoffset is None:
@@ -57,6 +63,9 @@ class EventStore(object):
             max_event_count=5,
             max_name_length=64):
         self.events = {}
+        # sorted list of (target_date, name) tuples
+        self.index = []
+        self.listeners = []
         self.data_filename = data_filename
         self.min_name_length = int(min_name_length)
         self.max_event_count = int(max_event_count)
@@ -64,6 +73,27 @@ class EventStore(object):
 
         self.try_load()
 
+    def _index_add(self, event):
+        bisect.insort(self.index, (event.target_date, event.name))
+
+    def _index_remove(self, event):
+        key = (event.target_date, event.name)
+        i = bisect.bisect_left(self.index, key)
+        if i < len(self.index) and self.index[i] == key:
+            del self.index[i]
+
+    def _rebuild_index(self):
+        self.index = sorted(
+            (event.target_date, event.name)
+            for event in self.events.values())
+
+    def _changed(self):
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as err:
+                logger.exception(err)
+
     def _check_name(self, name):
         if len(name) < self.min_name_length:
             raise ValueError("Names have to have a minimum length of"
@@ -87,10 +117,43 @@ class EventStore(object):
 
     def load(self, filelike):
         self.events = pickle.load(filelike)
+        self._rebuild_index()
+        self._changed()
 
     def save(self):
-        with open(self.data_filename, "wb") as f:
-            pickle.dump(self.events, f)
+        # write to a temporary file next to the target and rename it over
+        # the old file, so that a crash never leaves a truncated store
+        dirname = os.path.dirname(os.path.abspath(self.data_filename))
+        f = tempfile.NamedTemporaryFile(
+            "wb",
+            dir=dirname,
+            prefix=".{}.".format(os.path.basename(self.data_filename)),
+            delete=False)
+        try:
+            with f:
+                pickle.dump(self.events, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f.name, self.data_filename)
+        except:
+            os.unlink(f.name)
+            raise
+
+    def upcoming(self, count=None, now=None):
+        if now is None:
+            now = datetime.utcnow().replace(tzinfo=pytz.utc)
+        start = bisect.bisect_left(self.index, (now,))
+        end = len(self.index) if count is None else start + count
+        return [self.events[name] for _, name in self.index[start:end]]
+
+    def events_between(self, start, end):
+        """
+        Return the events whose target date lies in the half-open interval
+        [*start*, *end*), ordered by target date.
+        """
+        i = bisect.bisect_left(self.index, (start,))
+        j = bisect.bisect_left(self.index, (end,))
+        return [self.events[name] for _, name in self.index[i:j]]
 
     def add_event(self, name, target_date, override_timezone=None):
         self._check_limits()
@@ -101,20 +164,94 @@ class EventStore(object):
         event = Event(name, target_date,
                       override_timezone=override_timezone)
         self.events[name] = event
+        self._index_add(event)
+        self._changed()
 
     def delete_event(self, event):
         del self.events[event.name]
+        self._index_remove(event)
+        self._changed()
 
     def rename_event(self, oldname, newname):
+        if newname in self.events:
+            raise KeyError(newname)
         event = self.events[oldname]
         del self.events[oldname]
+        self._index_remove(event)
         event.name = newname
         self.events[newname] = event
+        self._index_add(event)
+        self._changed()
+
+
+class CountDownAnnouncer(Base.XMPPObject):
+    """
+    Announce events of an :class:`EventStore` to *to_jids* when their target
+    date is reached. Instead of polling, a single scheduler job is kept for
+    the next event and moved whenever the store changes.
+    """
+
+    DEFAULT_FORMAT = "{name} is happening now!"
+
+    def __init__(self, store, to_jids=[], fmt=DEFAULT_FORMAT, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.to_jids = list(to_jids)
+        self.fmt = fmt
+        self._uid = "{0!r}.announce".format(self)
+        self._scheduled = False
+        self._last_check = datetime.utcnow().replace(tzinfo=pytz.utc)
+        self.store.listeners.append(self._reschedule)
+
+    def _xmpp_changed(self, old_value, new_value):
+        super()._xmpp_changed(old_value, new_value)
+        if old_value is not None and self._scheduled:
+            old_value.scheduler.remove(self._uid)
+            self._scheduled = False
+        self._reschedule()
+
+    def _reschedule(self):
+        if self.xmpp is None:
+            return
+        if self._scheduled:
+            self.xmpp.scheduler.remove(self._uid)
+            self._scheduled = False
+
+        pending = self.store.upcoming(count=1, now=self._last_check)
+        if not pending:
+            return
+
+        now = datetime.utcnow().replace(tzinfo=pytz.utc)
+        delay = max(0, (pending[0].target_date - now).total_seconds())
+        logger.debug("next countdown announcement in %.1f s", delay)
+        self.xmpp.scheduler.add(
+            self._uid,
+            delay,
+            self._on_timer)
+        self._scheduled = True
+
+    def _announce(self, event):
+        body = self.fmt.format(name=event.name)
+        for jid in self.to_jids:
+            if not isinstance(jid, str) and hasattr(jid, "__iter__"):
+                jid, mtype = jid
+            else:
+                mtype = "chat"
+            self.xmpp.send_message(mto=jid, mbody=body, mtype=mtype)
+
+    def _on_timer(self):
+        self._scheduled = False
+        now = datetime.utcnow().replace(tzinfo=pytz.utc)
+        for event in self.store.events_between(self._last_check, now):
+            self._announce(event)
+        self._last_check = now
+        self._reschedule()
 
 class CountDownCommand(Base.ArgparseCommand):
     CMD_ADD = "add"
     CMD_MOVE = "mv"
     CMD_DELETE = "rm"
+    CMD_NEXT = "next"
     CMD_SAVE = "save"
     CMD_STATS = "stats"
 
@@ -179,6 +316,25 @@ class CountDownCommand(Base.ArgparseCommand):
             parser.set_defaults(
                 func=self._cmd_delete)
 
+        if self.CMD_NEXT not in disabled_commands:
+            parser = subparsers.add_parser(
+                "next",
+                help="List upcoming events")
+            parser.add_argument(
+                "-n", "--count",
+                type=int,
+                default=None,
+                help="Maximum number of events to list")
+            parser.add_argument(
+                "-w", "--within",
+                type=float,
+                default=None,
+                metavar="HOURS",
+                help="Only list events happening within the given number of"
+                " hours")
+            parser.set_defaults(
+                func=self._cmd_next)
+
         if self.CMD_SAVE not in disabled_commands:
             parser = subparsers.add_parser(
                 "save",
@@ -197,25 +353,41 @@ class CountDownCommand(Base.ArgparseCommand):
         if 'func' in args:
             args.func(msg, args, errorSink=errorSink)
         else:
-            events = sorted(
-                self.store.events.values(), 
-                key=lambda e: e.target_date
-            )
-            for event in events:
-                now = datetime.utcnow()
-                now = now.replace(tzinfo=pytz.utc)
-                Δt = event.target_date - now
-                if event.target_date > now:
-                    preposition = "in"
-                else:
-                    Δt = -Δt
-                    preposition = "since"
-
-                self.reply(msg, "{} {} {} ".format(event.name,
-                                                   preposition,
-                                                   self.date_formatter(Δt)))
+            self._reply_events(
+                msg,
+                [self.store.events[name] for _, name in self.store.index])
         return True
 
+    def _reply_events(self, msg, events):
+        for event in events:
+            now = datetime.utcnow()
+            now = now.replace(tzinfo=pytz.utc)
+            Δt = event.target_date - now
+            if event.target_date > now:
+                preposition = "in"
+            else:
+                Δt = -Δt
+                preposition = "since"
+
+            self.reply(msg, "{} {} {} ".format(event.name,
+                                               preposition,
+                                               self.date_formatter(Δt)))
+
+    def _cmd_next(self, msg, args, errorSink=None):
+        now = datetime.utcnow().replace(tzinfo=pytz.utc)
+        if args.within is not None:
+            events = self.store.events_between(
+                now, now + timedelta(hours=args.within))
+            if args.count is not None:
+                events = events[:args.count]
+        else:
+            events = self.store.upcoming(count=args.count or 1, now=now)
+
+        if not events:
+            self.reply(msg, "No upcoming events.")
+            return
+        self._reply_events(msg, events)
+
     def _cmd_add(self, msg, args, errorSink=None):
         try:
             self.store.add_event(args.name,
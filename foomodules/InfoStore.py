@@ -1,10 +1,15 @@
+import logging
 import shlex
 import pickle
 import sys
+import threading
+import time
 
 import foomodules.Base as Base
 import foomodules.urllookup as urllookup
 
+logger = logging.getLogger(__name__)
+
 class Nugget(object):
     def __init__(self, name, contents, keywords=[]):
         self.name = name
@@ -27,10 +32,20 @@ class Store(object):
             max_info_count=2048,
             max_info_length=2048,
             max_keyword_length=64,
-            max_name_length=64):
+            max_name_length=64,
+            preview_refresh_interval=3600,
+            executor=None):
         self.keywords = {}
         self.names = {}
         self.url_lookup = url_lookup
+        # url -> (timestamp, lines); not persisted, rebuilt after load
+        self.previews = {}
+        self._pending_previews = set()
+        self._previews_lock = threading.Lock()
+        # previews are fetched on the command pool, never on the event or
+        # scheduler thread
+        self.executor = executor
+        self.preview_refresh_interval = float(preview_refresh_interval)
         self.data_filename = data_filename
         self.min_name_length = int(min_name_length)
         self.min_keyword_length = int(min_keyword_length)
@@ -147,6 +162,82 @@ class Store(object):
         info.name = newname
         self.names[newname] = info
 
+    def get_url(self, info):
+        if not self.url_lookup:
+            return None
+        m = self.url_lookup.url_re.match(info.contents)
+        if m is None:
+            return None
+        return m.group(0)
+
+    def get_preview(self, url):
+        try:
+            _, lines = self.previews[url]
+        except KeyError:
+            return None
+        return lines
+
+    def fetch_preview(self, url):
+        url_lookup = self.url_lookup
+        try:
+            metadata = url_lookup.document_from_url(None, url)
+            lines = list(url_lookup.response_formatter(None, metadata))
+        except urllookup.URLLookupError as err:
+            logger.warn("could not fetch preview for %s: %s", url, err)
+            with self._previews_lock:
+                if url not in self.previews:
+                    # remember the failure, it will be retried on refresh
+                    self.previews[url] = (
+                        time.time(),
+                        ["sorry, I could not look that up: {0}".format(err)])
+        except Exception:
+            # nobody waits for the future, so this would go unnoticed
+            logger.exception("failed to fetch preview for %s", url)
+        else:
+            with self._previews_lock:
+                self.previews[url] = (time.time(), lines)
+        finally:
+            with self._previews_lock:
+                self._pending_previews.discard(url)
+
+    def prefetch_preview(self, url):
+        """
+        Fetch the preview of *url* on the executor, unless that is already
+        pending.
+        """
+        with self._previews_lock:
+            if url in self._pending_previews:
+                return
+            self._pending_previews.add(url)
+        executor = self.executor or Base.get_default_executor()
+        future = executor.submit(
+            "infostore-preview-{0}".format(url),
+            self.fetch_preview,
+            url)
+        if future is None:
+            with self._previews_lock:
+                self._pending_previews.discard(url)
+
+    def prefetch_previews(self):
+        urls = set(filter(None, map(self.get_url, list(self.names.values()))))
+        with self._previews_lock:
+            urls -= set(self.previews)
+        for url in urls:
+            self.prefetch_preview(url)
+
+    def refresh_previews(self):
+        urls = set(filter(None, map(self.get_url, list(self.names.values()))))
+        with self._previews_lock:
+            for url in set(self.previews) - urls:
+                del self.previews[url]
+            timestamps = {url: self.previews.get(url, (0, None))[0]
+                          for url in urls}
+
+        threshold = time.time() - self.preview_refresh_interval
+        for url, timestamp in timestamps.items():
+            if timestamp <= threshold:
+                self.prefetch_preview(url)
+
 class InfoCommand(Base.ArgparseCommand):
     CMD_STORE = "store"
     CMD_MOVE = "mv"
@@ -186,7 +277,7 @@ class InfoCommand(Base.ArgparseCommand):
             parser.add_argument(
                 "contents",
                 help="Contents of the information. URLs will be looked "
-                     "up on retrieval of the information.")
+                     "up when storing the information.")
             parser.set_defaults(
                 func=self._cmd_store)
 
@@ -293,8 +384,14 @@ class InfoCommand(Base.ArgparseCommand):
             self.store.store_info(args.name, args.contents, keywords=(args.tags or []))
         except ValueError as err:
             self.reply(msg, "Sorry, {0}".format(err))
+            return
         except KeyError as err:
             self.reply(msg, "Sorry, that name is already assigned".format(err))
+            return
+
+        url = self.store.get_url(self.store.names[args.name])
+        if url is not None:
+            self.store.prefetch_preview(url)
 
     def _cmd_amend(self, msg, args, errorSink=None):
         if not args.add and not args.remove:
@@ -386,29 +483,38 @@ class KeywordListener(Base.PrefixListener):
         super().__init__(prefix, **kwargs)
         self.prefix = prefix
         self.store = store
+        self._refresh_uid = "{0!r}.refresh_previews".format(self)
+
+    def _xmpp_changed(self, old_value, new_value):
+        super()._xmpp_changed(old_value, new_value)
+        if not self.store.url_lookup:
+            return
+        if old_value is not None:
+            old_value.scheduler.remove(self._refresh_uid)
+        if new_value is not None:
+            if self.store.preview_refresh_interval > 0:
+                new_value.scheduler.add(
+                    self._refresh_uid,
+                    self.store.preview_refresh_interval,
+                    self.store.refresh_previews,
+                    repeat=True)
+            self.store.prefetch_previews()
 
     def _match(self, info, msg):
         contents = info.contents
-        if self.store.url_lookup:
-            url_lookup = self.store.url_lookup
-            m = url_lookup.url_re.match(contents)
-            if m:
-                url = m.group(0)
-                try:
-                    iterable = iter(url_lookup.format_reply_to_url(msg, url))
-                    try:
-                        first_line = next(iterable)
-                    except StopIteration:
-                        return
-                except urllookup.URLLookupError as err:
-                    first_line = "sorry, I could not look that up: {0}".format(str(err))
-                    iterable = iter([])
+        url = self.store.get_url(info)
+        if url is not None:
+            lines = self.store.get_preview(url)
+            if lines is None:
+                # not fetched yet; never block the handler on the lookup
+                self.store.prefetch_preview(url)
+            elif lines:
                 self.reply(msg, "{0}: {1} – {2}".format(
                     info.name,
                     contents,
-                    first_line
+                    lines[0]
                 ))
-                for line in iterable:
+                for line in lines[1:]:
                     self.reply(msg, line)
                 return
 
@@ -43,6 +43,8 @@ def _format_analysis(self, analysis):
 
 
 class Game(Base.ArgparseCommand):
+    blocking = True
+
     def __init__(self, command_name="!game", **kwargs):
         super().__init__(command_name, **kwargs)
 
@@ -184,6 +186,8 @@ class Game(Base.ArgparseCommand):
 
 
 class Games(Base.ArgparseCommand):
+    blocking = True
+
     def __init__(self, command_name="!games", **kwargs):
         super().__init__(command_name, **kwargs)
 
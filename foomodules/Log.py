@@ -1,8 +1,18 @@
 import abc
-from datetime import datetime, timedelta
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import BufferedSink
 
 import foomodules.Base as Base
 
+logger = logging.getLogger(__name__)
+
 class LogFormat(object, metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def format_message_groupchat(self, msg):
@@ -65,14 +75,228 @@ class IRSSILogFormat(LogFormat):
             oldnick=oldnick,
             newnick=newnick)
 
+class LogWriter(BufferedSink.BufferedSink):
+    """
+    Append lines to *filename* from a background thread, see
+    :class:`BufferedSink.BufferedSink` for the flush policy.
+
+    If *rotate* is true, the file is closed when the UTC day changes and
+    renamed to ``<filename>.<YYYY-MM-DD>``; with *compress*, the closed
+    file is gzipped afterwards.
+    """
+
+    def __init__(self, filename,
+                 rotate=False,
+                 compress=False,
+                 buffer_size=64*1024,
+                 **kwargs):
+        self.filename = filename
+        self.rotate = rotate
+        self.compress = compress
+        self.buffer_size = buffer_size
+
+        self._file = None
+        self._file_date = None
+        super().__init__(filename, **kwargs)
+
+    def write(self, line, timestamp=None):
+        """
+        Queue *line* for writing. *timestamp* (UTC) decides which file the
+        line ends up in when rotating.
+        """
+        self._submit((timestamp or datetime.utcnow(), line))
+
+    def _rotated_name(self, date):
+        return "{}.{:%Y-%m-%d}".format(self.filename, date)
+
+    def _open(self, date):
+        if self.rotate and os.path.exists(self.filename):
+            # a file left from a previous run belongs to the day it was
+            # last written to
+            mdate = datetime.utcfromtimestamp(
+                os.path.getmtime(self.filename)).date()
+            if mdate != date:
+                self._archive(mdate)
+        self._file = open(self.filename, "a", buffering=self.buffer_size)
+        self._file_date = date
+
+    def _archive(self, date):
+        target = self._rotated_name(date)
+        os.replace(self.filename, target)
+        if not self.compress:
+            return
+        try:
+            with open(target, "rb") as fin:
+                with gzip.open(target + ".gz", "wb") as fout:
+                    shutil.copyfileobj(fin, fout)
+        except OSError as err:
+            logger.warn("failed to compress %s: %s", target, err)
+            return
+        os.unlink(target)
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def _write(self, item):
+        timestamp, line = item
+        date = timestamp.date()
+        if self._file is not None and self.rotate and date != self._file_date:
+            self._close()
+            self._archive(self._file_date)
+        if self._file is None:
+            self._open(date)
+        self._file.write(line + "\n")
+
+
+class LogIndex(BufferedSink.BufferedSink):
+    """
+    Full-text index of room messages in an SQLite database at *filename*.
+
+    Messages are inserted from a background thread in batches (see
+    :class:`BufferedSink.BufferedSink`). If the SQLite library lacks FTS5, a plain table
+    is used and searches fall back to substring matching.
+    """
+
+    def __init__(self, filename, **kwargs):
+        self.filename = filename
+        self._write_conn = None
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self.fts = self._setup(self._read_conn)
+        super().__init__(filename, **kwargs)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.filename, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _setup(self, conn):
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen ("
+                " room TEXT NOT NULL,"
+                " nick TEXT NOT NULL,"
+                " timestamp REAL NOT NULL,"
+                " body TEXT NOT NULL,"
+                " PRIMARY KEY (room, nick))")
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                    " room UNINDEXED, nick, timestamp UNINDEXED, body)")
+            except sqlite3.OperationalError as err:
+                logger.warn("no FTS5 support in sqlite (%s), log searches "
+                            "will be slow", err)
+            else:
+                return True
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages_plain ("
+                " room TEXT NOT NULL,"
+                " nick TEXT NOT NULL,"
+                " timestamp REAL NOT NULL,"
+                " body TEXT NOT NULL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS messages_plain_room_time"
+                " ON messages_plain (room, timestamp)")
+            return False
+
+    def add_message(self, room, nick, body, timestamp=None):
+        timestamp = timestamp or datetime.utcnow()
+        self._submit((
+            str(room),
+            nick,
+            timestamp.replace(tzinfo=timezone.utc).timestamp(),
+            body))
+
+    def _write(self, item):
+        if self._write_conn is None:
+            self._write_conn = self._connect()
+        if self.fts:
+            self._write_conn.execute(
+                "INSERT INTO messages (room, nick, timestamp, body)"
+                " VALUES (?, ?, ?, ?)", item)
+        else:
+            self._write_conn.execute(
+                "INSERT INTO messages_plain (room, nick, timestamp, body)"
+                " VALUES (?, ?, ?, ?)", item)
+        self._write_conn.execute(
+            "INSERT OR REPLACE INTO seen (room, nick, timestamp, body)"
+            " VALUES (?, ?, ?, ?)", item)
+
+    def _flush(self):
+        if self._write_conn is not None:
+            self._write_conn.commit()
+
+    def _close(self):
+        if self._write_conn is not None:
+            self._write_conn.close()
+            self._write_conn = None
+
+    def _to_result(self, row):
+        room, nick, timestamp, body = row
+        return (room, nick, datetime.utcfromtimestamp(timestamp), body)
+
+    def search(self, room, query, limit=5):
+        """
+        Return up to *limit* ``(room, nick, timestamp, body)`` tuples from
+        *room* matching *query*, newest first.
+        """
+        with self._read_lock:
+            if self.fts:
+                # quote each term so that user input is never interpreted
+                # as FTS query syntax
+                terms = " ".join(
+                    '"{}"'.format(term.replace('"', '""'))
+                    for term in query.split())
+                cursor = self._read_conn.execute(
+                    "SELECT room, nick, timestamp, body FROM messages"
+                    " WHERE messages MATCH ? AND room = ?"
+                    " ORDER BY timestamp DESC LIMIT ?",
+                    ("body : ({})".format(terms), str(room), limit))
+            else:
+                cursor = self._read_conn.execute(
+                    "SELECT room, nick, timestamp, body FROM messages_plain"
+                    " WHERE room = ? AND instr(lower(body), lower(?)) > 0"
+                    " ORDER BY timestamp DESC LIMIT ?",
+                    (str(room), query, limit))
+            return list(map(self._to_result, cursor))
+
+    def last_seen(self, room, nick):
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT room, nick, timestamp, body FROM seen"
+                " WHERE room = ? AND nick = ?",
+                (str(room), nick)).fetchone()
+        if row is None:
+            return None
+        return self._to_result(row)
+
+
 class LogToFile(Base.XMPPObject):
     def __init__(self,
                  logfile,
                  target_jid,
                  format,
+                 flush_lines=64,
+                 flush_interval=5.0,
+                 rotate=False,
+                 compress=False,
+                 index=None,
                  **kwargs):
         super().__init__(**kwargs)
-        self._logfile = open(logfile, "a")
+        self._index = index
+        self._logfile = LogWriter(
+            logfile,
+            flush_count=flush_lines,
+            flush_interval=flush_interval,
+            rotate=rotate,
+            compress=compress)
         self._target_jid = target_jid
         self._format = format
         self._last_entry = None
@@ -86,10 +310,10 @@ class LogToFile(Base.XMPPObject):
             t2 = self._last_entry.day, self._last_entry.month, \
                  self._last_entry.year
             if t1 != t2:
-                self._logfile.write(self._format.format_daychange() + "\n")
-            self._last_entry = datetime.utcnow()
-        self._logfile.write(text + "\n")
-        self._logfile.flush()
+                self._logfile.write(self._format.format_daychange(),
+                                    curr_time)
+        self._last_entry = curr_time
+        self._logfile.write(text, curr_time)
 
     def _start_logging(self):
         self._log(self._format.format_log_start())
@@ -99,6 +323,7 @@ class LogToFile(Base.XMPPObject):
         if old_value is not None:
             old_value.del_event_handler("muc::{}::presence".format(self._target_jid), self.handle_presence)
             old_value.del_event_handler("muc::{}::message".format(self._target_jid), self.handle_message)
+            self._logfile.flush()
         if new_value is not None:
             new_value.add_event_handler("muc::{}::presence".format(self._target_jid), self.handle_presence)
             new_value.add_event_handler("muc::{}::message".format(self._target_jid), self.handle_message)
@@ -123,3 +348,82 @@ class LogToFile(Base.XMPPObject):
 
     def handle_message(self, msg):
         self._log(self._format.format_message_groupchat(msg))
+        if self._index is not None:
+            self._index.add_message(
+                msg["from"].bare,
+                msg["from"].resource,
+                msg["body"],
+                self._last_entry)
+
+
+class LogQueryCommand(Base.ArgparseCommand, metaclass=abc.ABCMeta):
+    def __init__(self, index, command_name, **kwargs):
+        super().__init__(command_name, **kwargs)
+        self.index = index
+        self.argparse.add_argument(
+            "-r", "--room",
+            default=None,
+            help="Room to query (defaults to the room the command is used"
+            " in)")
+
+    def _format_timestamp(self, timestamp):
+        return "{:%Y-%m-%d %H:%M:%S}".format(timestamp)
+
+    def _call(self, msg, args, errorSink=None):
+        room = args.room
+        if room is None:
+            if msg["type"] != "groupchat":
+                self.reply(msg, "Please specify a room with --room")
+                return
+            room = msg["from"].bare
+        self._query(msg, room, args)
+
+    @abc.abstractmethod
+    def _query(self, msg, room, args):
+        pass
+
+
+class GrepCommand(LogQueryCommand):
+    def __init__(self, index, command_name="grep", max_results=5, **kwargs):
+        super().__init__(index, command_name, **kwargs)
+        self.max_results = max_results
+        self.argparse.add_argument(
+            "-n", "--count",
+            type=int,
+            default=3,
+            help="Number of results to show (at most {})".format(max_results))
+        self.argparse.add_argument(
+            "terms",
+            nargs="+",
+            help="Words to search for")
+
+    def _query(self, msg, room, args):
+        limit = max(1, min(args.count, self.max_results))
+        results = self.index.search(room, " ".join(args.terms), limit=limit)
+        if not results:
+            self.reply(msg, "No matches.")
+            return
+        for _, nick, timestamp, body in results:
+            self.reply(msg, "[{}] <{}> {}".format(
+                self._format_timestamp(timestamp),
+                nick,
+                body))
+
+
+class SeenCommand(LogQueryCommand):
+    def __init__(self, index, command_name="seen", **kwargs):
+        super().__init__(index, command_name, **kwargs)
+        self.argparse.add_argument(
+            "nick",
+            help="Nickname to look for")
+
+    def _query(self, msg, room, args):
+        result = self.index.last_seen(room, args.nick)
+        if result is None:
+            self.reply(msg, "I have not seen {} here.".format(args.nick))
+            return
+        _, nick, timestamp, body = result
+        self.reply(msg, "{} was last seen at {}, saying: {}".format(
+            nick,
+            self._format_timestamp(timestamp),
+            body))
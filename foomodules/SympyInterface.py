@@ -1,68 +1,268 @@
 import SympyComm
+import collections
+import concurrent.futures
+import errno
+import logging
 import os
+import signal
 import socket
+import threading
 import re
 
 import foomodules.Base as Base
 
+logger = logging.getLogger(__name__)
+
+class Worker(object):
+    """
+    A sympy daemon process speaking protocol version 2. Requests from
+    several threads are pipelined on the socket; a reader thread hands the
+    results to the waiting callers by request id.
+
+    The daemon works through the requests in order, so a request starts
+    when the result of the one before it arrives; the ``started`` event of
+    the returned future is set then.
+    """
+
+    def __init__(self, pid, sock, on_death):
+        super().__init__()
+        self.pid = pid
+        self.sock = sock
+        self.pending = {}
+        # futures of the requests in flight, in the order they were sent
+        self._order = collections.deque()
+        self._on_death = on_death
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._dead = False
+        self._reader = threading.Thread(
+            target=self._read_results,
+            name="sympy worker {} reader".format(pid))
+        self._reader.daemon = True
+
+    def start(self):
+        self._reader.start()
+
+    def submit(self, unit, expr):
+        future = concurrent.futures.Future()
+        future.started = threading.Event()
+        with self._lock:
+            if self._dead:
+                raise socket.error(errno.EPIPE, "worker is dead")
+            request_id = self._next_id
+            self._next_id = (self._next_id + 1) & 0xffffffff
+            self.pending[request_id] = future
+            try:
+                SympyComm.send_calc_v2(self.sock, request_id, unit, expr)
+            except socket.error:
+                del self.pending[request_id]
+                raise
+            self._order.append(future)
+            if len(self._order) == 1:
+                future.started.set()
+        return future
+
+    def _read_results(self):
+        try:
+            while True:
+                request_id, state, text = SympyComm.recv_result_v2(self.sock)
+                with self._lock:
+                    future = self.pending.pop(request_id, None)
+                    if future is not None:
+                        self._order.remove(future)
+                        if self._order:
+                            self._order[0].started.set()
+                if future is not None:
+                    future.set_result((state, text))
+        except (socket.error, ValueError) as err:
+            if not self._dead:
+                logger.warning("sympy worker %d died: %s", self.pid, err)
+        self._on_death(self)
+
+    def _fail_pending(self, message):
+        with self._lock:
+            self._dead = True
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self._order.clear()
+        for future in pending:
+            future.started.set()
+            if not future.done():
+                future.set_result((False, message))
+
+    def kill(self):
+        self._fail_pending(b"server side error: worker terminated")
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        try:
+            os.waitpid(self.pid, 0)
+        except ChildProcessError:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
 class Daemon(Base.XMPPObject):
-    def __init__(self, executable):
+    """
+    Pool of *workers* pre-forked sympy daemon processes.
+
+    Each request goes to the worker with the fewest requests in flight;
+    requests are pipelined on the worker's socket. Requests wait up to
+    *queue_timeout* seconds for a worker to be ready and to get to them. A
+    calculation may then take *timeout* seconds, after which its worker is
+    killed (failing the other requests queued on it). Dead workers are replaced in the
+    background, and a new worker only joins the pool once it has finished
+    importing sympy.
+
+    *cpu_limit* (seconds per calculation) and *memory_limit* (bytes of
+    address space) are enforced by the workers with rlimits; *cache_size*
+    results are cached in each worker.
+    """
+
+    def __init__(self, executable,
+                 workers=2,
+                 timeout=3,
+                 queue_timeout=5,
+                 startup_timeout=60,
+                 cpu_limit=None,
+                 memory_limit=None,
+                 cache_size=256):
         super().__init__()
         self.executable = executable
-        self.childpid = 0
-        self.sock = None
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.startup_timeout = startup_timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.cache_size = cache_size
+        self._alive = set()
+        self._cond = threading.Condition()
+        self._generation = 0
 
-    def _kill_child(self):
-        os.kill(self.childpid)
-        os.waitpid(self.childpid, 0)
-        self.childpid = 0
-        self.sock = None
+    def _worker_argv(self, fd):
+        argv = [self.executable, str(fd), "--protocol=2",
+                "--cache-size={:d}".format(self.cache_size)]
+        if self.cpu_limit is not None:
+            argv.append("--cpu-limit={:d}".format(self.cpu_limit))
+        if self.memory_limit is not None:
+            argv.append("--memory-limit={:d}".format(self.memory_limit))
+        return argv
 
-    def _spawn_child(self):
-        self.sock, slavesock = socket.socketpair()
+    def _spawn_worker(self, generation):
+        sock, slavesock = socket.socketpair()
+        slavesock.set_inheritable(True)
+        argv = self._worker_argv(slavesock.fileno())
         pid = os.fork()
         if pid == 0:
-            os.execv(self.executable, [self.executable, str(slavesock.fileno())])
-        self.childpid = pid
-        self.sock.settimeout(3)
+            try:
+                sock.close()
+                os.execv(self.executable, argv)
+            finally:
+                os._exit(127)
+        slavesock.close()
+        worker = Worker(pid, sock, self._retire)
 
-    def _respawn_child(self):
-        if self.childpid != 0:
-            self._kill_child()
-        self._spawn_child()
+        sock.settimeout(self.startup_timeout)
+        try:
+            SympyComm.recv_ready(sock)
+        except (socket.error, ValueError) as err:
+            logger.error("sympy worker %d failed to start: %s", pid, err)
+            worker.kill()
+            return
+        sock.settimeout(None)
+
+        with self._cond:
+            if generation == self._generation:
+                self._alive.add(worker)
+                self._cond.notify_all()
+                worker.start()
+                return
+        # the pool was shut down while we were starting up
+        worker.kill()
+
+    def _spawn_in_background(self):
+        thread = threading.Thread(
+            target=self._spawn_worker,
+            args=(self._generation,),
+            name="sympy worker spawner")
+        thread.daemon = True
+        thread.start()
+
+    def _retire(self, worker):
+        with self._cond:
+            if worker not in self._alive:
+                return
+            self._alive.remove(worker)
+        worker.kill()
+        self._spawn_in_background()
+
+    def _stop_all(self):
+        with self._cond:
+            self._generation += 1
+            workers = list(self._alive)
+            self._alive.clear()
+        for worker in workers:
+            worker.kill()
 
     def _xmpp_changed(self, old_value, new_value):
-        if self.childpid != 0:
-            self._kill_child()
+        self._stop_all()
 
         if new_value is not None:
-            self._spawn_child()
+            for i in range(self.workers):
+                self._spawn_in_background()
 
         super()._xmpp_changed(old_value, new_value)
 
+    def _get_worker(self):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._alive,
+                                       timeout=self.queue_timeout):
+                return None
+            return min(self._alive, key=lambda worker: len(worker.pending))
+
     def __call__(self, expr, unit):
-        if self.sock is None:
-            raise ValueError("Not connected to a child. This should not happen")
+        worker = self._get_worker()
+        if worker is None:
+            return False, b"server side error: no worker available"
 
         try:
-            SympyComm.send_calc(self.sock, unit, expr)
-            self.sock.settimeout(3)
-            try:
-                return SympyComm.recv_result(self.sock)
-            except socket.timeout:
-                self._respawn_child()
-                return False, "server side error: computation timed out"
+            future = worker.submit(unit, expr)
         except socket.error as err:
+            self._retire(worker)
             if err.errno == errno.EPIPE:
-                self._kill_child()
-                return False, "server side error: broken pipe"
+                return False, b"server side error: broken pipe"
+            return False, "server side error: {}".format(err).encode("utf-8")
+
+        # the calculation timeout only starts once the worker has finished
+        # the requests queued before this one
+        if not future.started.wait(self.queue_timeout):
+            return False, b"server side error: worker busy"
+
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            self._retire(worker)
+            return False, b"server side error: computation timed out"
 
 class Calc(Base.MessageHandler):
     unit_regex = re.compile("^\s*(as|in)\s+(\S+)(.*)$")
 
-    def __init__(self, daemon):
+    def __init__(self, daemon, executor=None):
         super().__init__()
         self.daemon = daemon
+        self.executor = executor
+
+    def _calc(self, msg, expr, unit):
+        state, text = self.daemon(expr, unit)
+        if not state:
+            self.reply(msg, "computation failed: {}".format(text.decode("utf-8")))
+        else:
+            self.reply(msg, text.decode("utf-8"))
 
     def __call__(self, msg, arguments, errorSink=None):
         m = self.unit_regex.match(arguments)
@@ -72,9 +272,11 @@ class Calc(Base.MessageHandler):
         else:
             unit = b"1"
             expr = arguments
+        expr = expr.encode("ascii")
 
-        state, text = self.daemon(expr.encode("ascii"), unit)
-        if not state:
-            self.reply(msg, "computation failed: {}".format(text.decode("utf-8")))
-        else:
-            self.reply(msg, text.decode("utf-8"))
+        # run on the worker pool so that concurrent calculations do not
+        # wait for each other (or block the XMPP thread)
+        executor = self.executor or Base.get_default_executor()
+        if executor.submit(str(msg["from"]), self._calc,
+                           msg, expr, unit) is None:
+            self.reply(msg, Base.ArgparseCommand.busy_message)
@@ -1,8 +1,10 @@
+import RateLimit
+import TimerWheel
+
 import foomodules.Base as Base
 
 import logging
 import random
-import time
 import itertools
 from datetime import datetime, timedelta
 
@@ -10,35 +12,70 @@ class Timer(Base.XMPPObject):
     def __init__(self, do=[], **kwargs):
         super().__init__(**kwargs)
         self._do = do
-        self._uid = str(self)+str(time.time())+str(random.randint(0, 65535))
+        # also the job name on the timer wheel, so keep it readable
+        self._uid = "{}@{:x}".format(type(self).__name__, id(self))
 
     def _xmpp_changed(self, old_value, new_value):
         for cmd in filter(lambda x: isinstance(x, Base.XMPPObject), self._do):
             cmd.XMPP = new_value
 
 class RepeatingTimer(Timer):
-    def __init__(self, **kwargs):
+    """
+    Run the commands in *do* repeatedly on the shared
+    :class:`TimerWheel.TimerWheel` (or *wheel*). Subclasses either set
+    :attr:`interval` for a fixed period, or implement
+    :meth:`_calc_next_trigger` to compute each trigger date.
+    """
+
+    interval = None
+
+    def __init__(self, wheel=None, jitter=0, policy=TimerWheel.SKIP,
+                 **kwargs):
         super().__init__(**kwargs)
+        self._wheel = wheel
+        self._jitter = jitter
+        self._policy = policy
         self._loaded = False
 
+    @property
+    def wheel(self):
+        if self._wheel is None:
+            self._wheel = TimerWheel.get_default_wheel()
+        return self._wheel
+
     def _xmpp_changed(self, old_value, new_value):
         super()._xmpp_changed(old_value, new_value)
         if old_value is not None and self._loaded:
-            old_value.scheduler.remove(self._uid)
+            self.wheel.remove(self._uid)
             self._loaded = False
         if new_value is not None:
             self._load()
 
     def _load(self):
-        delay = (self._calc_next_trigger() - datetime.utcnow()).total_seconds()
-        logging.info("repeating timer loaded with Δt=%.4fs", delay)
-        self.XMPP.scheduler.add(
-            self._uid,
-            delay,
-            self._on_timer
-        )
+        if self.interval is not None:
+            logging.info("repeating timer loaded with interval %.4fs",
+                         self.interval)
+            self.wheel.add(
+                self._uid,
+                self.interval,
+                self._on_timer,
+                jitter=self._jitter,
+                policy=self._policy)
+        else:
+            delay = (self._calc_next_trigger() - datetime.utcnow()).total_seconds()
+            logging.info("repeating timer loaded with Δt=%.4fs", delay)
+            self.wheel.add_once(
+                self._uid,
+                max(delay, 0),
+                self._on_trigger)
         self._loaded = True
 
+    def _on_trigger(self):
+        # calendar based: compute the next date from the wall clock again,
+        # so that the trigger stays aligned to it
+        self._load()
+        self._on_timer()
+
     def _on_timer(self):
         for cmd in self._do:
             cmd()
@@ -59,13 +96,40 @@ class EachDay(RepeatingTimer):
 class EveryInterval(RepeatingTimer):
     def __init__(self, interval, **kwargs):
         self.seconds = interval
+        self.interval = interval
         super().__init__(**kwargs)
 
     def _calc_next_trigger(self):
         return datetime.utcnow() + timedelta(seconds=self.seconds)
 
 
-class RateLimitService(EveryInterval):
+class TimerStats(Base.MessageHandler):
+    """
+    Reply with the runtime statistics of the jobs on the shared timer
+    wheel, slowest first.
+    """
+
+    def __init__(self, wheel=None, **kwargs):
+        super().__init__(**kwargs)
+        self._wheel = wheel
+
+    def __call__(self, msg, arguments, errorSink=None):
+        if arguments.strip():
+            return
+        wheel = self._wheel or TimerWheel.get_default_wheel()
+        lines = TimerWheel.format_stats(wheel.stats())
+        self.reply(msg, "\n".join(lines) if lines else "no timers")
+
+
+class RateLimitService(Base.XMPPObject):
+    """
+    Allow each sender *cmds_per_minute* commands per minute on average, with
+    bursts of up to *burst* commands (defaults to *cmds_per_minute*). Senders
+    are tracked by full JID and message type in a
+    :class:`RateLimit.TokenBucketLimiter` holding at most *max_keys*
+    entries.
+    """
+
     warning_messages = [
         "Hey, I need a break please",
         "Sorry, I'm busy with guessing your root password",
@@ -77,20 +141,19 @@ class RateLimitService(EveryInterval):
 
     def __init__(self, cmds_per_minute,
             warning_messages=None,
+            burst=None,
+            max_keys=1024,
             **kwargs):
+        super().__init__(**kwargs)
         self.cmds_per_minute = cmds_per_minute
-        self.limit_dict = {}
+        self.limiter = RateLimit.TokenBucketLimiter(
+            cmds_per_minute / 60,
+            burst or cmds_per_minute,
+            max_keys=max_keys)
         self.warning_messages = warning_messages or self.warning_messages
-        kwargs.pop("do", None)
-        super().__init__(10, do=[self._decrease])
 
     def _xmpp_changed(self, old_value, new_value):
-        self.limit_dict = {}
-
-    def _decrease(self):
-        self.limit_dict = dict(
-            (k, max(0, v-int(math.ceil(self.cmds_per_minute/6))))
-            for k, v in self.limit_dict.items())
+        self.limiter.clear()
 
     @property
     def warning_message(self):
@@ -98,12 +161,4 @@ class RateLimitService(EveryInterval):
 
     def check_and_count(self, msg):
         rate_limit_key = str(msg["from"]), msg["type"]
-        try:
-            value = self.limit_dict[rate_limit_key]
-            if value > self.cmds_per_minute:
-                return False
-            else:
-                self.limit_dict[rate_limit_key] += 1
-        except KeyError:
-            self.limit_dict[rate_limit_key] = 1
-        return True
+        return self.limiter.consume(rate_limit_key)
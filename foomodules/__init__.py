@@ -28,6 +28,7 @@ class FoorlConfig(object):
         self.xmpp = None
         self.hooks = {}
         self.bindings = {}
+        self.routes = {}
         self.errorSink = None
         self.generic = []
         if import_path:
@@ -61,6 +62,7 @@ class FoorlConfig(object):
                 self.joinRoom(room, nick)
 
         self.bindings = self.module.bindings
+        self.routes = self._compile_routes(self.bindings)
         self.hooks = self.module.hooks
         self.localpart = self.module.localpart
         self.resource = self.module.resource
@@ -71,6 +73,17 @@ class FoorlConfig(object):
         for hook in self.hooks.get("session_start", []):
             hook()
 
+    @staticmethod
+    def _compile_routes(bindings):
+        # (jid, mtype) -> Bind, with the catch-all binding stored under None
+        routes = {}
+        for key, binding in bindings.items():
+            if key is None:
+                routes[None] = binding
+            else:
+                routes[key.fromJid, key.mtype] = binding
+        return routes
+
     def session_start(self, xmpp):
         self.xmpp = xmpp
         self.reload()
@@ -87,18 +100,13 @@ class FoorlConfig(object):
 
     def dispatch(self, msg):
         mtype = msg["type"]
-        key = Binding(msg["from"], mtype=mtype)
-        try:
-            binding = self.bindings[key]
-        except KeyError:
-            key = Binding(msg["from"].bare, mtype=mtype)
-            try:
-                binding = self.bindings[key]
-            except KeyError:
-                key = None
-                try:
-                    binding = self.bindings[key]
-                except KeyError:
+        routes = self.routes
+        binding = routes.get((str(msg["from"]), mtype))
+        if binding is None:
+            binding = routes.get((msg["from"].bare, mtype))
+            if binding is None:
+                binding = routes.get(None)
+                if binding is None:
                     logger.info("Dropping message from %s -- no matching binding", msg["from"])
                     return
 
@@ -154,6 +162,7 @@ class Bind(Base.MessageHandler):
             debug_memory_use=False, **kwargs):
         super().__init__(**kwargs)
         self.handlers = handlers
+        self._chain = Base.compile_handler_chain(handlers)
         self.errorSink = errorSink
         self.xmpp = None
         self.ignoreSelf = ignoreSelf
@@ -173,7 +182,7 @@ class Bind(Base.MessageHandler):
             import objgraph
             objgraph.show_growth()
         try:
-            for handler in self.handlers:
+            for handler in self._chain:
                 abort = handler(msg, errorSink=self.errorSink)
                 if abort:
                     break
@@ -0,0 +1,69 @@
+"""
+Compare polynomial division of :mod:`foomodules.polylib` against the
+original element-object implementation.
+
+Run with ``python3 -m foomodules.bench_polylib [p]``. The reference
+implementation is quadratic with a large constant, so it is only measured up
+to ``REFERENCE_LIMIT``.
+"""
+import random
+import sys
+import time
+
+from . import polylib
+
+DEGREES = [1000, 3000, 10000, 30000, 100000]
+REFERENCE_LIMIT = 3000
+
+
+def reference_divmod(field, lhs, rhs):
+    """
+    Long division on lists of :class:`polylib.IntField.IntFromField`, as
+    :class:`polylib.FieldPoly` used to do it.
+    """
+    lhs = list(field(lhs))
+    rhs = list(field(rhs)) + [field(0)] * (len(lhs) - len(rhs))
+    quot = [field(0)] * len(lhs)
+    rhs_deg = polylib.find_largest_nonzero(rhs)
+    lhs_deg = polylib.find_largest_nonzero(lhs)
+    while lhs_deg >= rhs_deg:
+        shift = lhs_deg - rhs_deg
+        quot[shift] += lhs[lhs_deg] // rhs[rhs_deg]
+        lhs = polylib.listsub(
+            lhs, [x * quot[shift] for x in polylib.listshift(rhs, shift)])
+        lhs_deg = polylib.find_largest_nonzero(lhs)
+    return quot, lhs
+
+
+def random_poly(p, degree):
+    return [random.randrange(p) for _ in range(degree)] + [
+        random.randrange(1, p)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(p=65537):
+    field = polylib.IntField(p)
+    print("{:>8s} {:>12s} {:>12s}".format("degree", "polylib", "reference"))
+    for degree in DEGREES:
+        lhs = random_poly(p, degree)
+        rhs = random_poly(p, degree // 2)
+        fast, (q, r) = timed(divmod,
+                             polylib.FieldPoly(field, lhs),
+                             polylib.FieldPoly(field, rhs))
+        if degree <= REFERENCE_LIMIT:
+            ref, (ref_q, ref_r) = timed(reference_divmod, field, lhs, rhs)
+            assert q == polylib.FieldPoly(field, ref_q)
+            assert r == polylib.FieldPoly(field, ref_r)
+            ref = "{:.3f}s".format(ref)
+        else:
+            ref = "-"
+        print("{:>8d} {:>11.3f}s {:>12s}".format(degree, fast, ref))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,187 @@
+"""
+In-process DNS lookups for the host/dig commands.
+
+This uses the asynchronous resolver of dnspython, so that lookups of several
+record types are sent out at the same time, and keeps answers cached for as
+long as their TTL allows. If dnspython is not installed, :data:`AVAILABLE`
+is false and the commands fall back to the command line tools.
+"""
+import asyncio
+import collections
+import ipaddress
+import socket
+import threading
+import time
+
+try:
+    import dns.asyncresolver
+    import dns.exception
+    import dns.rdatatype
+    import dns.resolver
+    import dns.reversename
+except ImportError:
+    dns = None
+
+AVAILABLE = dns is not None
+
+Record = collections.namedtuple("Record", ["name", "rdtype", "ttl", "text"])
+
+
+class DNSError(Exception):
+    pass
+
+
+class NXDomain(DNSError):
+    pass
+
+
+class TTLCache(object):
+    """
+    Cache lookup results until their TTL expires, holding at most
+    *max_entries* entries. TTLs are clamped to *max_ttl* seconds.
+    """
+
+    def __init__(self, max_entries=512, max_ttl=3600, clock=time.monotonic):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                return None
+            if expires <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl):
+        ttl = min(ttl, self.max_ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class Resolver(object):
+    """
+    Resolve names using *nameservers* (the system configuration if
+    :data:`None`) on *port*. *timeout* is the total time allowed per query.
+    Negative answers are cached for *negative_ttl* seconds.
+    """
+
+    def __init__(self, nameservers=None, port=53, timeout=2,
+                 negative_ttl=30, cache=None):
+        super().__init__()
+        if not AVAILABLE:
+            raise RuntimeError("dnspython is not installed")
+        self.nameservers = list(nameservers) if nameservers else None
+        self.port = port
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.cache = cache if cache is not None else TTLCache()
+
+    def _make_resolver(self, server):
+        nameservers = self.nameservers
+        if server is not None:
+            nameservers = [self._server_address(server)]
+        resolver = dns.asyncresolver.Resolver(configure=nameservers is None)
+        if nameservers is not None:
+            resolver.nameservers = nameservers
+        resolver.port = self.port
+        resolver.lifetime = self.timeout
+        return resolver
+
+    def _server_address(self, server):
+        try:
+            ipaddress.ip_address(server)
+        except ValueError:
+            pass
+        else:
+            return server
+        try:
+            infos = socket.getaddrinfo(server, self.port,
+                                       proto=socket.IPPROTO_UDP)
+        except socket.gaierror as err:
+            raise DNSError("couldn't get address for '{}': {}".format(
+                server, err.strerror))
+        return infos[0][4][0]
+
+    async def _query(self, resolver, server, qname, rdtype):
+        key = (qname.lower(), rdtype, server)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            answer = await resolver.resolve(qname, rdtype,
+                                            raise_on_no_answer=False)
+        except dns.resolver.NXDOMAIN:
+            result = NXDomain(qname)
+            self.cache.put(key, result, self.negative_ttl)
+            return result
+        except dns.exception.Timeout:
+            return DNSError("connection timed out; no servers could be "
+                            "reached")
+        except dns.resolver.NoNameservers:
+            return DNSError("no servers could be reached")
+        except dns.exception.DNSException as err:
+            return DNSError(str(err))
+
+        records = [
+            Record(rrset.name.to_text(omit_final_dot=True),
+                   dns.rdatatype.to_text(rrset.rdtype),
+                   rrset.ttl,
+                   rdata.to_text())
+            for rrset in answer.response.answer
+            for rdata in rrset
+        ]
+        if records:
+            ttl = min(record.ttl for record in records)
+        else:
+            ttl = self.negative_ttl
+        self.cache.put(key, records, ttl)
+        return records
+
+    async def _query_many(self, qname, rdtypes, server):
+        resolver = self._make_resolver(server)
+        return await asyncio.gather(*(
+            self._query(resolver, server, qname, rdtype)
+            for rdtype in rdtypes
+        ))
+
+    def query_many(self, qname, rdtypes, server=None):
+        """
+        Look up all *rdtypes* for *qname* concurrently. Return a list with
+        one entry per type: either a list of :class:`Record` (including any
+        CNAMEs followed on the way) or a :class:`DNSError` instance.
+        """
+        return asyncio.run(self._query_many(qname, rdtypes, server))
+
+    def query(self, qname, rdtype, server=None):
+        result, = self.query_many(qname, [rdtype], server=server)
+        if isinstance(result, DNSError):
+            raise result
+        return result
+
+    def reverse_name(self, address):
+        return dns.reversename.from_address(address).to_text(
+            omit_final_dot=True)
+
+
+_default_resolver = None
+
+def get_default_resolver():
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = Resolver()
+    return _default_resolver
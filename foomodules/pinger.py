@@ -0,0 +1,207 @@
+"""
+In-process latency probing for the ping command.
+
+Probes are sent as ICMP echo requests over unprivileged ICMP datagram
+sockets (``net.ipv4.ping_group_range`` must include the bot's group). If
+those are not permitted, TCP connection attempts to a fixed port are timed
+instead; a refused connection counts as a reply, too.
+
+All probes of a run are sent at once (with a small spacing), so a run takes
+about one round trip time plus the time to send them, not ``count ×
+interval``. :func:`probe` yields results as they come in.
+"""
+import collections
+import errno
+import math
+import os
+import select
+import socket
+import struct
+import time
+
+ICMP_HEADER = struct.Struct("!BBHHH")
+ICMP_ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+ICMP_ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+ICMP_PROTO = {
+    socket.AF_INET: socket.IPPROTO_ICMP,
+    socket.AF_INET6: socket.IPPROTO_ICMPV6,
+}
+
+ProbeResult = collections.namedtuple("ProbeResult", ["seq", "rtt"])
+
+
+class PingStats(collections.namedtuple(
+        "PingStats", ["sent", "received", "min", "avg", "max", "mdev"])):
+    """
+    Summary of a probe run; round trip times are in seconds and
+    :data:`None` if nothing was received.
+    """
+
+    @classmethod
+    def from_results(cls, sent, results):
+        rtts = [result.rtt for result in results if result.rtt is not None]
+        if not rtts:
+            return cls(sent, 0, None, None, None, None)
+        avg = sum(rtts) / len(rtts)
+        # same definition as iputils' ping
+        mdev = math.sqrt(max(0, sum(rtt*rtt for rtt in rtts) / len(rtts)
+                                - avg*avg))
+        return cls(sent, len(rtts), min(rtts), avg, max(rtts), mdev)
+
+    @property
+    def loss(self):
+        if not self.sent:
+            return 0
+        return 100 * (self.sent - self.received) // self.sent
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack("!{}H".format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def resolve(host, family=socket.AF_UNSPEC):
+    infos = socket.getaddrinfo(host, None, family, socket.SOCK_DGRAM)
+    family, _, _, _, sockaddr = infos[0]
+    return family, sockaddr[0]
+
+
+def _icmp_packet(family, seq):
+    payload = struct.pack("!d", time.monotonic()) + b"foorl ping"
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST[family], 0, 0, 0, seq)
+    csum = checksum(header + payload)
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST[family], 0, csum, 0, seq)
+    return header + payload
+
+
+def icmp_socket(family):
+    """
+    Return an unprivileged ICMP datagram socket, or raise
+    :class:`PermissionError` if the system does not allow them.
+    """
+    return socket.socket(family, socket.SOCK_DGRAM, ICMP_PROTO[family])
+
+
+def _run_probes(count, timeout, spacing, send, wait):
+    """
+    Drive a probe run: *send(seq)* is called for each probe, *spacing*
+    seconds apart, and *wait(timeout)* in between to collect replies; it
+    returns a list of ``(seq, receive_time)`` pairs (*receive_time* is
+    :data:`None` for a failed probe). Replies are collected while probes are
+    still being sent, so that the spacing does not add to the round trip
+    times.
+    """
+    sent_at = {}
+    next_seq = 0
+    next_send = time.monotonic()
+    deadline = None
+    while next_seq < count or sent_at:
+        now = time.monotonic()
+        if next_seq < count and now >= next_send:
+            sent_at[next_seq] = now
+            send(next_seq)
+            next_seq += 1
+            next_send = now + spacing
+            if next_seq == count:
+                deadline = time.monotonic() + timeout
+            continue
+
+        if next_seq < count:
+            wait_until = next_send
+        else:
+            wait_until = deadline
+            if now >= deadline:
+                break
+        for seq, received_at in wait(max(0, wait_until - now)):
+            try:
+                start = sent_at.pop(seq)
+            except KeyError:
+                continue
+            if received_at is None:
+                yield ProbeResult(seq, None)
+            else:
+                yield ProbeResult(seq, received_at - start)
+
+    for seq in sorted(sent_at):
+        yield ProbeResult(seq, None)
+
+
+def _icmp_probe(sock, family, address, count, timeout, spacing):
+    def send(seq):
+        sock.sendto(_icmp_packet(family, seq), (address, 0))
+
+    def wait(timeout):
+        readable, _, _ = select.select([sock], [], [], timeout)
+        if not readable:
+            return []
+        data = sock.recv(1024)
+        now = time.monotonic()
+        if len(data) < ICMP_HEADER.size:
+            return []
+        type_, _, _, _, seq = ICMP_HEADER.unpack_from(data)
+        if type_ != ICMP_ECHO_REPLY[family]:
+            return []
+        return [(seq, now)]
+
+    return _run_probes(count, timeout, spacing, send, wait)
+
+
+def _tcp_probe(family, address, port, count, timeout, spacing):
+    pending = {}
+
+    def send(seq):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        err = sock.connect_ex((address, port))
+        if err not in (0, errno.EINPROGRESS):
+            sock.close()
+            raise OSError(err, os.strerror(err))
+        pending[sock] = seq
+
+    def wait(timeout):
+        if not pending:
+            time.sleep(timeout)
+            return []
+        _, writable, _ = select.select([], list(pending), [], timeout)
+        now = time.monotonic()
+        results = []
+        for sock in writable:
+            seq = pending.pop(sock)
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            sock.close()
+            if err in (0, errno.ECONNREFUSED):
+                results.append((seq, now))
+            else:
+                results.append((seq, None))
+        return results
+
+    try:
+        yield from _run_probes(count, timeout, spacing, send, wait)
+    finally:
+        for sock in pending:
+            sock.close()
+
+
+def probe(family, address, count=5, timeout=2, spacing=0.005,
+          tcp_port=80):
+    """
+    Probe *address* *count* times. Return the method used (``"icmp"`` or
+    ``"tcp"``) and an iterator over :class:`ProbeResult` objects, in the
+    order the replies arrive; lost probes come last.
+    """
+    try:
+        sock = icmp_socket(family)
+    except PermissionError:
+        return "tcp", _tcp_probe(family, address, tcp_port, count, timeout,
+                                 spacing)
+
+    def results():
+        with sock:
+            yield from _icmp_probe(sock, family, address, count, timeout,
+                                   spacing)
+
+    return "icmp", results()
@@ -1,5 +1,4 @@
 #!/usr/bin/python3
-import itertools
 
 def listsub(a, b):
     if len(a) != len(b):
@@ -70,7 +69,7 @@ class IntField:
                 self._test_other(other)
                 if other.v == 0:
                     raise ZeroDivisionError()
-                return self * self.field.find_inverse(other)
+                return self.field(self.v * self.field.inverse(other.v))
 
         def __rfloordiv__(self, other):
             if isinstance(other, int):
@@ -87,6 +86,11 @@ class IntField:
         def __ne__(self, other):
             return not self == other
 
+        def __int__(self):
+            return self.v
+
+        __index__ = __int__
+
         def __str__(self):
             return str(self.v)
 
@@ -94,21 +98,74 @@ class IntField:
             return "IntFromField({!r}, {!r})".format(self.v, self.field)
 
 
+    #: fields up to this size may get a complete table of inverses
+    TABLE_LIMIT = 1 << 16
+    #: number of inverses to remember
+    CACHE_SIZE = 4096
+
     def __init__(self, p):
         self.p = p
+        self._inverse_table = None
         self._inverse_cache = {}
+        self._euclid_count = 0
+
+    def _build_inverse_table(self):
+        # inv(i) = -(p // i) * inv(p mod i), which holds for prime p
+        p = self.p
+        table = [0, 1 % p]
+        for i in range(2, p):
+            table.append(-(p // i) * table[p % i] % p)
+        return table
+
+    def _euclid_inverse(self, v):
+        p = self.p
+        r0, r1 = p, v
+        s0, s1 = 0, 1
+        while r1:
+            q = r0 // r1
+            r0, r1 = r1, r0 - q * r1
+            s0, s1 = s1, s0 - q * s1
+        if r0 != 1:
+            return None
+        return s0 % p
+
+    def inverse(self, v):
+        """
+        Return the inverse of the int *v* in this field as int, computed
+        with the extended euclidean algorithm and cached.
+
+        Fields with at most :attr:`TABLE_LIMIT` elements switch to a
+        complete table of inverses once about ``p/8`` of them have been
+        computed; building the table costs about as much as that many
+        euclidean runs, so it does not slow down the common case of a few
+        inversions in a fresh field.
+        """
+        p = self.p
+        v %= p
+        if self._inverse_table is not None:
+            inv = self._inverse_table[v]
+            if inv * v % p != 1:
+                inv = None
+        else:
+            try:
+                inv = self._inverse_cache[v]
+            except KeyError:
+                inv = self._euclid_inverse(v)
+                self._euclid_count += 1
+                if (p <= self.TABLE_LIMIT and
+                        self._euclid_count > p // 8):
+                    self._inverse_table = self._build_inverse_table()
+                    self._inverse_cache.clear()
+                else:
+                    if len(self._inverse_cache) >= self.CACHE_SIZE:
+                        self._inverse_cache.clear()
+                    self._inverse_cache[v] = inv
+        if inv is None:
+            raise ValueError("No inverse exists for {} in {}".format(v, self))
+        return inv
 
     def find_inverse(self, iff):
-        try:
-            return self._inverse_cache[iff.v]
-        except KeyError:
-            v = iff.v
-            p = self.p
-            for other in range(p):
-                if other*v % p == 1:
-                    self._inverse_cache[v] = other
-                    return self(other)
-            raise ValueError("No inverse exists for {} in {}".format(iff.v, self))
+        return self(self.inverse(iff.v))
 
     def __str__(self):
         return "ℤ_{}".format(self.p)
@@ -128,42 +185,162 @@ class IntField:
     def __ne__(self, other):
         return self.p != other.p
 
+def _trim(cs):
+    while cs and cs[-1] == 0:
+        cs.pop()
+    return cs
+
+def _pack(cs, nbytes):
+    return int.from_bytes(
+        b"".join(c.to_bytes(nbytes, "little") for c in cs),
+        "little")
+
+def _unpack(v, nbytes, count):
+    buf = v.to_bytes(nbytes * count, "little")
+    return [int.from_bytes(buf[i:i+nbytes], "little")
+            for i in range(0, nbytes * count, nbytes)]
+
+def poly_mul(a, b, p):
+    """
+    Multiply the coefficient lists *a* and *b* (ints in ``[0, p)``, lowest
+    degree first) modulo *p*.
+
+    Uses Kronecker substitution: both polynomials are packed into one big
+    integer each, with slots wide enough that no coefficient of the product
+    can overflow into the next, and multiplied by CPython's (Karatsuba)
+    long integer multiplication.
+    """
+    if not a or not b:
+        return []
+    if len(a) == 1 or len(b) == 1:
+        if len(a) != 1:
+            a, b = b, a
+        c = a[0]
+        return [c * v % p for v in b]
+    # each product coefficient is a sum of at most min(len) terms < p²
+    bits = 2 * (p - 1).bit_length() + min(len(a), len(b)).bit_length()
+    nbytes = (bits + 7) // 8
+    product = _pack(a, nbytes) * _pack(b, nbytes)
+    return [c % p for c in _unpack(product, nbytes, len(a) + len(b) - 1)]
+
+def poly_inverse_series(f, k, p, inverse):
+    """
+    Return g with f·g ≡ 1 mod x^k, using Newton iteration. f[0] must be
+    invertible; *inverse* maps a field element to its inverse.
+    """
+    g = [inverse(f[0])]
+    prec = 1
+    while prec < k:
+        prec = min(2 * prec, k)
+        fg = poly_mul(f[:prec], g, p)[:prec]
+        fg += [0] * (prec - len(fg))
+        e = [(-c) % p for c in fg]
+        e[0] = (e[0] + 2) % p
+        g = poly_mul(g, e, p)[:prec]
+    return g
+
+def poly_divmod(a, b, p, inverse, schoolbook_limit=4096):
+    """
+    Divide the (trimmed) coefficient list *a* by *b* modulo *p*. Small
+    divisions use long division with a single inversion of the leading
+    coefficient; large ones compute the quotient from the power series
+    inverse of the reversed divisor, which costs a few multiplications.
+    """
+    n = len(a) - 1
+    m = len(b) - 1
+    k = n - m + 1
+    if k <= 0:
+        return [], list(a)
+
+    if k * m <= schoolbook_limit:
+        r = list(a)
+        q = [0] * k
+        lead_inv = inverse(b[m])
+        for i in range(k - 1, -1, -1):
+            c = r[i + m] * lead_inv % p
+            q[i] = c
+            if c:
+                for j in range(m + 1):
+                    r[i + j] = (r[i + j] - c * b[j]) % p
+        return q, _trim(r[:m])
+
+    ra = a[::-1]
+    rb = b[::-1]
+    q = poly_mul(ra[:k], poly_inverse_series(rb, k, p, inverse), p)[:k]
+    q += [0] * (k - len(q))
+    q.reverse()
+    bq = poly_mul(b, q, p)
+    r = [(x - y) % p for x, y in zip(a[:m], bq[:m])]
+    return q, _trim(r)
+
 class FieldPoly:
+    """
+    Polynomial over the field *field* with the coefficients *cs* (lowest
+    degree first). Coefficients are stored as plain ints in ``[0, p)``.
+    """
+
     def __init__(self, field, cs):
         self.field = field
-        self.cs = list(field(cs))
+        p = field.p
+        self.cs = [int(c) % p for c in cs]
 
     def _compress(self):
-        self.cs = list(itertools.dropwhile(lambda x: x == 0,
-                                           reversed(self.cs)))
-        self.cs.reverse()
-
-    def __divmod__(self, other):
-        field = self.field
-        commonlen = max(len(self.cs), len(other.cs))
+        _trim(self.cs)
 
-        cs_lhs = list(self.cs) + [field(0)] * (commonlen - len(self.cs))
-        cs_rhs = list(other.cs) + [field(0)] * (commonlen - len(other.cs))
+    @property
+    def degree(self):
+        self._compress()
+        return len(self.cs) - 1
+
+    def _test_other(self, other):
+        if other.field != self.field:
+            raise TypeError("Cannot mix polynomials over different fields "
+                            "({} != {})".format(self.field, other.field))
+
+    def _inverse(self, v):
+        return self.field.inverse(v)
+
+    def __add__(self, other):
+        self._test_other(other)
+        p = self.field.p
+        a, b = self.cs, other.cs
+        if len(a) < len(b):
+            a, b = b, a
+        cs = [(x + y) % p for x, y in zip(a, b)] + a[len(b):]
+        return FieldPoly(self.field, cs)
+
+    def __neg__(self):
+        p = self.field.p
+        return FieldPoly(self.field, [(-c) % p for c in self.cs])
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __mul__(self, other):
+        if isinstance(other, int):
+            other = FieldPoly(self.field, [other])
+        self._test_other(other)
+        self._compress()
+        other._compress()
+        return FieldPoly(self.field,
+                         poly_mul(self.cs, other.cs, self.field.p))
 
-        div_cs = [field(0)]*commonlen
+    def __rmul__(self, other):
+        return self * other
 
-        rhs_degree = find_largest_nonzero(cs_rhs)
-        if rhs_degree == -1:
+    def __divmod__(self, other):
+        self._test_other(other)
+        field = self.field
+        a = _trim(list(self.cs))
+        b = _trim(list(other.cs))
+        if not b:
             raise ZeroDivisionError()
 
-        degree = find_largest_nonzero(cs_lhs)
-        if degree < rhs_degree:
-            return FieldPoly(field, (0,)), FieldPoly(self.field, self.cs)
-
-        while degree >= rhs_degree:
-            shift = degree - rhs_degree
-            div_cs[shift] += cs_lhs[degree] // cs_rhs[rhs_degree]
+        if len(a) < len(b):
+            return FieldPoly(field, (0,)), FieldPoly(field, self.cs)
 
-            cs_lhs = listsub(cs_lhs,
-                             [x*div_cs[shift] for x in listshift(cs_rhs, shift)])
-            degree = find_largest_nonzero(cs_lhs)
-
-        return FieldPoly(field, div_cs), FieldPoly(field, cs_lhs)
+        q, r = poly_divmod(a, b, field.p, self._inverse)
+        return FieldPoly(field, q), FieldPoly(field, r)
 
     def __mod__(self, other):
         return divmod(self, other)[1]
@@ -171,6 +348,21 @@ class FieldPoly:
     def __floordiv__(self, other):
         return divmod(self, other)[0]
 
+    def monic(self):
+        self._compress()
+        if not self.cs:
+            return FieldPoly(self.field, [])
+        return self * self._inverse(self.cs[-1])
+
+    def gcd(self, other):
+        """
+        Return the monic greatest common divisor of *self* and *other*.
+        """
+        a, b = self, other
+        while b.degree >= 0:
+            a, b = b, a % b
+        return a.monic()
+
     def __eq__(self, other):
         if self.field != other.field:
             return False
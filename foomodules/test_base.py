@@ -0,0 +1,83 @@
+import threading
+import unittest
+
+from . import Base
+
+
+class FakeXMPP(object):
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, mtype, mbody, mto):
+        self.sent.append(mbody)
+
+
+class BlockingCommand(Base.ArgparseCommand):
+    blocking = True
+
+    def __init__(self, executor):
+        super().__init__("slow", executor=executor)
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def _call(self, msg, args, errorSink=None):
+        self.started.set()
+        self.release.wait(5)
+        self.reply(msg, "done")
+
+
+class Forwarder(Base.PrefixListener):
+    def __init__(self, command):
+        super().__init__("!")
+        self.command = command
+
+    def _prefix_matched(self, msg, contents, errorSink=None):
+        return self.command(msg, contents, errorSink=errorSink)
+
+
+class Recorder(Base.PrefixListener):
+    def __init__(self):
+        super().__init__("!")
+        self.calls = 0
+
+    def _prefix_matched(self, msg, contents, errorSink=None):
+        self.calls += 1
+
+
+class TestBlockingCommand(unittest.TestCase):
+    def setUp(self):
+        self.executor = Base.CommandExecutor(max_workers=1, max_per_user=1)
+        self.xmpp = FakeXMPP()
+        self.command = BlockingCommand(self.executor)
+        self.command.XMPP = self.xmpp
+        self.recorder = Recorder()
+        self.chain = Base.compile_handler_chain([
+            Forwarder(self.command),
+            self.recorder,
+        ])
+
+    def tearDown(self):
+        self.command.release.set()
+        self.executor.shutdown()
+
+    def _dispatch(self, body):
+        msg = {"body": body, "from": "user@example.test", "type": "chat"}
+        for handler in self.chain:
+            if handler(msg):
+                return True
+        return False
+
+    def test_stops_chain(self):
+        self.assertTrue(self._dispatch("!"))
+        self.assertEqual(self.recorder.calls, 0)
+        self.assertTrue(self.command.started.wait(5))
+        self.command.release.set()
+        self.executor.shutdown()
+        self.assertEqual(self.xmpp.sent, ["done"])
+
+    def test_busy(self):
+        self._dispatch("!")
+        self.assertTrue(self.command.started.wait(5))
+        self.assertTrue(self._dispatch("!"))
+        self.assertEqual(self.xmpp.sent, [self.command.busy_message])
+        self.assertEqual(self.recorder.calls, 0)
@@ -0,0 +1,185 @@
+import itertools
+import unittest
+
+from . import Base, Binding, FoorlConfig
+
+
+class Listener(Base.PrefixListener):
+    def __init__(self, prefix, log, abort=False):
+        super().__init__(prefix)
+        self.log = log
+        self.abort = abort
+
+    def _prefix_matched(self, msg, contents, errorSink=None):
+        self.log.append((self.prefix, contents))
+        return self.abort
+
+
+class ContainsListener(Base.PrefixListener):
+    # overrides __call__, so it cannot be folded into a group
+    def __init__(self, word, log):
+        super().__init__(word)
+        self.log = log
+
+    def __call__(self, msg, errorSink=None):
+        if self.prefix in msg["body"]:
+            self.log.append(("contains", self.prefix))
+
+
+class Handler(Base.MessageHandler):
+    def __init__(self, log):
+        super().__init__()
+        self.log = log
+
+    def __call__(self, msg, errorSink=None):
+        self.log.append(("handler", msg["body"]))
+
+
+def run_linear(handlers, msg):
+    for handler in handlers:
+        if handler(msg):
+            return
+
+
+def run_compiled(handlers, msg):
+    for handler in Base.compile_handler_chain(handlers):
+        if handler(msg):
+            return
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_match(self):
+        trie = Base.PrefixTrie()
+        for i, prefix in enumerate(["!ping", "!", "!pingall", "", "!ping"]):
+            trie.add(prefix, i)
+        self.assertEqual(sorted(trie.match("!pingall x")), [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(trie.match("!pin")), [1, 3])
+        self.assertEqual(sorted(trie.match("ping")), [3])
+        self.assertEqual(sorted(trie.match("")), [3])
+
+
+class TestHandlerChain(unittest.TestCase):
+    BODIES = ["", "!", "!p", "!ping", "!ping x", "!pingall", "!pingallx",
+              "!pong", "ping", "hello !ping"]
+
+    SETUPS = [
+        # (prefix, abort) of a plain listener, or an ungroupable class
+        [("!ping", False), ("!pingall", False), ("!", False)],
+        [("!", False), ("!pingall", True), ("!ping", False)],
+        [("!ping", True), ("!pingall", True)],
+        [("!pingall", True), ("!ping", True), ("", False)],
+        [("!ping", False), ContainsListener, ("!pingall", True),
+         Handler, ("!", False), ("!ping", True)],
+    ]
+
+    def _handlers(self, setup, log):
+        handlers = []
+        for item in setup:
+            if item is ContainsListener:
+                handlers.append(ContainsListener("ping", log))
+            elif item is Handler:
+                handlers.append(Handler(log))
+            else:
+                prefix, abort = item
+                handlers.append(Listener(prefix, log, abort=abort))
+        return handlers
+
+    def test_same_routing(self):
+        for setup, body in itertools.product(self.SETUPS, self.BODIES):
+            msg = {"body": body}
+            linear_log, compiled_log = [], []
+            run_linear(self._handlers(setup, linear_log), msg)
+            run_compiled(self._handlers(setup, compiled_log), msg)
+            self.assertEqual(compiled_log, linear_log, (setup, body))
+
+    def test_grouping(self):
+        log = []
+        handlers = self._handlers(self.SETUPS[4], log)
+        chain = Base.compile_handler_chain(handlers)
+        self.assertEqual(
+            [type(handler) for handler in chain],
+            [Base.PrefixListenerGroup, ContainsListener,
+             Base.PrefixListenerGroup, Handler, Base.PrefixListenerGroup])
+        self.assertEqual(chain[4].listeners, handlers[4:])
+
+
+class FakeJID(object):
+    def __init__(self, jid):
+        self.full = jid
+        self.bare = jid.partition("/")[0]
+
+    def __str__(self):
+        return self.full
+
+
+class FakeBind(object):
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+        self.ourJid = None
+
+    def dispatch(self, msg):
+        self.log.append(self.name)
+
+
+class FakeXMPP(object):
+    boundjid = "bot@example.test/foorl"
+
+
+class FakeMUC(object):
+    def getOurJidInRoom(self, room):
+        return room + "/foorl"
+
+
+def lookup_linear(bindings, msg):
+    # the lookup FoorlConfig.dispatch did before routes were compiled
+    mtype = msg["type"]
+    for key in (Binding(msg["from"], mtype=mtype),
+                Binding(msg["from"].bare, mtype=mtype),
+                None):
+        try:
+            return bindings[key]
+        except KeyError:
+            pass
+    return None
+
+
+class TestRoutes(unittest.TestCase):
+    def _config(self, bindings):
+        config = FoorlConfig.__new__(FoorlConfig)
+        config.xmpp = FakeXMPP()
+        config.muc = FakeMUC()
+        config.errorSink = None
+        config.bindings = bindings
+        config.routes = config._compile_routes(bindings)
+        return config
+
+    def test_same_routing(self):
+        log = []
+        full = FakeBind("full", log)
+        bare = FakeBind("bare", log)
+        groupchat = FakeBind("groupchat", log)
+        default = FakeBind("default", log)
+        bindings = {
+            Binding("a@example.test/res"): full,
+            Binding("a@example.test"): bare,
+            Binding("room@muc.example.test", mtype="groupchat"): groupchat,
+        }
+        jids = ["a@example.test/res", "a@example.test/other",
+                "a@example.test", "b@example.test/res",
+                "room@muc.example.test/nick"]
+
+        for with_default in (False, True):
+            if with_default:
+                bindings[None] = default
+            config = self._config(bindings)
+            for jid, mtype in itertools.product(
+                    jids, ["chat", "normal", "groupchat"]):
+                msg = {"from": FakeJID(jid), "type": mtype}
+                del log[:]
+                config.dispatch(msg)
+                expected = lookup_linear(bindings, msg)
+                self.assertEqual(
+                    log,
+                    [expected.name] if expected is not None else [],
+                    (jid, mtype, with_default))
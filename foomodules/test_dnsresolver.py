@@ -0,0 +1,76 @@
+import socket
+import threading
+import unittest
+
+from . import dnsresolver
+
+if dnsresolver.AVAILABLE:
+    import dns.message
+    import dns.rcode
+    import dns.rrset
+
+
+class StubServer(object):
+    def __init__(self, zone):
+        self.zone = zone
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except OSError:
+                return
+            query = dns.message.from_wire(data)
+            question = query.question[0]
+            self.queries.append((question.name.to_text(), question.rdtype))
+            response = dns.message.make_response(query)
+            records = self.zone.get(
+                (question.name.to_text(), question.rdtype))
+            if records is None:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            else:
+                response.answer.append(dns.rrset.from_text_list(
+                    question.name, 300, "IN", question.rdtype, records))
+            self.sock.sendto(response.to_wire(), addr)
+
+    def close(self):
+        self.sock.close()
+
+
+@unittest.skipUnless(dnsresolver.AVAILABLE, "dnspython not installed")
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer({
+            ("example.test.", 1): ["192.0.2.1"],
+            ("example.test.", 28): ["2001:db8::1"],
+            ("example.test.", 15): ["10 mx.example.test."],
+        })
+        self.resolver = dnsresolver.Resolver(
+            nameservers=["127.0.0.1"],
+            port=self.server.port)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_query_many(self):
+        a, aaaa, mx = self.resolver.query_many(
+            "example.test", ["A", "AAAA", "MX"])
+        self.assertEqual([r.text for r in a], ["192.0.2.1"])
+        self.assertEqual([r.text for r in aaaa], ["2001:db8::1"])
+        self.assertEqual([r.text for r in mx], ["10 mx.example.test."])
+        self.assertEqual(a[0].name, "example.test")
+
+    def test_cache(self):
+        self.resolver.query("example.test", "A")
+        self.resolver.query("example.test", "A")
+        self.assertEqual(len(self.server.queries), 1)
+
+    def test_nxdomain(self):
+        with self.assertRaises(dnsresolver.NXDomain):
+            self.resolver.query("missing.test", "A")
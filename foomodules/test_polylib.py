@@ -1,6 +1,33 @@
+import random
 import unittest
 
-from .polylib import IntField, FieldPoly
+from .polylib import IntField, FieldPoly, poly_mul, poly_divmod
+
+def schoolbook_mul(a, b, p):
+    if not a or not b:
+        return []
+    result = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            result[i + j] = (result[i + j] + x * y) % p
+    return result
+
+def schoolbook_divmod(a, b, p):
+    r = list(a)
+    q = [0] * max(len(a) - len(b) + 1, 0)
+    inv = pow(b[-1], p - 2, p)
+    for i in range(len(q) - 1, -1, -1):
+        c = r[i + len(b) - 1] * inv % p
+        q[i] = c
+        for j, y in enumerate(b):
+            r[i + j] = (r[i + j] - c * y) % p
+    r = r[:len(b) - 1]
+    while r and r[-1] == 0:
+        r.pop()
+    return q, r
+
+def random_poly(rng, p, degree):
+    return [rng.randrange(p) for _ in range(degree)] + [rng.randrange(1, p)]
 
 class TestIntField(unittest.TestCase):
     def test_GF5(self):
@@ -34,6 +61,24 @@ class TestIntField(unittest.TestCase):
             field(2)*4,
             3)
 
+    def test_inverse(self):
+        for p in [2, 5, 65537, 2**61-1]:
+            field = IntField(p)
+            for v in {1, p // 2 or 1, p-1}:
+                self.assertEqual(field.inverse(v) * v % p, 1)
+            with self.assertRaises(ValueError):
+                field.inverse(0)
+
+    def test_inverse_table(self):
+        field = IntField(101)
+        field.inverse(3)
+        self.assertIsNone(field._inverse_table)
+        for v in range(1, 101):
+            self.assertEqual(field.inverse(v) * v % 101, 1)
+        self.assertIsNotNone(field._inverse_table)
+        with self.assertRaises(ValueError):
+            field.inverse(0)
+
 class TestFieldPoly(unittest.TestCase):
     def test_compress(self):
         field = IntField(5)
@@ -60,3 +105,70 @@ class TestFieldPoly(unittest.TestCase):
                    FieldPoly(field, [0, 0, 1])),
             (FieldPoly(field, [1, 2]),
              FieldPoly(field, [])))
+
+    def test_mul(self):
+        rng = random.Random(1)
+        for p in [2, 5, 65537, 2**61-1]:
+            for la, lb in [(1, 1), (1, 7), (7, 1), (2, 3), (17, 40),
+                           (100, 100)]:
+                a = random_poly(rng, p, la - 1)
+                b = random_poly(rng, p, lb - 1)
+                self.assertEqual(poly_mul(a, b, p), schoolbook_mul(a, b, p))
+        self.assertEqual(poly_mul([], [1, 2], 5), [])
+
+    def test_divmod_newton(self):
+        rng = random.Random(2)
+        for p in [2, 7, 65537, 2**61-1]:
+            for n, m in [(1, 1), (10, 3), (40, 39), (60, 20), (100, 1)]:
+                a = random_poly(rng, p, n)
+                b = random_poly(rng, p, m)
+                expected = schoolbook_divmod(a, b, p)
+                field = IntField(p)
+                # a limit of 0 forces the power series path
+                self.assertEqual(
+                    poly_divmod(a, b, p, field.inverse, schoolbook_limit=0),
+                    expected)
+                self.assertEqual(
+                    poly_divmod(a, b, p, field.inverse), expected)
+
+    def test_divmod_threshold(self):
+        # quotient length × divisor degree around the default
+        # schoolbook_limit of 4096
+        rng = random.Random(3)
+        p = 65537
+        field = IntField(p)
+        b = random_poly(rng, p, 64)
+        for k in [63, 64, 65]:
+            a = random_poly(rng, p, 64 + k - 1)
+            q, r = divmod(FieldPoly(field, a), FieldPoly(field, b))
+            expected_q, expected_r = schoolbook_divmod(a, b, p)
+            self.assertEqual(q, FieldPoly(field, expected_q))
+            self.assertEqual(r, FieldPoly(field, expected_r))
+
+    def test_monic(self):
+        field = IntField(7)
+        poly = FieldPoly(field, [1, 2, 3])
+        monic = poly.monic()
+        self.assertEqual(monic.cs[-1], 1)
+        self.assertEqual(monic * 3, poly)
+        self.assertEqual(FieldPoly(field, [0, 0]).monic(), FieldPoly(field, []))
+
+    def test_gcd(self):
+        rng = random.Random(4)
+        p = 101
+        field = IntField(p)
+        for _ in range(20):
+            f = FieldPoly(field, random_poly(rng, p, rng.randrange(1, 6)))
+            g = FieldPoly(field, random_poly(rng, p, rng.randrange(0, 8)))
+            h = FieldPoly(field, random_poly(rng, p, rng.randrange(0, 8)))
+            a, b = f * g, f * h
+            # euclid with schoolbook division as the reference
+            x, y = a.cs, b.cs
+            while y:
+                x, y = y, schoolbook_divmod(x, y, p)[1]
+            expected = FieldPoly(field, x).monic()
+            result = a.gcd(b)
+            self.assertEqual(result, expected)
+            self.assertEqual(a % result, FieldPoly(field, []))
+            self.assertEqual(b % result, FieldPoly(field, []))
+            self.assertEqual(a.gcd(f), f.monic())
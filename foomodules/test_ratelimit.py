@@ -0,0 +1,86 @@
+import unittest
+
+from RateLimit import TokenBucketLimiter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # one token every two seconds, bursts of three
+        self.limiter = TokenBucketLimiter(0.5, 3, max_keys=3,
+                                          clock=self.clock)
+
+    def test_burst(self):
+        for _ in range(3):
+            self.assertTrue(self.limiter.consume("a"))
+        self.assertFalse(self.limiter.consume("a"))
+        self.assertEqual(self.limiter.tokens("a"), 0)
+
+    def test_refill(self):
+        for _ in range(3):
+            self.limiter.consume("a")
+        self.clock.t = 1
+        self.assertFalse(self.limiter.consume("a"))
+        self.clock.t = 2
+        self.assertTrue(self.limiter.consume("a"))
+        self.assertFalse(self.limiter.consume("a"))
+
+    def test_refill_capped_at_burst(self):
+        self.limiter.consume("a")
+        self.clock.t = 1000
+        self.assertEqual(self.limiter.tokens("a"), 3)
+
+    def test_rejection_takes_no_tokens(self):
+        self.limiter.consume("a", cost=2)
+        self.assertFalse(self.limiter.consume("a", cost=2))
+        self.assertEqual(self.limiter.tokens("a"), 1)
+        self.assertTrue(self.limiter.consume("a"))
+
+    def test_keys_are_independent(self):
+        for _ in range(3):
+            self.limiter.consume("a")
+        self.assertFalse(self.limiter.consume("a"))
+        self.assertTrue(self.limiter.consume("b"))
+        self.assertEqual(self.limiter.tokens("unknown"), 3)
+
+    def test_lru_eviction(self):
+        for key in "abc":
+            self.limiter.consume(key)
+        # touch a, so that b is the least recently used one
+        self.limiter.consume("a")
+        self.limiter.consume("d")
+        self.assertEqual(len(self.limiter), 3)
+        self.assertEqual(self.limiter.tokens("b"), 3)
+        self.assertEqual(self.limiter.tokens("a"), 1)
+
+    def test_idle_expiry(self):
+        self.limiter.consume("a")
+        self.clock.t = 1
+        self.limiter.consume("b")
+        # a is full again after 6s, b is not yet
+        self.clock.t = 6
+        self.limiter.consume("c")
+        self.assertEqual(len(self.limiter), 2)
+        self.assertNotIn("a", self.limiter._buckets)
+        self.assertIn("b", self.limiter._buckets)
+
+    def test_clear(self):
+        for _ in range(3):
+            self.limiter.consume("a")
+        self.limiter.clear()
+        self.assertEqual(len(self.limiter), 0)
+        self.assertTrue(self.limiter.consume("a"))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            TokenBucketLimiter(0, 1)
+        with self.assertRaises(ValueError):
+            TokenBucketLimiter(1, 0)
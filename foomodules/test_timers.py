@@ -0,0 +1,192 @@
+import unittest
+from datetime import datetime, timedelta
+
+import TimerWheel
+
+from .Timers import EachDay
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class ManualWheel(TimerWheel.TimerWheel):
+    # the tests drive run_pending themselves
+    def _ensure_running(self):
+        pass
+
+
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # level 0 spans 4 ticks, level 1 16 ticks, level 2 64 ticks
+        self.wheel = ManualWheel(resolution=1, slots=4, levels=3,
+                                 clock=self.clock)
+        self.fired = []
+
+    def _record(self, name):
+        self.fired.append((name, self.clock.t))
+
+    def _step_until(self, t):
+        while self.clock.t < t:
+            self.clock.t += 1
+            self.wheel.run_pending()
+
+    def _slots(self, name):
+        return [
+            (level, slot)
+            for level, wheel in enumerate(self.wheel._wheels)
+            for slot, jobs in enumerate(wheel)
+            if any(job.name == name for job in jobs)
+        ]
+
+    def test_placement(self):
+        for first in (2, 10, 40, 100):
+            self.wheel.add_once(first, first, self._record, args=(first,))
+        self.assertEqual(self._slots(2), [(0, 2)])
+        self.assertEqual(self._slots(10), [(1, 2)])
+        self.assertEqual(self._slots(40), [(2, 2)])
+        # beyond the top level: parked in the farthest slot
+        self.assertEqual(self._slots(100), [(2, 3)])
+
+    def test_cascade(self):
+        for first in (2, 10, 40, 100):
+            self.wheel.add_once(first, first, self._record, args=(first,))
+        self._step_until(120)
+        self.assertEqual(self.fired,
+                         [(2, 2), (10, 10), (40, 40), (100, 100)])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_periodic(self):
+        self.wheel.add("job", 3, self._record, args=("job",))
+        self._step_until(10)
+        self.assertEqual(self.fired, [("job", 3), ("job", 6), ("job", 9)])
+        self.assertEqual(self.wheel.stats()["job"].runs, 3)
+
+    def test_runtime_does_not_drift(self):
+        def slow():
+            self.clock.t += 0.5
+
+        job = self.wheel.add("job", 3, slow)
+        self._step_until(3)
+        self.assertEqual(job.base_due, 6)
+        self.assertEqual(job.stats.max_time, 0.5)
+
+    def test_remove(self):
+        self.wheel.add("job", 2, self._record, args=("job",))
+        self.wheel.remove("job")
+        self._step_until(10)
+        self.assertEqual(self.fired, [])
+        self.assertNotIn("job", self.wheel)
+
+    def test_replace(self):
+        self.wheel.add("job", 2, self._record, args=("old",))
+        self.wheel.add("job", 5, self._record, args=("new",))
+        self._step_until(6)
+        self.assertEqual(self.fired, [("new", 5)])
+
+    def test_skip(self):
+        job = self.wheel.add("job", 2, self._record, args=("job",))
+        self.clock.t = 7
+        self.wheel.run_pending()
+        # the run due at 2 starts late; the ones due at 4 and 6 are dropped
+        self.assertEqual(self.fired, [("job", 7)])
+        self.assertEqual(job.stats.runs, 1)
+        self.assertEqual(job.stats.skipped, 2)
+        self.assertEqual(job.stats.max_lateness, 5)
+        self.assertEqual(job.base_due, 8)
+
+        self._step_until(8)
+        self.assertEqual(job.stats.runs, 2)
+        self.assertEqual(job.stats.max_lateness, 5)
+
+    def test_catch_up(self):
+        job = self.wheel.add("job", 2, self._record, args=("job",),
+                             policy=TimerWheel.CATCH_UP)
+        self.clock.t = 7
+        self.wheel.run_pending()
+        self.assertEqual(job.stats.runs, 3)
+        self.assertEqual(job.stats.skipped, 0)
+        self.assertEqual(job.base_due, 8)
+
+    def test_catch_up_limit(self):
+        job = self.wheel.add("job", 2, self._record, args=("job",),
+                             policy=TimerWheel.CATCH_UP, max_catch_up=1)
+        self.clock.t = 7
+        self.wheel.run_pending()
+        self.assertEqual(job.stats.runs, 2)
+        self.assertEqual(job.stats.skipped, 1)
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError()
+
+        job = self.wheel.add("job", 2, fail)
+        with self.assertLogs("TimerWheel", "ERROR"):
+            self._step_until(4)
+        self.assertEqual(job.stats.runs, 2)
+        self.assertEqual(job.stats.failures, 2)
+        self.assertIn("job", self.wheel)
+
+    def test_format_stats(self):
+        def slow():
+            self.clock.t += 0.5
+
+        self.wheel.add("fast", 2, self._record, args=("fast",))
+        self.wheel.add("slow", 2, slow)
+        self._step_until(2)
+        self.assertEqual(
+            TimerWheel.format_stats(self.wheel.stats()),
+            ["slow: 1 runs, 0 failed, 0 skipped, mean 0.500s, max 0.500s, "
+             "max late 0.000s",
+             "fast: 1 runs, 0 failed, 0 skipped, mean 0.000s, max 0.000s, "
+             "max late 0.000s"])
+
+
+class TestEachDay(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = ManualWheel(resolution=60, clock=self.clock)
+        self.calls = []
+
+    def _at(self, offset):
+        at = datetime.utcnow() + offset
+        return (at.hour, at.minute, at.second)
+
+    def _check_trigger(self, at):
+        timer = EachDay(at=at, wheel=self.wheel)
+        now = datetime.utcnow()
+        trigger = timer._calc_next_trigger()
+        self.assertGreater(trigger, now)
+        self.assertLessEqual(trigger - now, timedelta(days=1))
+        self.assertEqual((trigger.hour, trigger.minute, trigger.second), at)
+
+    def test_next_trigger_today(self):
+        self._check_trigger(self._at(timedelta(hours=1)))
+
+    def test_next_trigger_tomorrow(self):
+        self._check_trigger(self._at(timedelta(hours=-1)))
+
+    def test_rearm(self):
+        timer = EachDay(at=self._at(timedelta(hours=1)), wheel=self.wheel,
+                        do=[lambda: self.calls.append(self.clock.t)])
+        timer.XMPP = object()
+        job = self.wheel._jobs[timer._uid]
+        self.assertIsNone(job.interval)
+        self.assertGreater(job.due, 0)
+        self.assertLessEqual(job.due, 86400)
+
+        self.clock.t = job.due + 60
+        self.wheel.run_pending()
+        self.assertEqual(len(self.calls), 1)
+        # re-armed as a new one-shot job from the wall clock
+        rearmed = self.wheel._jobs[timer._uid]
+        self.assertIsNot(rearmed, job)
+        self.assertGreater(rearmed.due, self.clock.t)
+
+        timer.XMPP = None
+        self.assertNotIn(timer._uid, self.wheel)
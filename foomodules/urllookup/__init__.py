@@ -189,7 +189,12 @@ class URLLookup(Base.MessageHandler):
             metadata = self.prepare_metadata(url, response)
             time_taken = datetime.utcnow() - start_time
 
-            for hook in self.pre_hooks:
+            # hooks act on the message the URL was posted in; lookups
+            # without one (e.g. background prefetches) skip them
+            pre_hooks = self.pre_hooks if msg_context is not None else []
+            post_hooks = self.post_hooks if msg_context is not None else []
+
+            for hook in pre_hooks:
                 try:
                     hook(msg_context, metadata)
                 except Exception as err:
@@ -197,7 +202,7 @@ class URLLookup(Base.MessageHandler):
 
             self.fill_metadata(metadata)
 
-            for hook in self.post_hooks:
+            for hook in post_hooks:
                 try:
                     hook(msg_context, metadata)
                 except Exception as err:
@@ -7,13 +7,16 @@ import traceback
 import logging
 import sys
 import os
+import time
 import lcdencode
+import TimerWheel
 import infomodules.utils
 import infomodules.rrdsink
+import infomodules.sensors
 from sleekxmpp.exceptions import IqError, IqTimeout
 from sleekxmpp.xmlstream import ET
-from sleekxmpp import Iq, Message
-from sleekxmpp.xmlstream import register_stanza_plugin, ElementBase, ET, JID
+from sleekxmpp import Message
+from sleekxmpp.xmlstream import JID
 
 xmlns = "http://xmpp.zombofant.net/xmlns/public-transport"
 
@@ -35,35 +38,6 @@ class SafeCallback(object):
         except:
             self._error_handler(*sys.exc_info())
 
-class Departure(ElementBase):
-    namespace = xmlns
-    name = "departure"
-    plugin_attrib = name
-    interfaces = set()
-
-class Data(ElementBase):
-    namespace = xmlns
-    name = "data"
-    plugin_attrib = name
-    interfaces = set()
-
-class DepartureTime(ElementBase):
-    namespace = xmlns
-    name = "dt"
-    plugin_attrib = name
-    interfaces = set(("eta", "destination", "lane"))
-
-    def get_eta(self):
-        return float(self._get_attr("eta"))
-
-    def set_eta(self, value):
-        self._set_attr("eta", "{:d}".format(value))
-
-register_stanza_plugin(Iq, Departure)
-register_stanza_plugin(Departure, Data)
-register_stanza_plugin(Data, DepartureTime, iterable=True)
-
-
 class InfoBot(HubBot):
     longwordmap = {
         "partlycloud": "ptcld",
@@ -72,6 +46,7 @@ class InfoBot(HubBot):
         }
 
     SENSOR_NS = "http://xmpp.sotecware.net/xmlns/sensor"
+    HISTORY_LINES = 20
 
     def __init__(self, config_file):
         self._config_file = config_file
@@ -87,6 +62,7 @@ class InfoBot(HubBot):
         self.notification_to = credentials.get("notify", None)
 
         self.hooks_setup = False
+        self.timers = TimerWheel.get_default_wheel()
 
         super().__init__(
             credentials["localpart"],
@@ -120,7 +96,11 @@ class InfoBot(HubBot):
         self.lcd_resource = namespace["lcd_resource"]
         self.lcd_full = self.lcd + "/" + self.lcd_resource
         self.authorized_jids = frozenset(namespace["authorized_jids"])
-        self._sensors = {}
+        self._sensors = namespace.get("sensors", None)
+        if self._sensors is None:
+            self._sensors = infomodules.sensors.SensorStore()
+        # the LCD only answers sensor queries with the matching firmware
+        self._sensor_query = namespace.get("sensor_query", False)
         self._lcd_away = False
         self._weather_buffer = None
         self._departure_buffers = []
@@ -130,6 +110,17 @@ class InfoBot(HubBot):
         self._weather_timeout = namespace.get(
             "weather_timeout",
             timedelta(seconds=1800))
+        self._departure_push_to = namespace.get(
+            "departure_push_to",
+            "hintd@hub.sotecware.net/devel-c")
+        self._departure_min_interval = namespace.get(
+            "departure_min_interval",
+            timedelta(seconds=10)).total_seconds()
+        self._departure_latest = None
+        self._departure_acked = None
+        self._departure_in_flight = None
+        self._departure_last_push = float("-inf")
+        self._departure_push_scheduled = False
 
         return None
 
@@ -148,8 +139,8 @@ class InfoBot(HubBot):
                        ("+9h", data[9])]
 
             timeline, templine, whichline = "", "", ""
-            for i, (time, forecast) in enumerate(to_show):
-                timeline += "{:5s}  ".format(time)
+            for i, (label, forecast) in enumerate(to_show):
+                timeline += "{:5s}  ".format(label)
 
                 if i == 0 and self._custom_temperature:
                     temp = self._custom_temperature
@@ -175,12 +166,9 @@ class InfoBot(HubBot):
         localnow = datetime.utcnow() + timedelta(seconds=60*60)
         dateline = localnow.strftime("%H:%M") + "  "
 
-        temps = [forecast.temperature for forecast in data
-                 if forecast.temperature is not None]
-        precp = [forecast.precipitation for forecast in data[:12]
-                 if forecast.precipitation is not None]
-        dateline += "<{:+3.0f} >{:+3.0f}".format(max(temps), min(temps))
-        dateline += "  {:2.0f}".format(sum(precp))
+        dateline += "<{:+3.0f} >{:+3.0f}".format(data.max_temperature(),
+                                                 data.min_temperature())
+        dateline += "  {:2.0f}".format(data[:12].total_precipitation())
 
         return dateline+timeline+templine+whichline
 
@@ -190,20 +178,8 @@ class InfoBot(HubBot):
 
     @staticmethod
     def _extract_next_weather(forecast):
-        now = datetime.utcnow()
-        key = infomodules.utils.date_to_key(now)
-
-        if key not in forecast or forecast[key].temperature is None:
-            now += timedelta(seconds=3600)
-            key = infomodules.utils.date_to_key(now)
-
-        data = list(map(
-                forecast.get,
-                map(
-                    infomodules.utils.date_to_key,
-                    (now + timedelta(seconds=3600*i)
-                    for i in range(0,25)))))
-        return data
+        offset = forecast.current_offset(datetime.utcnow())
+        return forecast[offset:offset+25]
 
     def _update_weather(self):
         forecast = self.weather()
@@ -246,59 +222,114 @@ class InfoBot(HubBot):
 #~
         #~ self._update_lcd()
 
+        if departures is None:
+            return
+        self._departure_latest = tuple(
+            (lane, dest, int(remaining_time))
+            for lane, dest, remaining_time in departures)
+        if self._departure_push_scheduled:
+            # coalesced into the already scheduled push
+            return
+
+        delay = self._departure_min_interval - (
+            time.monotonic() - self._departure_last_push)
+        if delay > 0:
+            self._departure_push_scheduled = True
+            self.timers.add_once(
+                "push-departures",
+                delay,
+                SafeCallback(self._push_departures,
+                             error_handler=self._error_handler))
+            return
+        self._push_departures()
+
+    @staticmethod
+    def _departure_payload(departures):
+        departure = ET.Element("{{{}}}departure".format(xmlns))
+        data = ET.SubElement(departure, "{{{}}}data".format(xmlns))
+        for lane, dest, eta in departures:
+            ET.SubElement(data, "{{{}}}dt".format(xmlns), {
+                "eta": "{:d}".format(eta),
+                "destination": dest,
+                "lane": lane,
+            })
+        return departure
+
+    def _push_departures(self):
+        """
+        Send the latest departure data to the departure sink, unless it
+        equals what the sink has acknowledged last or what is currently in
+        flight.
+        """
+        self._departure_push_scheduled = False
+        state = self._departure_latest
+        if state is None or state in (self._departure_acked,
+                                      self._departure_in_flight):
+            return
+
         request = self.Iq()
-        for lane, dest, remaining_time in departures:
-            dt = DepartureTime()
-            dt['eta'] = int(remaining_time)
-            dt['destination'] = dest
-            dt['lane'] = lane
-            request['departure']['data'].append(dt)
-
-        request['to'] = 'hintd@hub.sotecware.net/devel-c'
+        request['to'] = self._departure_push_to
         request['type'] = 'set'
-        request.send(callback=lambda x: None)
+        request.xml.append(self._departure_payload(state))
+
+        def on_response(response):
+            if self._departure_in_flight == state:
+                self._departure_in_flight = None
+            if response['type'] == 'result':
+                self._departure_acked = state
+
+        self._departure_in_flight = state
+        self._departure_last_push = time.monotonic()
+        request.send(callback=on_response)
 
     def _read_sensors(self):
-        if self._lcd_away:
-            return {}
-        return {} # FIXME
+        if self._lcd_away or not self._sensor_query:
+            return
 
         iq = self.make_iq_get(queryxmlns=self.SENSOR_NS, ito=self.lcd_full)
         try:
             result = iq.send(block=True, timeout=10)
         except IqTimeout:
-            return {}
+            return
         except IqError:
-            return {}
+            return
 
         query = result.xml.find("{{{}}}query".format(self.SENSOR_NS))
-        if not query:
-            return {}
+        if query is None:
+            return
 
-        sensors = dict(self._sensors)
         sensor_tag = "{{{}}}sensor".format(self.SENSOR_NS)
+        timestamp = datetime.utcnow()
         for child in query:
             if child.tag != sensor_tag:
                 continue
             value = int(child.get("value")) / 16.0
-            if -40 <= value <= 135:
-                timestamp = datetime.utcnow()
-                sensors.setdefault(child.get("serial"), []).append(
-                    (timestamp, value))
-            else:
-                logging.warning("received possible bogus value from "
-                                "sensor %s: %f",
-                                child.get("serial"),
-                                value)
-        return sensors
+            self._sensors.add(child.get("serial"), timestamp, value)
 
     def _update_sensors(self):
-        self._sensors = self._read_sensors()
+        self._read_sensors()
 
     def _update_output(self):
-        sensors = dict(self._sensors)
-        self._sensors = dict()
-        self._config_update_output(self, sensors)
+        summaries = self._sensors.take_summaries(datetime.utcnow())
+        self._config_update_output(self, summaries)
+
+    def _format_sensor_history(self, serial, minutes):
+        if serial not in self._sensors:
+            return "unknown sensor: {}".format(serial)
+        since = datetime.utcnow() - timedelta(seconds=60*minutes)
+        history = self._sensors.history(serial, since)
+        if not history:
+            return "no readings from {} in the last {} minutes".format(
+                serial, minutes)
+        values = [value for _, value in history]
+        lines = ["{}: {} readings, min {:.1f}, max {:.1f}, "
+                 "mean {:.1f}".format(
+                     serial, len(values), min(values), max(values),
+                     sum(values) / len(values))]
+        lines.extend(
+            "{:%H:%M:%S} {:.2f}".format(timestamp, value)
+            for timestamp, value in history[-self.HISTORY_LINES:])
+        return "\n".join(lines)
 
     @staticmethod
     def _encode_for_lcd(data):
@@ -342,30 +373,28 @@ class InfoBot(HubBot):
     def sessionStart(self, event):
         super().sessionStart(event)
         if not self.hooks_setup:
-            self.scheduler.add(
+            self.timers.add(
                 "update-weather",
                 600.0,
                 SafeCallback(self._update_weather,
                              error_handler=self._error_handler),
-                repeat=True)
-            self.scheduler.add(
+                # spread the load on the weather service a bit
+                jitter=30.0)
+            self.timers.add(
                 "update-sensors",
                 5.0,
                 SafeCallback(self._update_sensors,
-                             error_handler=self._error_handler),
-                repeat=True)
-            self.scheduler.add(
+                             error_handler=self._error_handler))
+            self.timers.add(
                 "update-output",
                 15,
                 SafeCallback(self._update_output,
-                             error_handler=self._error_handler),
-                repeat=True)
+                             error_handler=self._error_handler))
             self.hooks_setup = True
         self.update_all()
 
     def _format_text_weather(self, forecasts, index):
-        precipitation = sum(forecast.precipitation
-                            for forecast in forecasts[:index+1])
+        precipitation = forecasts[:index+1].total_precipitation()
         forecast = forecasts[index]
         if index == 0 and self._custom_temperature is not None:
             T = self._custom_temperature
@@ -414,16 +443,30 @@ class InfoBot(HubBot):
             self.get_weather(msg)
             return
         elif body == "get_sensors":
-            self.reply(msg, repr(self._sensors))
+            self.reply(msg, repr(self._sensors.latest()))
+            return
+        elif body.startswith("sensor_history "):
+            args = body.split()[1:]
+            try:
+                serial = args[0]
+                minutes = int(args[1]) if len(args) > 1 else 10
+            except (IndexError, ValueError):
+                self.reply(msg, "usage: sensor_history SERIAL [MINUTES]")
+                return
+            self.reply(msg, self._format_sensor_history(serial, minutes))
             return
         elif body == "debug":
             self.reply(msg, repr(self._departure_buffers))
             self.reply(msg, repr(self._weather_buffer))
-            self.reply(msg, repr(self._sensors))
+            self.reply(msg, repr(self._sensors.latest()))
             self.reply(
                 msg,
                 "custom temp: {!r}".format(self._custom_temperature))
             return
+        elif body == "timer_stats":
+            lines = TimerWheel.format_stats(self.timers.stats())
+            self.reply(msg, "\n".join(lines) if lines else "no timers")
+            return
         elif body == "force_flush":
             self._update_output()
             return
@@ -439,7 +482,7 @@ class InfoBot(HubBot):
             else:
                 print("lcd went {}".format(pres["type"]))
                 self._lcd_away = True
-                self._sensors = {}
+                self._sensors.clear()
 
     def update_all(self):
         self._update_weather()
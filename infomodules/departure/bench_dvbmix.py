@@ -0,0 +1,95 @@
+"""
+Benchmark :class:`infomodules.departure.dvbmix.Departure` with many stops
+against a local stub server which answers after a fixed latency.
+
+Run with ``python3 -m infomodules.departure.bench_dvbmix [stops]``.
+"""
+import asyncio
+import heapq
+import random
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+from . import dvbmix
+
+LATENCY = 0.05
+DEPARTURES_PER_STOP = 20
+ROUTES = ["3", "7", "8", "61", "63", "66", "85", "E8"]
+
+
+def make_payload(seed):
+    rng = random.Random(seed)
+    rows = [[rng.choice(ROUTES), "Destination {}".format(i),
+             str(rng.randrange(60))]
+            for i in range(DEPARTURES_PER_STOP)]
+    return repr(rows)
+
+
+def start_server():
+    ready = threading.Event()
+    state = {}
+
+    async def handle(request):
+        await asyncio.sleep(LATENCY)
+        return web.Response(text=make_payload(request.query["hst"]),
+                            headers={"ETag": '"static"'})
+
+    def run():
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get("/", handle)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        state["port"] = runner.addresses[0][1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return state["port"]
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(nstops=24):
+    port = start_server()
+    dvbmix.Departure.URL = "http://127.0.0.1:{}/?hst={{}}".format(port)
+    no_filter = dvbmix.StopFilterFunc(lambda route: True)
+    departure = dvbmix.Departure(
+        [("stop{}".format(i), no_filter) for i in range(nstops)])
+
+    cold, data = timed(departure)
+    print("{} stops, {} departures, {:.0f} ms latency".format(
+        nstops, len(data), LATENCY*1000))
+    print("cold fetch:           {:8.1f} ms (sequential: >= {:.0f} ms)".format(
+        cold*1000, nstops*LATENCY*1000))
+    warm, _ = timed(departure, repeat=100)
+    print("cached call:          {:8.3f} ms".format(warm*1000))
+
+    for resource in departure.resources:
+        resource.timestamp -= 2 * resource.stale_age
+    revalidate, _ = timed(departure)
+    print("revalidation (304s):  {:8.1f} ms".format(revalidate*1000))
+
+    blocks = [resource.value for resource in departure.resources]
+    merge, merged = timed(lambda: departure.merge_data(*blocks), repeat=1000)
+    heap, heap_merged = timed(
+        lambda: list(heapq.merge(*blocks, key=departure.ETA_KEY)),
+        repeat=1000)
+    assert [d[2] for d in merged] == [d[2] for d in heap_merged]
+    print("merge sorted runs:    {:8.3f} ms (heapq.merge: {:.3f} ms)".format(
+        merge*1000, heap*1000))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
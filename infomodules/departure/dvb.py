@@ -1,53 +1,41 @@
 import ast
-from datetime import datetime, timedelta
-import socket
+from datetime import timedelta
 import warnings
-import urllib.error
 
-import infomodules.utils
+import infomodules.fetch
 
 class Departure(object):
     URL = "http://widgets.vvo-online.de/abfahrtsmonitor/Abfahrten.do?ort=Dresden&hst={}"
     MAX_AGE = timedelta(seconds=30)
 
     def __init__(self, stop_name, user_agent="Departure/1.0",
-                 debug_memory_use=False):
+                 debug_memory_use=False, fetcher=None):
         self.url = self.URL.format(stop_name)
         self.user_agent = user_agent
-        self.cached_data = None
-        self.cached_timestamp = None
+        self.resource = infomodules.fetch.CachedResource(
+            self.url,
+            self.parse_data,
+            fetcher=fetcher,
+            # sic: the api returns plaintext, but Content-Type: text/html
+            accept="text/html",
+            user_agent=user_agent,
+            max_age=self.MAX_AGE.total_seconds())
         self._debug_memory_use = debug_memory_use
 
+    @property
+    def cached_data(self):
+        return self.resource.value
+
     def parse_data(self, s):
+        if isinstance(s, bytes):
+            s = s.decode()
         struct = ast.literal_eval(s)
         return [(route, dest, (int(time) if len(time) else 0))
                 for route, dest, time
                 in struct]
 
     def get_departure_data(self):
-        try:
-            response, timestamp = infomodules.utils.http_request(
-                self.url,
-                user_agent=self.user_agent,
-                accept="text/html")  # sic: the api returns plaintext, but Content-Type: text/html
-
-            try:
-                contents = response.read().decode()
-            finally:
-                response.close()
-        except socket.timeout as err:
-            if self.cached_timestamp is not None and self.cached_data is not None:
-                if self.cached_timestamp - datetime.utcnow() <= self.MAX_AGE:
-                    return self.cached_data
-            raise
-        except urllib.error.HTTPError as err:
-            if err.code == 304:
-                return self.cached_data
-            raise
-
-        self.cached_data = self.parse_data(contents)
-        self.cached_timestamp = timestamp
-        return self.cached_data
+        return list(self.resource.fetcher.run(self.resource.get()))
 
     def __call__(self):
         if self._debug_memory_use:
@@ -57,7 +45,7 @@ class Departure(object):
         try:
             try:
                 data = self.get_departure_data()
-            except (socket.timeout, urllib.error.URLError, urllib.error.HTTPError) as err:
+            except infomodules.fetch.FetchError as err:
                 warnings.warn(str(err))
                 return None
             data.sort(key=lambda x: x[2])
@@ -0,0 +1,233 @@
+"""
+Asynchronous HTTP fetching for the info sources.
+
+All sources share one :class:`Fetcher`, which runs an asyncio event loop in
+a background thread and keeps a single aiohttp session, so connections to
+the same host are reused. The sources themselves are called synchronously
+from the scheduler thread of the bot and use :meth:`Fetcher.run` to wait for
+their results.
+
+:class:`CachedResource` wraps a single URL: it remembers the validators
+(``ETag`` / ``Last-Modified``) of the last response for conditional GETs and
+serves its cached value while it is being revalidated in the background
+(stale-while-revalidate).
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import aiohttp
+
+logger = logging.getLogger("fetch")
+
+Response = collections.namedtuple(
+    "Response",
+    ["status", "body", "etag", "last_modified"])
+
+
+class FetchError(Exception):
+    pass
+
+
+class Fetcher(object):
+    """
+    Fetch URLs on an event loop running in a background thread. Requests
+    time out after *timeout* seconds; at most *limit_per_host* connections
+    are opened to a single host.
+    """
+
+    def __init__(self, user_agent=None, timeout=3, limit_per_host=4):
+        super().__init__()
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._session = None
+
+    def _require_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="fetch",
+                    daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _require_session(self):
+        if self._session is None or self._session.closed:
+            headers = {}
+            if self.user_agent is not None:
+                headers["User-Agent"] = self.user_agent
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.limit_per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=headers)
+        return self._session
+
+    async def fetch(self, url, accept=None, user_agent=None, etag=None,
+                    last_modified=None):
+        """
+        GET *url*. If *etag* or *last_modified* (a raw header value) are
+        given, the request is conditional and a ``304`` response has a
+        :data:`None` body. Raise :class:`FetchError` on any other failure.
+        """
+        headers = {}
+        if accept is not None:
+            headers["Accept"] = accept
+        if user_agent is not None:
+            headers["User-Agent"] = user_agent
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+        session = self._require_session()
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    body = None
+                elif response.status >= 400:
+                    raise FetchError("{}: HTTP {} {}".format(
+                        url, response.status, response.reason))
+                else:
+                    body = await response.read()
+                return Response(
+                    response.status,
+                    body,
+                    response.headers.get("ETag", etag),
+                    response.headers.get("Last-Modified", last_modified))
+        except aiohttp.ClientError as err:
+            raise FetchError("{}: {}".format(url, err)) from err
+        except asyncio.TimeoutError as err:
+            raise FetchError("{}: timed out".format(url)) from err
+
+    def submit(self, coro):
+        """
+        Schedule *coro* on the event loop and return a
+        :class:`concurrent.futures.Future` for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._require_loop())
+
+    def run(self, coro, timeout=None):
+        """
+        Run *coro* on the event loop and wait for its result. *timeout*
+        defaults to twice the request timeout.
+        """
+        if timeout is None:
+            timeout = 2 * self.timeout
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError as err:
+            future.cancel()
+            raise FetchError("timed out") from err
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._session.close(), loop).result()
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+def get_default_fetcher():
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
+
+
+class CachedResource(object):
+    """
+    A document at *url*, converted with *parse* (which receives the response
+    body as :class:`bytes` and runs in an executor).
+
+    The parsed value is fresh for *max_age* seconds. After that, and for up
+    to *stale_age* seconds, it is still returned while a revalidation runs in
+    the background; it is also returned if revalidation fails. Older values
+    are discarded and :meth:`get` waits for the refresh.
+    """
+
+    def __init__(self, url, parse, fetcher=None, accept=None,
+                 user_agent=None, max_age=60, stale_age=None,
+                 clock=time.monotonic):
+        super().__init__()
+        self.url = url
+        self.parse = parse
+        self.fetcher = fetcher or get_default_fetcher()
+        self.accept = accept
+        self.user_agent = user_agent
+        self.max_age = max_age
+        self.stale_age = stale_age if stale_age is not None else 10*max_age
+        self._clock = clock
+        self.value = None
+        self.timestamp = None
+        self.etag = None
+        self.last_modified = None
+        self._refresh_task = None
+
+    def age(self):
+        if self.timestamp is None:
+            return None
+        return self._clock() - self.timestamp
+
+    async def _refresh(self):
+        response = await self.fetcher.fetch(
+            self.url,
+            accept=self.accept,
+            user_agent=self.user_agent,
+            etag=self.etag if self.value is not None else None,
+            last_modified=(self.last_modified
+                           if self.value is not None else None))
+        if response.status != 304:
+            loop = asyncio.get_event_loop()
+            self.value = await loop.run_in_executor(
+                None, self.parse, response.body)
+        self.etag = response.etag
+        self.last_modified = response.last_modified
+        self.timestamp = self._clock()
+        return self.value
+
+    def _done(self, task):
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("failed to revalidate %s: %s",
+                           self.url, task.exception())
+
+    def refresh(self):
+        """
+        Start a refresh unless one is already running and return its task.
+        """
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+            self._refresh_task.add_done_callback(self._done)
+        return self._refresh_task
+
+    async def get(self):
+        age = self.age()
+        if age is not None and age < self.max_age:
+            return self.value
+
+        task = self.refresh()
+        if age is not None and age < self.stale_age:
+            return self.value
+
+        return await asyncio.shield(task)
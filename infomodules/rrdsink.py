@@ -1,5 +1,12 @@
-import subprocess
+import collections
+import concurrent.futures
 import logging
+import socket
+import subprocess
+import threading
+import time
+
+import BufferedSink
 
 import infomodules.utils as utils
 
@@ -12,8 +19,20 @@ class UnknownRRDToolResponse(RRDToolError):
     pass
 
 class RRDServer(object):
+    """
+    Talk to a ``rrdtool -`` child process.
+
+    Commands are pipelined: :meth:`submit_command` writes the command and
+    returns a :class:`concurrent.futures.Future` right away, and a reader
+    thread resolves the futures in order as the responses come in. Each
+    child process has its own reader and queue of pending futures; when it
+    goes away, its pending futures fail.
+    """
+
     def __init__(self):
         self._rrd = None
+        self._lock = threading.Lock()
+        self._pending = None
 
     def _require_rrd(self):
         if self._rrd is not None:
@@ -29,24 +48,84 @@ class RRDServer(object):
             ["rrdtool", "-"],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE)
+        self._pending = collections.deque()
+        reader = threading.Thread(
+            target=self._read_responses,
+            args=(self._rrd, self._pending),
+            name="rrdtool-reader",
+            daemon=True)
+        reader.start()
 
         return self._rrd
 
-    def send_command(self, cmdbytes):
-        rrd = self._require_rrd()
+    def _read_responses(self, rrd, pending):
+        reason = RRDToolError("rrdtool exited")
+        output = []
+        try:
+            for line in rrd.stdout:
+                line = line.decode("ascii", errors="replace")
+                if line.startswith("OK"):
+                    logger.debug("rrdtool >> %s", line[3:].strip())
+                    result, exc = output, None
+                elif line.startswith("ERROR"):
+                    result, exc = None, RRDToolError(line[6:].strip())
+                else:
+                    output.append(line)
+                    continue
+                output = []
 
-        logging.debug("rrdtool << %s", cmdbytes.decode("ascii"))
+                with self._lock:
+                    try:
+                        future = pending.popleft()
+                    except IndexError:
+                        raise UnknownRRDToolResponse(line) from None
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+        except Exception as err:
+            # the responses cannot be matched to the commands anymore; get
+            # rid of this child, the next command starts a new one
+            logger.error("rrdtool reader failed: %s", err)
+            reason = err
+            rrd.kill()
+        finally:
+            rrd.stdout.close()
+            with self._lock:
+                futures = list(pending)
+                pending.clear()
+            for future in futures:
+                future.set_exception(reason)
 
-        rrd.stdin.write(cmdbytes + b"\n")
-        rrd.stdin.flush()
-        response = rrd.stdout.readline().decode("ascii")
-        logger.debug("rrdtool >> %s", response[3:].strip())
-        if response.startswith("OK"):
-            return
-        elif response.startswith("ERROR"):
-            raise RRDToolError(response[6:])
-        else:
-            raise UnknownRRDToolResponse(response)
+    def submit_command(self, cmdbytes):
+        """
+        Send a command without waiting for its response. The returned
+        future resolves to the output lines of the command or fails with
+        :class:`RRDToolError`.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            rrd = self._require_rrd()
+            logger.debug("rrdtool << %s", cmdbytes.decode("ascii"))
+            self._pending.append(future)
+            try:
+                rrd.stdin.write(cmdbytes + b"\n")
+                rrd.stdin.flush()
+            except OSError as err:
+                self._pending.remove(future)
+                raise RRDToolError(str(err)) from err
+        return future
+
+    def send_command(self, cmdbytes):
+        self.submit_command(cmdbytes).result()
+
+    def close(self):
+        with self._lock:
+            rrd, self._rrd = self._rrd, None
+            self._pending = None
+        if rrd is not None:
+            rrd.stdin.close()
+            rrd.wait()
 
     def update_ds_with_timestamp(self, rrdfile, ds_name, timestamp,
                                  value):
@@ -71,3 +150,200 @@ class RRDServer(object):
             args.append(this_arg)
 
         self.send_command(" ".join(args).encode("ascii"))
+
+
+class RRDCachedClient(object):
+    """
+    Send updates to a running ``rrdcached`` at *address*, either a path to
+    a unix socket or ``(host, port)``.
+
+    The rrdcached protocol has no templates: each update must give the
+    values of all data sources of the file in their order, so *layouts*
+    maps each RRD file to the list of its data source names. Files without
+    a layout cannot be updated through rrdcached.
+    """
+
+    def __init__(self, address, layouts, timeout=10):
+        self.address = address
+        self.layouts = dict(layouts)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+
+    def handles(self, rrdfile):
+        return rrdfile in self.layouts
+
+    def _connect(self):
+        if self._sock is not None:
+            return
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = None
+        self._file = None
+
+    def _read_status(self):
+        line = self._file.readline().decode("ascii", errors="replace")
+        if not line:
+            raise RRDToolError("rrdcached closed the connection")
+        status, _, message = line.partition(" ")
+        return int(status), message.strip()
+
+    def update_batch(self, updates):
+        """
+        Send all *updates*, pairs of an RRD file and a list of rows (which
+        map data source names to values, plus the ``timestamp`` key), in one
+        ``BATCH``. Return the list of error messages of rejected lines.
+        """
+        lines = []
+        for rrdfile, rows in updates:
+            layout = self.layouts[rrdfile]
+            values = " ".join(
+                ":".join([str(row["timestamp"])] +
+                         [str(row.get(ds_name, "U")) for ds_name in layout])
+                for row in rows)
+            lines.append("UPDATE {} {}\n".format(rrdfile, values))
+
+        try:
+            self._connect()
+            self._file.write(b"BATCH\n")
+            self._file.flush()
+            status, message = self._read_status()
+            if status != 0:
+                raise RRDToolError(message)
+            self._file.write("".join(lines).encode("ascii") + b".\n")
+            self._file.flush()
+            nerrors, message = self._read_status()
+            return [self._file.readline().decode("ascii",
+                                                 errors="replace").strip()
+                    for _ in range(nerrors)]
+        except (OSError, ValueError) as err:
+            self._disconnect()
+            raise RRDToolError(str(err)) from err
+
+    def close(self):
+        self._disconnect()
+
+
+class BatchedRRDSink(BufferedSink.BufferedSink):
+    """
+    Buffer RRD updates and write them in batches from a background thread
+    (see :class:`BufferedSink.BufferedSink` for the flush policy).
+
+    Updates are collected per RRD file; values for the same file and
+    timestamp are merged into one row. On each flush, every file is written
+    with as few multi-value ``update`` commands as possible.
+    Commands are pipelined through *server* (an :class:`RRDServer`) without
+    waiting for each response; failures are logged. With *rrdcached* (an
+    :class:`RRDCachedClient`), files it has a layout for are sent there
+    instead.
+
+    :meth:`update_ds_with_timestamp` and :meth:`update_with_timestamps`
+    have the same signatures as on :class:`RRDServer`, so this can be used
+    as a drop-in replacement.
+    """
+
+    def __init__(self, server=None, rrdcached=None,
+                 flush_count=256, flush_interval=60.0):
+        self._own_server = server is None
+        self.server = server if server is not None else RRDServer()
+        self.rrdcached = rrdcached
+
+        # rrdfile -> timestamp -> {ds_name: value}
+        self._buffers = {}
+        # rrdfile -> last timestamp written
+        self._last_written = {}
+
+        super().__init__("rrd", flush_count=flush_count,
+                         flush_interval=flush_interval)
+
+    @staticmethod
+    def _to_timestamp(timestamp):
+        if timestamp is None:
+            return int(time.time())
+        return utils.to_timestamp(timestamp)
+
+    def update(self, rrdfile, timestamp, values):
+        """
+        Buffer *values*, a mapping of data source names to values, for
+        *rrdfile* at *timestamp* (a :class:`~datetime.datetime`, or
+        :data:`None` for now).
+        """
+        self._submit((rrdfile, self._to_timestamp(timestamp), dict(values)))
+
+    def update_ds_with_timestamp(self, rrdfile, ds_name, timestamp,
+                                 value):
+        self.update(rrdfile, timestamp, {ds_name: value})
+
+    def update_with_timestamps(self, rrdfile, data):
+        for ds_name, timestamp, value in data:
+            self.update(rrdfile, timestamp, {ds_name: value})
+
+    def _write(self, item):
+        rrdfile, timestamp, values = item
+        last = self._last_written.get(rrdfile)
+        if last is not None and timestamp <= last:
+            logger.warning("dropping update of %s at %d: already written "
+                           "up to %d", rrdfile, timestamp, last)
+            return
+        rows = self._buffers.setdefault(rrdfile, {})
+        rows.setdefault(timestamp, {}).update(values)
+
+    @staticmethod
+    def _commands(rrdfile, rows):
+        # consecutive rows with the same data sources share one command
+        command = None
+        for timestamp, values in rows:
+            template = ":".join(sorted(values))
+            if command is None or command[0] != template:
+                if command is not None:
+                    yield command[1]
+                command = (template,
+                           ["update", rrdfile, "--template", template, "--"])
+            command[1].append(":".join(
+                [str(timestamp)] +
+                [str(values[ds_name]) for ds_name in sorted(values)]))
+        if command is not None:
+            yield command[1]
+
+    def _log_failure(self, future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("rrdtool update failed: %s", exc)
+
+    def _flush(self):
+        buffers, self._buffers = self._buffers, {}
+        cached_updates = []
+        for rrdfile, rows in buffers.items():
+            rows = sorted(rows.items())
+            self._last_written[rrdfile] = rows[-1][0]
+            if self.rrdcached is not None and self.rrdcached.handles(rrdfile):
+                cached_updates.append(
+                    (rrdfile,
+                     [dict(values, timestamp=timestamp)
+                      for timestamp, values in rows]))
+                continue
+            for args in self._commands(rrdfile, rows):
+                future = self.server.submit_command(
+                    " ".join(args).encode("ascii"))
+                future.add_done_callback(self._log_failure)
+
+        if cached_updates:
+            for error in self.rrdcached.update_batch(cached_updates):
+                logger.error("rrdcached update failed: %s", error)
+
+    def _close(self):
+        if self._own_server:
+            self.server.close()
+        if self.rrdcached is not None:
+            self.rrdcached.close()
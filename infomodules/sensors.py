@@ -0,0 +1,195 @@
+import array
+import collections
+import logging
+import statistics
+from datetime import datetime
+
+import infomodules.utils as utils
+
+logger = logging.getLogger("sensors")
+
+SensorSummary = collections.namedtuple(
+    "SensorSummary",
+    ["timestamp", "min", "max", "mean", "count"])
+
+
+class SensorRing(object):
+    """
+    The last *capacity* readings of a sensor, kept in two fixed-size arrays
+    (UTC unix timestamps and values), plus a running min/max/mean over the
+    readings since the last :meth:`take_summary`.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array.array("d", [0.0]) * capacity
+        self.values = array.array("d", [0.0]) * capacity
+        self._next = 0
+        self._count = 0
+        self._reset_summary()
+
+    def _reset_summary(self):
+        self._sum_min = None
+        self._sum_max = None
+        self._sum_total = 0.0
+        self._sum_count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+        if self._sum_count == 0:
+            self._sum_min = self._sum_max = value
+        else:
+            self._sum_min = min(self._sum_min, value)
+            self._sum_max = max(self._sum_max, value)
+        self._sum_total += value
+        self._sum_count += 1
+
+    def _indices(self):
+        start = (self._next - self._count) % self.capacity
+        for i in range(self._count):
+            yield (start + i) % self.capacity
+
+    def last(self, n):
+        """
+        Return the values of the last *n* readings, oldest first.
+        """
+        n = min(n, self._count)
+        return [self.values[(self._next - n + i) % self.capacity]
+                for i in range(n)]
+
+    def latest(self):
+        i = (self._next - 1) % self.capacity
+        return datetime.utcfromtimestamp(self.timestamps[i]), self.values[i]
+
+    def history(self, since=None):
+        """
+        Return the readings newer than the unix timestamp *since* as list
+        of ``(datetime, value)``, oldest first.
+        """
+        return [(datetime.utcfromtimestamp(self.timestamps[i]),
+                 self.values[i])
+                for i in self._indices()
+                if since is None or self.timestamps[i] > since]
+
+    def take_summary(self, timestamp):
+        """
+        Return a :class:`SensorSummary` of the readings since the last call
+        and start a new interval; :data:`None` if there were none.
+        """
+        if self._sum_count == 0:
+            return None
+        summary = SensorSummary(
+            timestamp,
+            self._sum_min,
+            self._sum_max,
+            self._sum_total / self._sum_count,
+            self._sum_count)
+        self._reset_summary()
+        return summary
+
+
+class SensorStore(object):
+    """
+    Ring buffers of the readings of all sensors, by serial.
+
+    Readings outside of ``[min_value, max_value]`` are dropped. So are
+    readings deviating more than *max_delta* from the median of the last
+    *median_window* readings of a sensor, unless that happens *max_rejects*
+    times in a row, in which case the level is assumed to really have
+    changed.
+    """
+
+    def __init__(self, capacity=720, min_value=-40, max_value=135,
+                 max_delta=5.0, median_window=5, max_rejects=3):
+        super().__init__()
+        self.capacity = capacity
+        self.min_value = min_value
+        self.max_value = max_value
+        self.max_delta = max_delta
+        self.median_window = median_window
+        self.max_rejects = max_rejects
+        self._rings = {}
+        self._rejects = {}
+        self._since_shift = {}
+
+    def __contains__(self, serial):
+        return serial in self._rings
+
+    def __iter__(self):
+        return iter(self._rings)
+
+    def clear(self):
+        self._rings.clear()
+        self._rejects.clear()
+        self._since_shift.clear()
+
+    def _is_outlier(self, serial, ring, value):
+        if not self.min_value <= value <= self.max_value:
+            return True
+        window = min(self.median_window,
+                     self._since_shift.get(serial, self.median_window))
+        recent = ring.last(window)
+        if not recent or abs(value - statistics.median(recent)) <= self.max_delta:
+            self._rejects[serial] = 0
+            return False
+        rejects = self._rejects.get(serial, 0) + 1
+        if rejects >= self.max_rejects:
+            # level shift: judge the following readings by the new level
+            self._rejects[serial] = 0
+            self._since_shift[serial] = 0
+            return False
+        self._rejects[serial] = rejects
+        return True
+
+    def add(self, serial, timestamp, value):
+        """
+        Record *value* of sensor *serial* at *timestamp* (a UTC
+        :class:`~datetime.datetime`). Return :data:`False` if it was
+        rejected as outlier.
+        """
+        try:
+            ring = self._rings[serial]
+        except KeyError:
+            ring = self._rings[serial] = SensorRing(self.capacity)
+        if self._is_outlier(serial, ring, value):
+            logger.warning("received possible bogus value from sensor %s: "
+                           "%f", serial, value)
+            return False
+        ring.append(utils.to_timestamp(timestamp), value)
+        if serial in self._since_shift:
+            self._since_shift[serial] += 1
+            if self._since_shift[serial] >= self.median_window:
+                del self._since_shift[serial]
+        return True
+
+    def latest(self):
+        """
+        Return the last reading of each sensor as ``{serial: (datetime,
+        value)}``.
+        """
+        return {serial: ring.latest()
+                for serial, ring in self._rings.items()
+                if len(ring)}
+
+    def history(self, serial, since=None):
+        return self._rings[serial].history(
+            None if since is None else utils.to_timestamp(since))
+
+    def take_summaries(self, timestamp):
+        """
+        Return a :class:`SensorSummary` per sensor for the readings since
+        the last call, as ``{serial: summary}``.
+        """
+        summaries = {}
+        for serial, ring in self._rings.items():
+            summary = ring.take_summary(timestamp)
+            if summary is not None:
+                summaries[serial] = summary
+        return summaries
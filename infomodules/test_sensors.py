@@ -0,0 +1,96 @@
+import unittest
+from datetime import datetime, timedelta
+
+from .sensors import SensorRing, SensorStore
+
+
+class TestSensorRing(unittest.TestCase):
+    def test_wraparound(self):
+        ring = SensorRing(3)
+        for i in range(5):
+            ring.append(1000 + i, float(i))
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.last(2), [3.0, 4.0])
+        self.assertEqual(ring.last(10), [2.0, 3.0, 4.0])
+        self.assertEqual(
+            [value for _, value in ring.history()],
+            [2.0, 3.0, 4.0])
+        self.assertEqual(
+            [value for _, value in ring.history(since=1002)],
+            [3.0, 4.0])
+        self.assertEqual(ring.latest(),
+                         (datetime.utcfromtimestamp(1004), 4.0))
+
+    def test_take_summary(self):
+        ring = SensorRing(2)
+        self.assertIsNone(ring.take_summary(0))
+        for i, value in enumerate([3.0, 1.0, 5.0]):
+            ring.append(i, value)
+        summary = ring.take_summary(10)
+        self.assertEqual(summary.timestamp, 10)
+        self.assertEqual((summary.min, summary.max, summary.count),
+                         (1.0, 5.0, 3))
+        self.assertAlmostEqual(summary.mean, 3.0)
+        # a new interval starts, the ring keeps its readings
+        self.assertIsNone(ring.take_summary(20))
+        self.assertEqual(len(ring), 2)
+        ring.append(3, 7.0)
+        self.assertEqual(ring.take_summary(30).count, 1)
+
+
+class TestSensorStore(unittest.TestCase):
+    def setUp(self):
+        self.store = SensorStore(capacity=16, max_delta=2.0,
+                                 median_window=3, max_rejects=3)
+        self.t = datetime(2020, 1, 1)
+
+    def add(self, value):
+        self.t += timedelta(seconds=5)
+        return self.store.add("s", self.t, value)
+
+    def values(self):
+        return [value for _, value in self.store.history("s")]
+
+    def test_range(self):
+        self.assertFalse(self.add(-50.0))
+        self.assertFalse(self.add(200.0))
+        self.assertTrue(self.add(20.0))
+
+    def test_spike(self):
+        for value in [20.0, 20.5, 21.0]:
+            self.assertTrue(self.add(value))
+        self.assertFalse(self.add(85.0))
+        self.assertTrue(self.add(21.5))
+        self.assertEqual(self.values(), [20.0, 20.5, 21.0, 21.5])
+
+    def test_level_shift(self):
+        for value in [20.0, 20.0, 20.0]:
+            self.add(value)
+        self.assertFalse(self.add(30.0))
+        self.assertFalse(self.add(30.1))
+        # the third deviating reading in a row is taken as the new level
+        self.assertTrue(self.add(30.2))
+        # and the following ones are judged against it, not the old median
+        self.assertTrue(self.add(30.3))
+        self.assertTrue(self.add(30.1))
+        self.assertFalse(self.add(20.0))
+        self.assertEqual(self.values(), [20.0, 20.0, 20.0, 30.2, 30.3, 30.1])
+
+    def test_rejects_reset(self):
+        for value in [20.0, 20.0, 20.0]:
+            self.add(value)
+        self.assertFalse(self.add(30.0))
+        self.assertFalse(self.add(30.0))
+        self.assertTrue(self.add(20.0))
+        # the count starts over after an accepted reading
+        self.assertFalse(self.add(30.0))
+        self.assertFalse(self.add(30.0))
+
+    def test_take_summaries(self):
+        self.add(20.0)
+        self.add(22.0)
+        self.store.add("t", self.t, 5.0)
+        summaries = self.store.take_summaries(self.t)
+        self.assertEqual(sorted(summaries), ["s", "t"])
+        self.assertEqual(summaries["s"].mean, 21.0)
+        self.assertEqual(self.store.take_summaries(self.t), {})
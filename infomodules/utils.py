@@ -14,17 +14,18 @@ def to_timestamp(datetime):
 def parse_http_date(httpdate):
     return datetime(*eutils.parsedate(httpdate)[:6])
 
-def http_request(url, user_agent=None, accept=None, last_modified=None, headers=dict()):
+def http_request(url, user_agent=None, accept=None, last_modified=None, headers=None):
     use_headers = {}
     if user_agent is not None:
         use_headers["User-Agent"] = user_agent
     if accept is not None:
         use_headers["Accept"] = accept
-    use_headers.update(headers)
+    if headers is not None:
+        use_headers.update(headers)
     if last_modified is not None:
-        headers["If-Modified-Since"] = format_date_time(to_timestamp(last_modified))
+        use_headers["If-Modified-Since"] = format_date_time(to_timestamp(last_modified))
 
-    request = urllib.request.Request(url, headers=headers)
+    request = urllib.request.Request(url, headers=use_headers)
     response = urllib.request.urlopen(request, timeout=3)
     last_modified = response.info().get("Last-Modified", None)
     if last_modified is not None:
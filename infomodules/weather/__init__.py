@@ -1,4 +1,6 @@
 import abc
+import array
+import math
 from datetime import datetime, timedelta
 
 import infomodules.utils
@@ -20,18 +22,108 @@ class Forecast(object):
             self.symbol,
             self.precipitation)
 
+class ForecastSeries(object):
+    """
+    Hourly forecasts for *hours* hours, starting at the hour of *start*.
+
+    The data is kept in columns: :attr:`temperature` and
+    :attr:`precipitation` are float arrays (NaN marks a missing value) and
+    :attr:`symbol_codes` indexes into :attr:`symbol_names` (code 0 is
+    :data:`None`). Slicing returns a series sharing the columns, without
+    copying.
+    """
+
+    STEP = timedelta(hours=1)
+
+    def __init__(self, start, hours):
+        self.start = infomodules.utils.strip_date(start)
+        self.temperature = memoryview(array.array("d", [math.nan]) * hours)
+        self.precipitation = memoryview(array.array("d", [math.nan]) * hours)
+        self.symbol_codes = memoryview(array.array("H", [0]) * hours)
+        self.symbol_names = [None]
+        self._symbol_index = {None: 0}
+
+    def _view(self, offset, stop):
+        view = type(self).__new__(type(self))
+        view.start = self.start + offset * self.STEP
+        view.temperature = self.temperature[offset:stop]
+        view.precipitation = self.precipitation[offset:stop]
+        view.symbol_codes = self.symbol_codes[offset:stop]
+        view.symbol_names = self.symbol_names
+        view._symbol_index = self._symbol_index
+        return view
+
+    def __len__(self):
+        return len(self.temperature)
+
+    def offset(self, date):
+        """
+        Return the index of the hour containing *date*.
+        """
+        return (infomodules.utils.strip_date(date) - self.start) // self.STEP
+
+    def date(self, offset):
+        return self.start + offset * self.STEP
+
+    def current_offset(self, now):
+        """
+        Return the index of the hour of *now*, or of the next hour if there
+        is no temperature for the current one.
+        """
+        offset = self.offset(now)
+        if not 0 <= offset < len(self) or math.isnan(self.temperature[offset]):
+            offset += 1
+        return offset
+
+    def set_symbol(self, offset, name):
+        try:
+            code = self._symbol_index[name]
+        except KeyError:
+            code = len(self.symbol_names)
+            self.symbol_names.append(name)
+            self._symbol_index[name] = code
+        self.symbol_codes[offset] = code
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("ForecastSeries slices must be contiguous")
+            return self._view(start, max(start, stop))
+
+        temperature = self.temperature[index]
+        precipitation = self.precipitation[index]
+        return Forecast(
+            temp=None if math.isnan(temperature) else temperature,
+            prec=None if math.isnan(precipitation) else precipitation,
+            symbol=self.symbol_names[self.symbol_codes[index]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def min_temperature(self):
+        return min((v for v in self.temperature if not math.isnan(v)),
+                   default=None)
+
+    def max_temperature(self):
+        return max((v for v in self.temperature if not math.isnan(v)),
+                   default=None)
+
+    def total_precipitation(self):
+        return math.fsum(v for v in self.precipitation if not math.isnan(v))
+
+    def __repr__(self):
+        return "<ForecastSeries start={} hours={}>".format(
+            self.start, len(self))
+
 class Weather(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def __call__(self):
         """
         Get current forecast data. This may use a cache.
 
-        Return the forecast data in a dictionary of the following
-        format:
-
-            {
-                (year, month, day, hour): <Forecast instance>
-            }
+        Return the forecast data as :class:`ForecastSeries`.
         """
 
     def get_current(self):
@@ -44,14 +136,6 @@ class Weather(metaclass=abc.ABCMeta):
         or in the future).
         """
 
-        forecast = self()
-        now = datetime.utcnow()
-        key = infomodules.utils.date_to_key(now)
-
-        if key not in forecast or forecast[key].temperature is None:
-            now += timedelta(seconds=3600)
-            key = infomodules.utils.date_to_key(now)
-
-        now = datetime(now.year, now.month, now.day, now.hour)
-
-        return (now, forecast[key])
+        series = self()
+        offset = series.current_offset(datetime.utcnow())
+        return (series.date(offset), series[offset])
@@ -1,8 +1,8 @@
-import urllib.error
-import socket
+import io
 import logging
 
 from datetime import datetime, timedelta
+import infomodules.fetch
 import infomodules.utils
 import infomodules.weather
 
@@ -10,11 +10,16 @@ import lxml.etree as ET
 
 logger = logging.getLogger("weather.metno")
 
-Forecast = infomodules.weather.Forecast
+ForecastSeries = infomodules.weather.ForecastSeries
 
 class Weather(infomodules.weather.Weather):
     URL = "http://api.met.no/weatherapi/locationforecast/1.8/?lat={lat}&lon={lon}"
     MAX_AGE = timedelta(seconds=60*30)
+    #: forecasts further in the future than this are not parsed; this matches
+    #: the 25 hours used by the infobot
+    WINDOW = timedelta(hours=25)
+    STEP = timedelta(hours=1)
+    DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
     @staticmethod
     def get_forecast_attr(locnode, attrname, default=None, valuename="value"):
@@ -23,69 +28,95 @@ class Weather(infomodules.weather.Weather):
         except AttributeError:
             return default
 
-    def __init__(self, lat, lon, user_agent="Weather/1.0"):
+    def __init__(self, lat, lon, user_agent="Weather/1.0", fetcher=None):
         self.url = self.URL.format(lat=lat, lon=lon)
         self.user_agent = user_agent
-        self.cached_data = None
-        self.cached_timestamp = None
-
-    def _get_raw_xml(self):
-        response, timestamp = infomodules.utils.http_request(
+        self.resource = infomodules.fetch.CachedResource(
             self.url,
-            user_agent=self.user_agent,
-            accept="application/xml")
-
-        try:
-            contents = response.read().decode()
-            return contents, timestamp
-        finally:
-            response.close()
-
-    def parse_xml(self, tree):
-        forecasts = {}
-        for forecast in tree.xpath("//time[@datatype='forecast' and @from=@to]"):
-            date = datetime.strptime(forecast.get("from"), "%Y-%m-%dT%H:00:00Z")
-            key = infomodules.utils.date_to_key(date)
-
-            locnode = forecast.find("location")
-            data = Forecast()
-            data.temperature = float(self.get_forecast_attr(locnode, "temperature", default=data.temperature))
+            self._parse_body,
+            fetcher=fetcher,
+            accept="application/xml",
+            user_agent=user_agent,
+            max_age=self.MAX_AGE.total_seconds())
+        # cached data must still cover the window while it is served
+        self.window = self.WINDOW + timedelta(
+            seconds=self.resource.stale_age)
+
+    @property
+    def cached_data(self):
+        return self.resource.value
+
+    def _parse_body(self, body):
+        return self.parse(io.BytesIO(body))
 
-            forecasts[key] = data
-
-        for integrated in tree.xpath("//time[@datatype='forecast' and @from!=@to]"):
-            date = datetime.strptime(integrated.get("from"), "%Y-%m-%dT%H:00:00Z")
-            date2 = datetime.strptime(integrated.get("to"), "%Y-%m-%dT%H:00:00Z")
-            if date2 - date > timedelta(seconds=3600):
-                continue
-            key = infomodules.utils.date_to_key(date)
-
-            locnode = integrated.find("location")
-            data = forecasts.setdefault(key, Forecast())
-            data.precipitation = float(self.get_forecast_attr(locnode, "precipitation", default=data.precipitation))
-            data.symbol = self.get_forecast_attr(locnode, "symbol", default=data.symbol, valuename="id")
-
-        return forecasts
+    @staticmethod
+    def _parse_date(s):
+        # fixed format: YYYY-MM-DDTHH:MM:SSZ
+        return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                        int(s[11:13]))
+
+    def parse(self, source, now=None):
+        """
+        Parse the forecast document from the file-like *source* into a
+        :class:`~infomodules.weather.ForecastSeries` in a single streaming
+        pass. Only hourly forecasts between the current hour
+        (or the hour of *now*) and :attr:`WINDOW` after it, extended by the
+        time the result may be served from the cache, are kept; every
+        element is discarded once it has been processed.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        start = infomodules.utils.strip_date(now)
+        end = start + self.window
+
+        # the timestamps sort lexicographically, so the window check does
+        # not need to parse them
+        start_str = start.strftime(self.DATE_FORMAT)
+        end_str = end.strftime(self.DATE_FORMAT)
+
+        series = ForecastSeries(start, self.window // self.STEP + 1)
+        for _, node in ET.iterparse(source, events=("end",), tag="time"):
+            from_str = node.get("from", "")
+            if (node.get("datatype") == "forecast"
+                    and start_str <= from_str <= end_str):
+                date_from = self._parse_date(from_str)
+                date_to = self._parse_date(node.get("to"))
+                locnode = node.find("location")
+                if (date_to - date_from <= self.STEP
+                        and locnode is not None):
+                    offset = series.offset(date_from)
+                    if date_from == date_to:
+                        temperature = self.get_forecast_attr(
+                            locnode, "temperature")
+                        if temperature is not None:
+                            series.temperature[offset] = float(temperature)
+                    else:
+                        precipitation = self.get_forecast_attr(
+                            locnode, "precipitation")
+                        if precipitation is not None:
+                            series.precipitation[offset] = float(
+                                precipitation)
+                        symbol = self.get_forecast_attr(
+                            locnode, "symbol", valuename="id")
+                        if symbol is not None:
+                            series.set_symbol(offset, symbol)
+
+            # drop the processed element and everything before it, so that
+            # the tree does not grow with the document
+            node.clear()
+            parent = node.getparent()
+            if parent is not None:
+                while node.getprevious() is not None:
+                    del parent[0]
+
+        return series
 
     def get_data(self):
-        try:
-            xml, timestamp = self._get_raw_xml()
-        except urllib.error.HTTPError as err:
-            if err.code == 304:
-                return self.cached_data
-            raise
-        except socket.timeout as err:
-            return self.cached_data
-        except urllib.error.URLError as err:
-            return self.cached_data
-
-        self.cached_data = self.parse_xml(ET.ElementTree(ET.fromstring(xml)))
-        self.cached_timestamp = timestamp
-        return self.cached_data
+        return self.resource.fetcher.run(self.resource.get())
 
     def __call__(self):
         try:
             return self.get_data()
-        except (socket.timeout, urllib.error.URLError, urllib.error.HTTPError) as err:
+        except infomodules.fetch.FetchError as err:
             logger.warn(err)
             return None
@@ -6,21 +6,37 @@ import codecs
 _overline_x = 'x̅'
 _inverse = '⁻¹'
 
+# the code points of x̅ and ⁻¹ except the last; the incremental encoder holds
+# these back at the end of its input, as the sequence might be incomplete
+_sequence_prefixes = (_overline_x[:-1], _inverse[:-1])
+
 class Codec(codecs.Codec):
     @staticmethod
     def pre_encode(input):
-        return input.replace(_overline_x, "\ue001").replace(_inverse, "\ue0000")
+        return input.replace(_overline_x, "\ue001").replace(_inverse, "\ue000")
 
     @staticmethod
     def post_decode(input):
-        return input.replace("\ue001", _overline_x).replace("\ue0000", _inverse)
+        return input.replace("\ue001", _overline_x).replace("\ue000", _inverse)
 
     def encode(self,input,errors='strict'):
         return codecs.charmap_encode(self.pre_encode(input),errors,encoding_map)
 
     def decode(self,input,errors='strict'):
         output = self.post_decode(codecs.charmap_decode(input,errors,decoding_table)[0])
-        return output, len(output)
+        return output, len(input)
+
+class IncrementalEncoder(codecs.BufferedIncrementalEncoder):
+    def _buffer_encode(self, input, errors, final):
+        consumed = len(input)
+        if not final and input.endswith(_sequence_prefixes):
+            consumed -= 1
+        output, _ = Codec().encode(input[:consumed], errors)
+        return output, consumed
+
+class IncrementalDecoder(codecs.IncrementalDecoder):
+    def decode(self, input, final=False):
+        return Codec().decode(input, self.errors)[0]
 
 class StreamWriter(Codec,codecs.StreamWriter):
     pass
@@ -35,8 +51,8 @@ def getregentry():
         name='hd44780a00',
         encode=Codec().encode,
         decode=Codec().decode,
-        incrementalencoder=None,
-        incrementaldecoder=None,
+        incrementalencoder=IncrementalEncoder,
+        incrementaldecoder=IncrementalDecoder,
         streamwriter=StreamWriter,
         streamreader=StreamReader,
     )
@@ -1,12 +1,102 @@
 #!/usr/bin/python2
 import sympy
 import socket
+import collections
 import io
+import math
+import resource
 import sympy.physics.units as u
 import sympy.core.sympify
 
 import SympyComm
 
+def limit_cpu(seconds):
+    # RLIMIT_CPU counts the whole lifetime of the process; move the soft
+    # limit so that it allows *seconds* more for the next request. The
+    # process is killed by SIGXCPU when it runs over.
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(math.ceil(usage.ru_utime + usage.ru_stime))
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def limit_memory(nbytes):
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        nbytes = min(nbytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (nbytes, hard))
+
+def normalize(s):
+    return " ".join(s.split())
+
+class Calculator(object):
+    """
+    Evaluate expressions, keeping an LRU cache of the last *cache_size*
+    results and of sympified units, keyed on whitespace-normalized input.
+    """
+
+    def __init__(self, cache_size=256):
+        self.cache_size = cache_size
+        self.one = sympy.sympify("1")
+        self._results = collections.OrderedDict()
+        self._units = collections.OrderedDict()
+
+    def _cache_get(self, cache, key):
+        value = cache.pop(key)
+        cache[key] = value
+        return value
+
+    def _cache_put(self, cache, key, value):
+        cache[key] = value
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _sympify_unit(self, unit):
+        try:
+            return self._cache_get(self._units, unit)
+        except KeyError:
+            pass
+        value = sympy.sympify(unit, locals=u.__dict__)
+        self._cache_put(self._units, unit, value)
+        return value
+
+    def _evaluate(self, unit, expr):
+        try:
+            unit = self._sympify_unit(unit)
+        except Exception as err:
+            return False, "could not sympify unit: {}".format(str(err)).encode("utf-8")
+        try:
+            expr = sympy.sympify(expr, locals=u.__dict__)
+        except Exception as err:
+            return False, "could not sympify expression: {}".format(str(err)).encode("utf-8")
+
+        result = expr
+        uresult = result
+        if unit != self.one:
+            try:
+                uresult = expr / unit
+            except Exception as err:
+                return False, b"during evaluation: "+str(err).encode("utf-8")
+        try:
+            return True, str(float(uresult)).encode("ascii")
+        except ValueError as err:
+            return True, str(result).encode("ascii")
+        except Exception as err:
+            return False, str(err).encode("utf-8")
+
+    def __call__(self, unit, expr):
+        key = normalize(unit), normalize(expr)
+        try:
+            return self._cache_get(self._results, key)
+        except KeyError:
+            pass
+        result = self._evaluate(*key)
+        if self.cache_size > 0:
+            self._cache_put(self._results, key, result)
+        return result
+
 if __name__ == "__main__":
     import sys
     import argparse
@@ -16,40 +106,60 @@ if __name__ == "__main__":
         type=int,
         help="File descriptor to listen for expressions on"
     )
+    parser.add_argument(
+        "--cpu-limit",
+        type=int,
+        default=None,
+        metavar="SECONDS",
+        help="CPU time allowed per calculation"
+    )
+    parser.add_argument(
+        "--protocol",
+        type=int,
+        choices=[1, 2],
+        default=1,
+        help="Protocol version to speak on the socket"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        help="Number of results to keep in the cache"
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help="Address space limit for the process"
+    )
 
     args = parser.parse_args()
 
     sock = socket.fromfd(args.fd, socket.AF_UNIX, socket.SOCK_STREAM)
 
-    one = sympy.sympify("1")
     u.i = sympy.sqrt(-1)
+    calculator = Calculator(args.cache_size)
+    if args.memory_limit is not None:
+        limit_memory(args.memory_limit)
+    SympyComm.send_ready(sock)
     try:
         while True:
-            unit, expr = SympyComm.recv_calc(sock)
-            try:
-                unit = sympy.sympify(unit, locals=u.__dict__)
-            except Exception as err:
-                SympyComm.send_error(sock, "could not sympify unit: {}".format(str(err)).encode("utf-8"))
-                continue
-            try:
-                expr = sympy.sympify(expr, locals=u.__dict__)
-            except Exception as err:
-                SympyComm.send_error(sock, "could not sympify expression: {}".format(str(err)).encode("utf-8"))
-                continue
-
-            result = expr
-            uresult = result
-            if unit != one:
-                try:
-                    uresult = expr / unit
-                except Exception as err:
-                    SympyComm.send_error(sock, b"during evaluation: "+str(err).encode("utf-8"))
-            try:
-                SympyComm.send_result(sock, str(float(uresult)).encode("ascii"))
-            except ValueError as err:
-                SympyComm.send_result(sock, str(result).encode("ascii"))
-            except Exception as err:
-                SympyComm.send_error(sock, str(err).encode("utf-8"))
+            if args.protocol == 2:
+                request_id, unit, expr = SympyComm.recv_calc_v2(sock)
+            else:
+                unit, expr = SympyComm.recv_calc(sock)
+            if args.cpu_limit is not None:
+                limit_cpu(args.cpu_limit)
+
+            state, text = calculator(unit.decode("utf-8"), expr.decode("utf-8"))
+
+            if args.protocol == 2:
+                SympyComm.send_result_v2(sock, request_id, state, text)
+            elif state:
+                SympyComm.send_result(sock, text)
+            else:
+                SympyComm.send_error(sock, text)
     finally:
         sock.shutdown(socket.SHUT_RDWR)
         sock.close()